@@ -1,20 +1,48 @@
 import streamlit as st
 import hashlib
+import io
 import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from collections import deque
+from collections.abc import Mapping
+from contextlib import contextmanager
+from functools import partial
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
 import warnings
 import ssl
+import os
+import re
+import json
+import time
+import threading
+import sqlite3
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score, roc_curve
 import pickle
 
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:
+    add_script_run_ctx = get_script_run_ctx = None
+
 # =============================================================================
 # 1. CONFIGURAÇÕES INICIAIS
 # =============================================================================
@@ -376,14 +404,120 @@ IMPALA_HOST = 'bdaworkernode02.sef.sc.gov.br'
 IMPALA_PORT = 21050
 DATABASE = 'teste'
 
+def _secao_secrets(secao):
+    """Seção do secrets.toml, ou {} se o arquivo não existir (ex.: backend local)."""
+    try:
+        return st.secrets.get(secao, {})
+    except Exception:
+        return {}
+
 # Credenciais
-IMPALA_USER = st.secrets.get("impala_credentials", {}).get("user", "tsevero")
-IMPALA_PASSWORD = st.secrets.get("impala_credentials", {}).get("password", "")
+IMPALA_USER = _secao_secrets("impala_credentials").get("user", "tsevero")
+IMPALA_PASSWORD = _secao_secrets("impala_credentials").get("password", "")
+
+def _config(nome, padrao):
+    """Lê uma opção de [fisca] em secrets.toml ou da variável de ambiente FISCA_<NOME>."""
+    valor = _secao_secrets("fisca").get(nome, os.environ.get(f"FISCA_{nome.upper()}"))
+    if valor is None:
+        return padrao
+    if isinstance(padrao, bool):
+        return str(valor).strip().lower() in ('1', 'true', 'sim')
+    return type(padrao)(valor)
+
+# 'impala' (produção), 'duckdb' ou 'sqlite' (banco local, ver seção 4.4)
+BACKEND_SQL = _config('backend_sql', 'impala')
+DIRETORIO_BANCO_LOCAL = _config(
+    'banco_local',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.fisca_local')
+)
+# Arquivos locais (snapshot, métricas) separados por backend
+SUFIXO_BACKEND = '' if BACKEND_SQL == 'impala' else f'_{BACKEND_SQL}'
+
+# Pool de conexões: o handshake LDAP+SSL é caro, então as conexões são
+# reaproveitadas, testadas antes do uso (pre-ping) e recicladas antes de o
+# servidor derrubá-las por ociosidade.
+# Limite de consultas simultâneas enviadas ao cluster Impala por carregador
+MAX_CONSULTAS_PARALELAS = 4
+# Pior caso de conexões em uso no processo: carregar_setores roda até
+# MAX_CONSULTAS_PARALELAS setores, cada um com um grafo de até
+# MAX_CONSULTAS_PARALELAS nós, enquanto a carga do sistema e o renovador usam
+# outras MAX_CONSULTAS_PARALELAS cada
+CONEXOES_PIOR_CASO = MAX_CONSULTAS_PARALELAS * (MAX_CONSULTAS_PARALELAS + 2)
+POOL_TAMANHO = _config('pool_tamanho', 5)
+# Nunca abaixo do padrão do SQLAlchemy (15)
+POOL_OVERFLOW = _config('pool_overflow', max(CONEXOES_PIOR_CASO - POOL_TAMANHO, 15))
+POOL_TIMEOUT = _config('pool_timeout', 30)
+POOL_RECICLAR = _config('pool_reciclar', 1800)
+POOL_PRE_PING = _config('pool_pre_ping', True)
+POOL_AQUECIMENTO = _config('pool_aquecimento', 2)
+
+@st.cache_resource
+def _estatisticas_pool():
+    """Amostras de espera por conexão e de handshake, compartilhadas pelo processo."""
+    return {
+        'trava': threading.Lock(),
+        'local': threading.local(),
+        'esperas': deque(maxlen=1000),
+        'handshakes': deque(maxlen=200),
+        'invalidacoes': 0
+    }
+
+class PoolInstrumentado(QueuePool):
+    """QueuePool que mede a espera por uma conexão livre (sem contar o handshake)."""
+    
+    def _do_get(self):
+        estatisticas = _estatisticas_pool()
+        estatisticas['local'].handshake = 0.0
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            espera = time.perf_counter() - inicio - estatisticas['local'].handshake
+            with estatisticas['trava']:
+                estatisticas['esperas'].append(max(espera, 0.0))
+
+def _instrumentar_engine(engine):
+    """Mede handshakes e conta conexões invalidadas (ex.: pre-ping falhou)."""
+    estatisticas = _estatisticas_pool()
+    
+    @event.listens_for(engine, 'do_connect')
+    def _conectar(dialect, conn_rec, cargs, cparams):
+        inicio = time.perf_counter()
+        conexao = dialect.connect(*cargs, **cparams)
+        segundos = time.perf_counter() - inicio
+        estatisticas['local'].handshake = getattr(estatisticas['local'], 'handshake', 0.0) + segundos
+        with estatisticas['trava']:
+            estatisticas['handshakes'].append(segundos)
+        registrar_metrica('conexao_impala', 'miss', segundos)
+        return conexao
+    
+    @event.listens_for(engine, 'invalidate')
+    def _invalidada(conexao, conn_rec, excecao):
+        with estatisticas['trava']:
+            estatisticas['invalidacoes'] += 1
+
+def _aquecer_pool(engine, quantidade):
+    """Abre conexões e as devolve ao pool, para a primeira consulta não pagar o handshake."""
+    conexoes = []
+    try:
+        for _ in range(quantidade):
+            conexoes.append(engine.raw_connection())
+    except Exception:
+        pass
+    finally:
+        for conexao in conexoes:
+            conexao.close()
 
 @st.cache_resource
 def get_impala_engine():
-    """Cria engine de conexão Impala."""
+    """Cria engine de conexão Impala com pool gerenciado e instrumentado.
+    
+    Com backend_sql = 'duckdb' ou 'sqlite', devolve o engine do banco local.
+    """
     try:
+        if BACKEND_SQL != 'impala':
+            return criar_engine_local()
+        
         engine = create_engine(
             f'impala://{IMPALA_HOST}:{IMPALA_PORT}/{DATABASE}',
             connect_args={
@@ -391,729 +525,3503 @@ def get_impala_engine():
                 'password': IMPALA_PASSWORD,
                 'auth_mechanism': 'LDAP',
                 'use_ssl': True
-            }
+            },
+            poolclass=PoolInstrumentado,
+            pool_size=POOL_TAMANHO,
+            max_overflow=POOL_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+            pool_recycle=POOL_RECICLAR,
+            pool_pre_ping=POOL_PRE_PING
         )
+        _instrumentar_engine(engine)
+        
+        # Aquecimento em segundo plano: não atrasa a primeira renderização
+        if POOL_AQUECIMENTO:
+            threading.Thread(
+                target=_aquecer_pool,
+                args=(engine, min(POOL_AQUECIMENTO, POOL_TAMANHO)),
+                name='fisca-aquecimento',
+                daemon=True
+            ).start()
         return engine
     except Exception as e:
         st.sidebar.error(f"❌ Erro na conexão: {str(e)[:100]}")
         return None
 
+def metricas_pool(engine):
+    """Estado do pool e estatísticas de espera e handshake."""
+    pool = engine.pool
+    estatisticas = _estatisticas_pool()
+    with estatisticas['trava']:
+        esperas = list(estatisticas['esperas'])
+        handshakes = list(estatisticas['handshakes'])
+        invalidacoes = estatisticas['invalidacoes']
+    
+    def _percentil(valores, q):
+        return float(np.percentile(valores, q)) if valores else None
+    
+    return {
+        'tamanho': pool.size() if hasattr(pool, 'size') else None,
+        'em_uso': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+        'ociosas': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+        # QueuePool conta o overflow a partir de -pool_size
+        'overflow': max(pool.overflow(), 0) if hasattr(pool, 'overflow') else None,
+        'espera_p50_ms': _percentil(esperas, 50) * 1000 if esperas else None,
+        'espera_p95_ms': _percentil(esperas, 95) * 1000 if esperas else None,
+        'espera_max_ms': max(esperas) * 1000 if esperas else None,
+        'handshakes': len(handshakes),
+        'handshake_p50_s': _percentil(handshakes, 50),
+        'handshake_max_s': max(handshakes) if handshakes else None,
+        'invalidacoes': invalidacoes
+    }
+
 # =============================================================================
-# 5. FUNÇÕES DE CARREGAMENTO DE DADOS (ESTRATÉGIA HÍBRIDA)
+# 4.1. LEITURA DE RESULTADOS (ARROW)
 # =============================================================================
 
-@st.cache_data(ttl=3600)
-def carregar_dados_sistema(_engine):
-    """Carrega dados agregados do sistema - ESTRATÉGIA RÁPIDA."""
-    dados = {}
-    
-    if _engine is None:
-        return {}
-    
-    # Testar conexão
+# 'arrow': lotes do cursor viram RecordBatches; 'pandas': pd.read_sql (caminho original)
+FETCH_BACKEND = _config('fetch_backend', 'arrow' if pa is not None else 'pandas')
+TAMANHO_LOTE_ARROW = _config('tamanho_lote_arrow', 50000)
+
+# Tipos do cursor Impala -> Arrow (os demais são inferidos a partir dos valores)
+TIPOS_ARROW_IMPALA = {
+    'BOOLEAN': 'bool_',
+    'TINYINT': 'int8',
+    'SMALLINT': 'int16',
+    'INT': 'int32',
+    'BIGINT': 'int64',
+    'FLOAT': 'float32',
+    'DOUBLE': 'float64',
+    'DECIMAL': 'float64',
+    'STRING': 'string',
+    'VARCHAR': 'string',
+    'CHAR': 'string',
+    'TIMESTAMP': 'timestamp',
+    'DATE': 'date32'
+}
+
+def _tipo_arrow(type_code):
+    """Tipo Arrow para o type_code do cursor, ou None para inferir."""
+    nome = TIPOS_ARROW_IMPALA.get(str(type_code).upper())
+    if nome is None:
+        return None
+    return pa.timestamp('us') if nome == 'timestamp' else getattr(pa, nome)()
+
+def _array_arrow(valores, tipo):
+    """Monta a coluna Arrow no tipo do cursor; se os valores não couberem, infere e converte."""
     try:
-        with _engine.connect() as conn:
-            st.sidebar.success("✅ Conexão Impala OK!")
+        return pa.array(valores, type=tipo, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        coluna = pa.array(valores, from_pandas=True)
+        try:
+            return coluna.cast(tipo) if tipo is not None else coluna
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            return coluna
+
+# Prazo (prazo_s do registro) e cancelamento cooperativo: a cada
+# INTERVALO_CANCELAMENTO a leitura verifica se o prazo venceu ou se `cancelar()`
+# pede a interrupção (ex.: o usuário mudou de página e o rerun que pediu a
+# consulta foi superado). Nesse caso a operação é encerrada no servidor, em vez
+# de o Impala terminar uma consulta cujo resultado seria descartado.
+INTERVALO_CANCELAMENTO = 0.5
+# Início do campo `erro` no histórico de métricas para consultas interrompidas
+PREFIXO_CANCELADA = 'cancelada'
+
+class ConsultaCancelada(BaseException):
+    """Consulta interrompida porque a execução do script que a pediu foi superada.
+    
+    Deriva de BaseException, como o StopException do Streamlit, para atravessar
+    os `except Exception` dos carregadores sem virar um resultado vazio em cache.
+    """
+
+class PrazoConsultaExcedido(Exception):
+    """Consulta interrompida por exceder o prazo_s do registro."""
+
+class ConsultaCanceladaNoServidor(Exception):
+    """Consulta assíncrona que terminou cancelada no Impala sem ter sido cancelada aqui."""
+
+class ConsultaFalhouNoServidor(Exception):
+    """Consulta assíncrona que terminou em ERROR_STATE no Impala (mensagem = log do servidor)."""
+
+# O rerun pendente só é visível no atributo privado `_state` do ScriptRequests
+# do Streamlit. A leitura só é usada nas versões conferidas e se o atributo
+# ainda tiver o formato esperado; fora disso o cancelamento fica desligado e a
+# sidebar avisa (ver main), em vez de parar de funcionar sem aviso.
+VERSOES_STREAMLIT_CANCELAMENTO = ((1, 38), (1, 65))
+
+def _verificar_sonda_rerun():
+    """Motivo pelo qual o rerun pendente não pode ser detectado, ou None se pode."""
+    versao = tuple(int(parte) for parte in re.findall(r'\d+', st.__version__)[:2])
+    minima, maxima = VERSOES_STREAMLIT_CANCELAMENTO
+    if not minima <= versao <= maxima:
+        return f"Streamlit {st.__version__} fora das versões conferidas ({minima[0]}.{minima[1]} a {maxima[0]}.{maxima[1]})"
+    try:
+        from streamlit.runtime.scriptrunner_utils.script_requests import ScriptRequests, ScriptRequestType
+        estado = getattr(ScriptRequests(), '_state', None)
     except Exception as e:
-        st.sidebar.error(f"❌ Falha na conexão: {str(e)[:100]}")
-        return {}
-    
-    # Configuração de tabelas
-    tabelas_config = {
-        # ========== DASHBOARD EXECUTIVO (AGREGADO) ==========
-        'dashboard_executivo': {
-            'query': f"SELECT * FROM {DATABASE}.fisca_dashboard_executivo ORDER BY ano DESC",
-            'tipo': 'completo'
-        },
-        
-        # ========== ANÁLISE DE ESTADOS ==========
-        'analise_estados': {
-            'query': f"""
-                SELECT 
-                    estado_documento,
-                    status_normalizado,
-                    eh_valida,
-                    eh_regularizada_sem_nf,
-                    COUNT(*) AS qtd,
-                    SUM(gerou_notificacao) AS com_nf,
-                    SUM(valor_total) AS valor_total,
-                    ROUND(AVG(valor_total), 2) AS valor_medio
-                FROM {DATABASE}.fisca_infracoes_base
-                WHERE ano_infracao >= 2020
-                GROUP BY estado_documento, status_normalizado, eh_valida, eh_regularizada_sem_nf
-                ORDER BY qtd DESC
-            """,
-            'tipo': 'completo'
-        },
-        
-        # ========== RESUMO DE CONVERSÕES POR ANO ==========
-        'resumo_conversoes': {
-            'query': f"""
-                SELECT 
-                    ano_infracao AS ano,
-                    COUNT(*) AS total_infracoes,
-                    SUM(eh_valida) AS infracoes_validas,
-                    SUM(CASE WHEN eh_valida = 0 THEN 1 ELSE 0 END) AS canceladas,
-                    SUM(CASE WHEN eh_valida = 1 AND gerou_notificacao = 1 THEN 1 ELSE 0 END) AS com_nf,
-                    SUM(eh_regularizada_sem_nf) AS regularizadas_sem_nf,
-                    ROUND(
-                        SUM(CASE WHEN eh_valida = 1 AND gerou_notificacao = 1 THEN 1 ELSE 0 END) * 100.0 
-                        / NULLIF(SUM(eh_valida), 0),
-                        2
-                    ) AS taxa_conversao_formal,
-                    ROUND(
-                        (SUM(CASE WHEN eh_valida = 1 AND gerou_notificacao = 1 THEN 1 ELSE 0 END) 
-                         + SUM(eh_regularizada_sem_nf)) * 100.0 
-                        / NULLIF(SUM(eh_valida), 0),
-                        2
-                    ) AS taxa_efetividade_fiscal
-                FROM {DATABASE}.fisca_infracoes_base
-                WHERE ano_infracao >= 2020
-                GROUP BY ano_infracao
-                ORDER BY ano_infracao DESC
-            """,
-            'tipo': 'completo'
-        },
-        
-        # ========== MÉTRICAS POR GERÊNCIA (AGREGADO) ==========
-        'metricas_gerencia': {
-            'query': f"SELECT * FROM {DATABASE}.fisca_metricas_por_gerencia ORDER BY ano DESC, qtd_fiscalizacoes DESC",
-            'tipo': 'completo'
-        },
-        
-        # ========== MÉTRICAS POR GES (NOVO) ==========
-        'metricas_ges': {
-            'query': f"""
-                SELECT * FROM {DATABASE}.fisca_metricas_por_ges 
-                ORDER BY ano DESC, qtd_fiscalizacoes DESC
-            """,
-            'tipo': 'completo'
-        },
-        
-        # ========== DISTRIBUIÇÃO DE EMPRESAS POR GES (NOVO) ==========
-        'distribuicao_empresas_ges': {
-            'query': f"""
-                SELECT 
-                    nm_ges,
-                    COUNT(*) AS qtd_empresas,
-                    ROUND(COUNT(*) * 100.0 / SUM(COUNT(*)) OVER(), 2) AS percentual
-                FROM {DATABASE}.fisca_empresas_base
-                WHERE nm_ges IS NOT NULL
-                    AND nm_ges LIKE 'GES%'
-                GROUP BY nm_ges
-                ORDER BY qtd_empresas DESC
-            """,
-            'tipo': 'completo'
-        },
-        
-        # ========== MÉTRICAS POR CNAE (AGREGADO) ==========
-        'metricas_cnae': {
-            'query': f"SELECT * FROM {DATABASE}.fisca_metricas_por_cnae ORDER BY ano DESC, qtd_fiscalizacoes DESC LIMIT 500",
-            'tipo': 'completo'
-        },
-        
-        # ========== MÉTRICAS POR MUNICÍPIO (AGREGADO) ==========
-        'metricas_municipio': {
-            'query': f"SELECT * FROM {DATABASE}.fisca_metricas_por_municipio ORDER BY ano DESC, qtd_fiscalizacoes DESC LIMIT 500",
-            'tipo': 'completo'
-        },
-        
-        # ========== RANKING DE INFRAÇÕES (CORRIGIDO - SEM FILTROS) ==========
-        'ranking_infracoes': {
-            'query': f"""
-                SELECT * FROM {DATABASE}.fisca_ranking_infracoes 
-                ORDER BY ano DESC, qtd_ocorrencias DESC
-            """,
-            'tipo': 'completo'
-        },
-        
-        # ========== MÉTRICAS POR AFRE (AGREGADO) ==========
-        'metricas_afre': {
-            'query': f"""
-                SELECT * FROM {DATABASE}.fisca_metricas_por_afre 
-                WHERE ano >= YEAR(CURRENT_DATE()) - 3
-                ORDER BY ano DESC, qtd_nfs DESC
-            """,
-            'tipo': 'completo'
-        },
-        
-        # ========== CADASTRO DE AFRES ==========
-        'cadastro_afres': {
-            'query': f"SELECT * FROM {DATABASE}.fisca_afres_cadastro",
-            'tipo': 'completo'
-        },
-        
-        # ========== CATÁLOGO DE INFRAÇÕES ==========
-        'catalogo_infracoes': {
-            'query': f"SELECT * FROM {DATABASE}.fisca_catalogo_infracoes",
-            'tipo': 'completo'
-        },
-        
-        # ========== EMPRESAS BASE - RESUMO (apenas CNPJs para seleção) ==========
-        'empresas_resumo': {
-            'query': f"""
-                SELECT DISTINCT cnpj, nm_razao_social, municipio, regime_tributario
-                FROM {DATABASE}.fisca_empresas_base
-                ORDER BY nm_razao_social
-                LIMIT 10000
-            """,
-            'tipo': 'resumo'
-        },
-        
-        # ========== SCORES DE EFETIVIDADE - RESUMO ==========
-        'scores_resumo': {
-            'query': f"""
-                SELECT 
-                    classificacao_efetividade,
-                    COUNT(*) as qtd,
-                    ROUND(AVG(score_efetividade_final), 2) as score_medio,
-                    ROUND(AVG(valor_total_infracao), 2) as valor_medio
-                FROM {DATABASE}.fisca_scores_efetividade
-                GROUP BY classificacao_efetividade
-            """,
-            'tipo': 'agregacao'
-        },
-        
-        # ========== FISCALIZAÇÕES CONSOLIDADAS - APENAS ESTATÍSTICAS ==========
-        'fiscalizacoes_stats': {
-            'query': f"""
-                SELECT 
-                    COUNT(DISTINCT id_documento) as total_fiscalizacoes,
-                    COUNT(DISTINCT identificador) as total_empresas,
-                    SUM(gerou_notificacao) as total_nfs,
-                    SUM(CASE WHEN gerou_notificacao = 1 THEN 1 ELSE 0 END) as fiscalizacoes_com_nf,
-                    SUM(ciclo_completo) as total_ciclos_completos,
-                    ROUND(AVG(valor_total_infracao), 2) as valor_medio_infracao,
-                    ROUND(AVG(dias_infracao_ate_nf), 0) as media_dias_ate_nf,
-                    SUM(eh_valida) as fiscalizacoes_validas,
-                    SUM(CASE WHEN eh_valida = 0 THEN 1 ELSE 0 END) as fiscalizacoes_canceladas,
-                    SUM(eh_regularizada_sem_nf) as fiscalizacoes_regularizadas_sem_nf
-                FROM {DATABASE}.fisca_fiscalizacoes_consolidadas
-            """,
-            'tipo': 'agregacao'
-        }
-    }
-    
-    progress_bar = st.sidebar.progress(0)
-    status_text = st.sidebar.empty()
-    
-    total = len(tabelas_config)
-    
-    for idx, (key, config) in enumerate(tabelas_config.items()):
+        return f"ScriptRequests indisponível: {str(e)[:80]}"
+    if estado is not ScriptRequestType.CONTINUE:
+        return "ScriptRequests não expõe mais o estado do rerun"
+    return None
+
+MOTIVO_SEM_CANCELAMENTO = _verificar_sonda_rerun()
+
+def execucao_superada(ctx):
+    """True se a execução do script de `ctx` já tem um rerun ou stop pendente."""
+    if MOTIVO_SEM_CANCELAMENTO is not None:
+        return False
+    estado = getattr(getattr(ctx, 'script_requests', None), '_state', None)
+    return estado is not None and estado.name != 'CONTINUE'
+
+def _interrupcao(inicio, prazo_s, cancelar):
+    """Exceção a levantar se a consulta deve parar agora, ou None."""
+    if prazo_s and time.perf_counter() - inicio > prazo_s:
+        return PrazoConsultaExcedido(f"prazo de {prazo_s}s excedido")
+    motivo = cancelar() if cancelar is not None else None
+    return ConsultaCancelada(motivo) if motivo else None
+
+def _log_servidor(cursor):
+    """Fim do log da operação no Impala (get_log), com a mensagem de erro; '' se indisponível."""
+    try:
+        return (cursor.get_log() or '').strip()[-2000:]
+    except Exception:
+        return ''
+
+def _executar_cursor(conexao, cursor, query, inicio, prazo_s=None, cancelar=None):
+    """cursor.execute com prazo e cancelamento cooperativo.
+    
+    No Impala (impyla) a consulta roda assíncrona e é cancelada no servidor
+    com cancel_operation(); EXEC_TIME_LIMIT_S faz o Impala respeitar o prazo
+    mesmo se este processo morrer. Nos backends locais, uma thread vigia chama
+    interrupt() da conexão (sqlite3/duckdb).
+    """
+    if hasattr(cursor, 'execute_async'):
+        configuracao = {'EXEC_TIME_LIMIT_S': str(int(prazo_s))} if prazo_s else None
+        cursor.execute_async(query, configuration=configuracao)
+        while cursor.is_executing():
+            interrupcao = _interrupcao(inicio, prazo_s, cancelar)
+            if interrupcao is not None:
+                cursor.cancel_operation()
+                raise interrupcao
+            time.sleep(INTERVALO_CANCELAMENTO)
+        # is_executing() só diz que parou: o estado final diz como. O prazo
+        # vencido no Impala (EXEC_TIME_LIMIT_S) é classificado como
+        # PrazoConsultaExcedido, igual ao prazo daqui
+        estado = cursor.status()
+        if estado == 'ERROR_STATE':
+            erro = ConsultaFalhouNoServidor(_log_servidor(cursor) or f"consulta terminou em {estado}")
+            interrupcao = _interrupcao(inicio, prazo_s, None)
+            if interrupcao is not None:
+                raise interrupcao from erro
+            raise erro
+        if estado == 'CANCELED_STATE':
+            raise ConsultaCanceladaNoServidor(f"consulta terminou em {estado}")
+        return
+
+    interromper = getattr(getattr(conexao, 'dbapi_connection', conexao), 'interrupt', None)
+    if interromper is None or (not prazo_s and cancelar is None):
+        cursor.execute(query)
+        return
+
+    encerrada = threading.Event()
+    interrupcoes = []
+
+    def vigiar():
+        while not encerrada.wait(INTERVALO_CANCELAMENTO):
+            interrupcao = _interrupcao(inicio, prazo_s, cancelar)
+            if interrupcao is not None:
+                interrupcoes.append(interrupcao)
+                interromper()
+                return
+
+    vigia = threading.Thread(target=vigiar, daemon=True)
+    vigia.start()
+    try:
+        cursor.execute(query)
+    except Exception:
+        if interrupcoes:
+            raise interrupcoes[0] from None
+        raise
+    finally:
+        encerrada.set()
+        vigia.join()
+    if interrupcoes:
+        raise interrupcoes[0]
+
+def _ler_sql_arrow(query, _engine, medicao=None, prazo_s=None, cancelar=None):
+    """Busca o resultado em lotes grandes e monta RecordBatches Arrow direto do cursor.
+    
+    Não é zero-copy: o cursor DB-API entrega cada lote como tuplas Python, que
+    são transpostas em colunas e convertidas em arrays Arrow tipados. O ganho
+    sobre o pd.read_sql está em montar cada coluna de uma vez, no tipo do
+    cursor, e na conversão final para pandas. fetchcolumnar() do impyla não é
+    usado porque busca o resultado inteiro de uma vez, sem lotes, sem o tempo
+    até a primeira linha e sem ponto de cancelamento entre lotes.
+    
+    Se `medicao` for um dict, recebe 'primeira_linha_s' (tempo até o primeiro lote).
+    Com `prazo_s`/`cancelar`, a consulta pode ser interrompida (ver _executar_cursor).
+    """
+    inicio = time.perf_counter()
+    conexao = _engine.raw_connection()
+    try:
+        cursor = conexao.cursor()
         try:
-            query = config['query']
-            tipo = config['tipo']
+            cursor.arraysize = TAMANHO_LOTE_ARROW
+            _executar_cursor(conexao, cursor, query, inicio, prazo_s, cancelar)
+            colunas = [d[0] for d in cursor.description]
+            tipos = [_tipo_arrow(d[1]) for d in cursor.description]
             
-            status_text.text(f"📥 Carregando {key} ({tipo})...")
-            progress_bar.progress((idx + 1) / total)
-            
-            # Executar query
-            df = pd.read_sql(query, _engine)
-            df.columns = [col.lower() for col in df.columns]
-            
-            # Converter tipos numéricos
-            for col in df.select_dtypes(include=['object']).columns:
-                try:
-                    df[col] = pd.to_numeric(df[col], errors='ignore')
-                except:
-                    pass
-            
-            dados[key] = df
-            
-            # Log do tamanho carregado
-            mem_mb = df.memory_usage(deep=True).sum() / 1024 / 1024
-            status_text.text(f"✅ {key}: {len(df):,} registros ({mem_mb:.1f} MB)")
-            
-        except Exception as e:
-            st.sidebar.warning(f"⚠️ Erro em {key}: {str(e)[:80]}")
-            dados[key] = pd.DataFrame()
-    
-    progress_bar.empty()
-    status_text.empty()
-    
-    # Resumo do carregamento
-    total_registros = sum(len(df) for df in dados.values() if not df.empty)
-    total_mem = sum(df.memory_usage(deep=True).sum() / 1024 / 1024 for df in dados.values() if not df.empty)
-    
-    st.sidebar.success(f"✅ {total_registros:,} registros ({total_mem:.1f} MB)")
-    
-    return dados
+            lotes = []
+            while True:
+                linhas = cursor.fetchmany(TAMANHO_LOTE_ARROW)
+                if medicao is not None and 'primeira_linha_s' not in medicao:
+                    medicao['primeira_linha_s'] = time.perf_counter() - inicio
+                if not linhas:
+                    break
+                interrupcao = _interrupcao(inicio, prazo_s, cancelar)
+                if interrupcao is not None:
+                    raise interrupcao
+                valores = list(zip(*linhas))
+                lotes.append(pa.Table.from_arrays(
+                    [_array_arrow(v, t) for v, t in zip(valores, tipos)],
+                    names=colunas
+                ))
+        finally:
+            cursor.close()
+    finally:
+        conexao.close()
+    
+    if not lotes:
+        return pd.DataFrame(columns=colunas)
+    
+    # Colunas inferidas podem variar entre lotes (ex.: lote todo nulo)
+    tabela = pa.concat_tables(lotes, promote_options='default') if len(lotes) > 1 else lotes[0]
+    return tabela.to_pandas(split_blocks=True, self_destruct=True)
+
+def ler_sql(query, _engine, medicao=None, prazo_s=None, cancelar=None):
+    """Executa a consulta pelo backend de leitura configurado em FETCH_BACKEND.
+    
+    Se `medicao` for um dict, recebe o backend usado e, no Arrow, o tempo até
+    a primeira linha (o pandas só devolve o resultado completo). Prazo e
+    cancelamento só valem no Arrow, que controla o cursor.
+    """
+    query = traduzir_sql(query)
+    if FETCH_BACKEND == 'arrow' and pa is not None:
+        if medicao is not None:
+            medicao['backend'] = 'arrow'
+        return _ler_sql_arrow(query, _engine, medicao, prazo_s, cancelar)
+    if medicao is not None:
+        medicao['backend'] = 'pandas'
+    return pd.read_sql(query, _engine)
+
+def benchmark_fetch(_engine, consultas, repeticoes=1):
+    """Compara linhas/segundo dos backends 'pandas' e 'arrow' nas consultas informadas."""
+    backends = {'pandas': lambda q: pd.read_sql(traduzir_sql(q), _engine)}
+    if pa is not None:
+        backends['arrow'] = lambda q: _ler_sql_arrow(traduzir_sql(q), _engine)
+    
+    resultados = []
+    for nome, query in consultas.items():
+        for backend, ler in backends.items():
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                df = ler(query)
+                segundos = time.perf_counter() - inicio
+                resultados.append({
+                    'consulta': nome,
+                    'backend': backend,
+                    'linhas': len(df),
+                    'segundos': segundos,
+                    'linhas_por_segundo': len(df) / segundos if segundos > 0 else 0.0
+                })
+    
+    return pd.DataFrame(resultados)
 
 # =============================================================================
-# 6. FUNÇÕES DE CARREGAMENTO SOB DEMANDA
+# 4.2. REGISTRO DE CONSULTAS
 # =============================================================================
 
-@st.cache_data(ttl=1800)
-def carregar_empresa_detalhada(_engine, cnpj):
-    """Carrega dados completos de uma empresa específica - SOB DEMANDA."""
-    try:
-        query = f"""
-            SELECT * 
-            FROM {DATABASE}.fisca_empresas_base
-            WHERE cnpj = '{cnpj}'
-        """
-        df = pd.read_sql(query, _engine)
-        df.columns = [col.lower() for col in df.columns]
-        return df
-    except Exception as e:
-        st.error(f"Erro ao carregar empresa: {str(e)[:100]}")
-        return pd.DataFrame()
+# O SQL das consultas fica em consultas.json, no espírito das consultas salvas
+# em FISCA.json. Cada entrada define SQL, parâmetros, TTL, prioridade de carga,
+# orçamento de linhas e dependências; ajustes de cache e ordem de carga não
+# exigem mexer nas páginas.
+ARQUIVO_CONSULTAS = _config(
+    'arquivo_consultas',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'consultas.json')
+)
 
-@st.cache_data(ttl=1800)
-def carregar_fiscalizacoes_empresa(_engine, cnpj):
-    """Carrega fiscalizações de uma empresa - SOB DEMANDA."""
-    try:
-        query = f"""
-            SELECT * 
-            FROM {DATABASE}.fisca_fiscalizacoes_consolidadas
-            WHERE cnpj = '{cnpj}'
-            ORDER BY data_infracao DESC
-        """
-        df = pd.read_sql(query, _engine)
-        df.columns = [col.lower() for col in df.columns]
-        return df
-    except Exception as e:
-        st.error(f"Erro ao carregar fiscalizações: {str(e)[:100]}")
-        return pd.DataFrame()
+CAMPOS_CONSULTA = {'grupo', 'descricao', 'parametros', 'ttl', 'prioridade',
+                   'orcamento_linhas', 'prazo_s', 'dependencias', 'sql'}
+TIPOS_PARAMETRO = ('texto', 'inteiro', 'lista_texto', 'lista_inteiro')
+# Consultas do grupo 'sistema' declaram também o tipo da tabela (TABELAS_CONFIG)
+TIPOS_TABELA_SISTEMA = ('completo', 'resumo', 'agregacao')
+
+CAMPOS_SUBCONSULTA = {'descricao', 'parametros', 'sql'}
+
+def _validar_sql(nome, definicao):
+    """Junta o SQL em lista de linhas e confere tipos e marcadores dos parâmetros."""
+    # SQL pode vir como lista de linhas, para legibilidade no JSON
+    if isinstance(definicao['sql'], list):
+        definicao['sql'] = '\n'.join(definicao['sql'])
+    
+    for parametro, tipo in definicao['parametros'].items():
+        if tipo not in TIPOS_PARAMETRO:
+            raise ValueError(f"Consulta '{nome}': tipo '{tipo}' inválido para '{parametro}'")
+    
+    marcadores = set(re.findall(r'\{(\w+)\}', definicao['sql'])) - {'database'}
+    if marcadores != set(definicao['parametros']):
+        raise ValueError(f"Consulta '{nome}': parâmetros declarados não batem com o SQL")
+
+def carregar_registro(caminho):
+    """Lê e valida o registro de consultas. Definições inválidas falham na inicialização."""
+    with open(caminho, encoding='utf-8') as f:
+        consultas = json.load(f)['consultas']
+    
+    for nome, consulta in consultas.items():
+        ausentes = CAMPOS_CONSULTA - set(consulta)
+        if ausentes:
+            raise ValueError(f"Consulta '{nome}': campos ausentes {sorted(ausentes)}")
+        
+        if not isinstance(consulta['prazo_s'], int) or consulta['prazo_s'] <= 0:
+            raise ValueError(f"Consulta '{nome}': prazo_s deve ser um inteiro positivo")
+        
+        if consulta['grupo'] == 'sistema':
+            if 'tipo' not in consulta:
+                raise ValueError(f"Consulta '{nome}': campos ausentes ['tipo']")
+            if consulta['tipo'] not in TIPOS_TABELA_SISTEMA:
+                raise ValueError(f"Consulta '{nome}': tipo de tabela '{consulta['tipo']}' inválido")
+        
+        for dependencia in consulta['dependencias']:
+            if dependencia not in consultas:
+                raise ValueError(f"Consulta '{nome}': dependência desconhecida '{dependencia}'")
+        
+        _validar_sql(nome, consulta)
+    
+    return consultas
+
+def carregar_subconsultas(caminho):
+    """Lê e valida as subconsultas do registro (conjuntos de chaves para semi-join)."""
+    with open(caminho, encoding='utf-8') as f:
+        subconsultas = json.load(f).get('subconsultas', {})
+    
+    for nome, subconsulta in subconsultas.items():
+        ausentes = CAMPOS_SUBCONSULTA - set(subconsulta)
+        if ausentes:
+            raise ValueError(f"Subconsulta '{nome}': campos ausentes {sorted(ausentes)}")
+        _validar_sql(nome, subconsulta)
+    
+    return subconsultas
+
+REGISTRO_CONSULTAS = carregar_registro(ARQUIVO_CONSULTAS)
+REGISTRO_SUBCONSULTAS = carregar_subconsultas(ARQUIVO_CONSULTAS)
+
+class SubConsulta:
+    """Subconsulta já montada; como valor de lista_texto, vira IN (SELECT ...) no servidor."""
+    
+    def __init__(self, sql):
+        self.sql = sql
+
+def _literal_sql(valor):
+    """Texto como literal SQL do Impala (aspas e barras escapadas)."""
+    return "'" + str(valor).replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+def _formatar_parametro(valor, tipo):
+    """Valor de parâmetro já formatado para o SQL."""
+    if isinstance(valor, SubConsulta):
+        if tipo != 'lista_texto':
+            raise ValueError(f"Subconsulta só substitui parâmetros lista_texto (recebido '{tipo}')")
+        return valor.sql
+    if tipo == 'inteiro':
+        return str(int(valor))
+    if tipo == 'texto':
+        return _literal_sql(valor)
+    if tipo == 'lista_inteiro':
+        return ', '.join(str(int(v)) for v in valor) or 'NULL'
+    # lista_texto: lista vazia vira IN (NULL), que não casa com nenhuma linha
+    return ', '.join(_literal_sql(v) for v in valor) or 'NULL'
+
+def montar_consulta(nome, **parametros):
+    """SQL final de uma consulta do registro."""
+    consulta = REGISTRO_CONSULTAS[nome]
+    ausentes = set(consulta['parametros']) - set(parametros)
+    if ausentes:
+        raise ValueError(f"Consulta '{nome}': parâmetros ausentes {sorted(ausentes)}")
+    
+    valores = {
+        parametro: _formatar_parametro(parametros[parametro], tipo)
+        for parametro, tipo in consulta['parametros'].items()
+    }
+    return consulta['sql'].format(database=DATABASE, **valores)
+
+def montar_subconsulta(nome, **parametros):
+    """Subconsulta do registro pronta para entrar no lugar de uma lista_texto."""
+    subconsulta = REGISTRO_SUBCONSULTAS[nome]
+    ausentes = set(subconsulta['parametros']) - set(parametros)
+    if ausentes:
+        raise ValueError(f"Subconsulta '{nome}': parâmetros ausentes {sorted(ausentes)}")
+    
+    valores = {
+        parametro: _formatar_parametro(parametros[parametro], tipo)
+        for parametro, tipo in subconsulta['parametros'].items()
+    }
+    return SubConsulta(subconsulta['sql'].format(database=DATABASE, **valores))
 
-@st.cache_data(ttl=1800)
-def carregar_afres_fiscalizacao(_engine, id_documento):
-    """Carrega AFREs de uma fiscalização - SOB DEMANDA."""
-    try:
-        query = f"""
-            SELECT apd.*, ac.nome_afre, ac.cargo
-            FROM {DATABASE}.fisca_afres_por_documento apd
-            LEFT JOIN {DATABASE}.fisca_afres_cadastro ac
-                ON apd.matricula_afre = ac.matricula_afre
-            WHERE apd.id_documento = '{id_documento}'
-            ORDER BY apd.percentual_participacao DESC
-        """
-        df = pd.read_sql(query, _engine)
-        df.columns = [col.lower() for col in df.columns]
+@st.cache_resource
+def _execucoes_consultas():
+    """Última execução de cada consulta do registro (linhas x orçamento)."""
+    return {'trava': threading.Lock(), 'ultimas': {}}
+
+def executar_consulta(_engine, nome, versao=None, **parametros):
+    """Executor único das consultas do registro: monta o SQL, lê e normaliza colunas.
+    
+    Cada execução, com sucesso ou erro, é gravada no histórico de métricas.
+    Com `versao` (ver versao_consulta), o resultado passa pelo cache em disco
+    compartilhado entre processos (seção 4.5). A consulta respeita o prazo_s do
+    registro e, chamada de uma sessão, é cancelada se o rerun dela for superado.
+    """
+    inicio = time.perf_counter()
+    query = montar_consulta(nome, **parametros)
+    chave = chave_resultado(query, versao) if versao is not None else None
+    if chave is not None:
+        df = ler_resultado_disco(chave, nome)
+        if df is not None:
+            registrar_metrica(nome, 'disco', time.perf_counter() - inicio, linhas=len(df),
+                              bytes_=int(df.memory_usage(deep=True).sum()))
+            return df
+
+    if modo_degradado():
+        # Disjuntor aberto: último resultado conhecido, de qualquer versão
+        recente = ler_resultado_disco_recente(query)
+        if recente is None:
+            raise BackendIndisponivel("backend indisponível (modo degradado) e sem resultado anterior em cache")
+        df = recente[0]
+        registrar_metrica(nome, 'degradado', time.perf_counter() - inicio, linhas=len(df),
+                          bytes_=int(df.memory_usage(deep=True).sum()))
         return df
-    except Exception as e:
-        st.error(f"Erro ao carregar AFREs: {str(e)[:100]}")
-        return pd.DataFrame()
 
-@st.cache_data(ttl=1800)
-def carregar_scores_efetividade(_engine, limit=1000):
-    """Carrega scores de efetividade - SOB DEMANDA."""
-    try:
-        query = f"""
-            SELECT * 
-            FROM {DATABASE}.fisca_scores_efetividade
-            ORDER BY score_efetividade_final DESC
-            LIMIT {limit}
-        """
-        df = pd.read_sql(query, _engine)
+    chave_voo = chave or chave_resultado(query, None)
+    # Threads de carga e de renovação não têm contexto de script: só o prazo vale
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx is not None else None
+
+    def cancelar():
+        # Outra sessão coalescida ainda quer o resultado: a consulta continua
+        if ctx is not None and execucao_superada(ctx) and not consulta_tem_espera(chave_voo):
+            return "execução superada"
+        return None
+
+    prazo_s = REGISTRO_CONSULTAS[nome]['prazo_s']
+
+    def executar():
+        medicao = {}
+        inicio_execucao = time.perf_counter()
+        try:
+            df = ler_sql(query, _engine, medicao, prazo_s=prazo_s, cancelar=cancelar)
+        except ConsultaCancelada as e:
+            registrar_metrica(nome, 'miss', time.perf_counter() - inicio_execucao,
+                              primeira_linha_s=medicao.get('primeira_linha_s'),
+                              backend=medicao.get('backend'), erro=f"{PREFIXO_CANCELADA}: {e}")
+            raise
+        except PrazoConsultaExcedido as e:
+            registrar_metrica(nome, 'miss', time.perf_counter() - inicio_execucao,
+                              primeira_linha_s=medicao.get('primeira_linha_s'),
+                              backend=medicao.get('backend'), erro=f"{PREFIXO_CANCELADA}: {e}")
+            registrar_chamada_backend(_engine, False, erro=str(e))
+            raise
+        except Exception as e:
+            registrar_metrica(nome, 'miss', time.perf_counter() - inicio_execucao,
+                              primeira_linha_s=medicao.get('primeira_linha_s'),
+                              backend=medicao.get('backend'), erro=str(e))
+            registrar_chamada_backend(_engine, False, erro=str(e))
+            raise
+        registrar_chamada_backend(_engine, True, time.perf_counter() - inicio_execucao, prazo_s)
         df.columns = [col.lower() for col in df.columns]
+        registrar_metrica(nome, 'miss', time.perf_counter() - inicio_execucao,
+                          primeira_linha_s=medicao.get('primeira_linha_s'),
+                          linhas=len(df), bytes_=int(df.memory_usage(deep=True).sum()),
+                          backend=medicao.get('backend'))
+        if chave is not None:
+            # Versão desconhecida ("ttl-..."): a chave já muda a cada janela de TTL
+            validade = ttl_consulta(nome) if str(versao).startswith('ttl-') else CACHE_TTL_MAXIMO
+            salvar_resultado_disco(chave, nome, df, validade)
+        
+        orcamento = REGISTRO_CONSULTAS[nome]['orcamento_linhas']
+        execucoes = _execucoes_consultas()
+        with execucoes['trava']:
+            execucoes['ultimas'][nome] = {
+                'linhas': len(df),
+                'acima_orcamento': orcamento is not None and len(df) > orcamento,
+                'executada_em': datetime.now()
+            }
         return df
-    except Exception as e:
-        st.error(f"Erro ao carregar scores: {str(e)[:100]}")
-        return pd.DataFrame()
 
-@st.cache_data(ttl=1800)
-def carregar_dataset_ml(_engine):
-    """Carrega dataset completo para Machine Learning - SOB DEMANDA."""
-    try:
-        query = f"""
-            SELECT 
-                fc.*,
-                se.score_efetividade_final,
-                se.classificacao_efetividade,
-                eb.regime_tributario,
-                eb.cnae_secao,
-                eb.cnae_divisao
-            FROM {DATABASE}.fisca_fiscalizacoes_consolidadas fc
-            LEFT JOIN {DATABASE}.fisca_scores_efetividade se
-                ON fc.id_documento = se.id_documento
-            LEFT JOIN {DATABASE}.fisca_empresas_base eb
-                ON fc.cnpj = eb.cnpj
-            WHERE fc.ano_infracao >= YEAR(CURRENT_DATE()) - 3
-        """
-        df = pd.read_sql(query, _engine)
-        df.columns = [col.lower() for col in df.columns]
+    # Sem versão não há cache em disco: a coalescência fica restrita ao processo
+    df, coalescida = coalescer_consulta(
+        chave_voo,
+        executar,
+        reler=(lambda: ler_resultado_disco(chave, nome)) if chave is not None else None
+    )
+    if coalescida:
+        registrar_metrica(nome, 'coalescida', time.perf_counter() - inicio, linhas=len(df),
+                          bytes_=int(df.memory_usage(deep=True).sum()))
+        # O DataFrame do líder é compartilhado entre as threads que esperaram
+        return df.copy()
+    return df
+
+# Listas do cliente maiores que isto são enviadas em vários IN (...) e os
+# resultados são juntados aqui (alternativa ao semi-join)
+TAMANHO_LOTE_IN = _config('tamanho_lote_in', 1000)
+
+def _ordenar_como_sql(df, sql):
+    """Refaz no DataFrame o ORDER BY final (coluna única) do SQL."""
+    ordem = re.search(r'ORDER BY\s+(\w+)(\s+DESC)?\s*$', sql, re.IGNORECASE)
+    if ordem is None or ordem.group(1).lower() not in df.columns:
         return df
-    except Exception as e:
-        st.error(f"Erro ao carregar dataset ML: {str(e)[:100]}")
-        return pd.DataFrame()
+    return df.sort_values(ordem.group(1).lower(), ascending=not ordem.group(2),
+                          kind='stable', na_position='last', ignore_index=True)
+
+def executar_consulta_em_lotes(_engine, nome, parametro, valores, versao=None, **parametros):
+    """Executa a consulta com a lista `parametro` em lotes de TAMANHO_LOTE_IN e junta os resultados.
+    
+    Os lotes têm chaves disjuntas, então a junção não repete linhas; a ordenação
+    final do SQL é refeita no cliente.
+    """
+    valores = list(valores)
+    lotes = [valores[i:i + TAMANHO_LOTE_IN] for i in range(0, len(valores), TAMANHO_LOTE_IN)] or [[]]
+    partes = [
+        executar_consulta(_engine, nome, versao=versao, **{parametro: lote}, **parametros)
+        for lote in lotes
+    ]
+    if len(partes) == 1:
+        return partes[0]
+    return _ordenar_como_sql(pd.concat(partes, ignore_index=True), REGISTRO_CONSULTAS[nome]['sql'])
+
+def benchmark_filtro_chaves(_engine, quantidades, nome='itcmd_dde'):
+    """Compara lista única, lotes de IN e semi-join em `nome` para conjuntos crescentes de OFs.
+    
+    Cada conjunto reúne os emitentes com mais OFs até somar a quantidade pedida.
+    Lê direto do backend, sem cache, como benchmark_fetch.
+    """
+    emitentes = ler_sql(montar_consulta('emitentes_of'), _engine)
+    emitentes.columns = [col.lower() for col in emitentes.columns]
+    acumulado = emitentes['qtd_ofs'].cumsum()
+    
+    resultados = []
+    for quantidade in quantidades:
+        selecionados = [str(e) for e in emitentes['cd_usuario_emitente'].head(int((acumulado < quantidade).sum()) + 1)]
+        subconsulta = montar_subconsulta('ofs_dos_emitentes', emitentes=selecionados)
+        ofs = [str(x) for x in ler_sql(subconsulta.sql, _engine).iloc[:, 0].dropna().unique()]
+        lotes = [ofs[i:i + TAMANHO_LOTE_IN] for i in range(0, len(ofs), TAMANHO_LOTE_IN)] or [[]]
+        
+        modos = {
+            'lista': [montar_consulta(nome, lista_ofs=ofs)],
+            'lotes': [montar_consulta(nome, lista_ofs=lote) for lote in lotes],
+            'semijoin': [montar_consulta(nome, lista_ofs=subconsulta)]
+        }
+        for modo, consultas in modos.items():
+            inicio = time.perf_counter()
+            linhas = sum(len(ler_sql(query, _engine)) for query in consultas)
+            resultados.append({
+                'ofs': len(ofs),
+                'modo': modo,
+                'consultas': len(consultas),
+                'maior_sql_kb': max(len(query) for query in consultas) / 1024,
+                'linhas': linhas,
+                'segundos': time.perf_counter() - inicio
+            })
+    
+    return pd.DataFrame(resultados)
+
+def consultas_do_grupo(grupo):
+    """Nomes das consultas de um grupo do registro, na ordem do arquivo."""
+    return [nome for nome, consulta in REGISTRO_CONSULTAS.items() if consulta['grupo'] == grupo]
+
+def ttl_consulta(nome):
+    """TTL da consulta quando a versão da origem não é conhecida."""
+    return REGISTRO_CONSULTAS[nome]['ttl']
+
+def ordenar_consultas(nomes):
+    """Ordem de carga: dependências antes dos dependentes, depois prioridade (1 = primeiro)."""
+    nomes = list(nomes)
+    restantes = set(nomes)
+    ordem = []
+    while restantes:
+        prontas = [
+            nome for nome in restantes
+            if not restantes.intersection(REGISTRO_CONSULTAS[nome]['dependencias'])
+        ]
+        if not prontas:
+            raise ValueError(f"Dependência circular entre {sorted(restantes)}")
+        proxima = min(prontas, key=lambda nome: (REGISTRO_CONSULTAS[nome]['prioridade'], nomes.index(nome)))
+        ordem.append(proxima)
+        restantes.discard(proxima)
+    return ordem
+
+def resumo_registro():
+    """Registro de consultas com a última execução de cada uma, para diagnóstico."""
+    execucoes = _execucoes_consultas()
+    with execucoes['trava']:
+        ultimas = dict(execucoes['ultimas'])
+    
+    df = pd.DataFrame([
+        {
+            'consulta': nome,
+            'grupo': consulta['grupo'],
+            'ttl_s': consulta['ttl'],
+            'prioridade': consulta['prioridade'],
+            'orcamento_linhas': consulta['orcamento_linhas'],
+            'prazo_s': consulta['prazo_s'],
+            'dependencias': ', '.join(consulta['dependencias']),
+            'ultimas_linhas': ultimas.get(nome, {}).get('linhas'),
+            'acima_orcamento': ultimas.get(nome, {}).get('acima_orcamento', False)
+        }
+        for nome, consulta in REGISTRO_CONSULTAS.items()
+    ])
+    df['ultimas_linhas'] = df['ultimas_linhas'].astype('Int64')
+    df['orcamento_linhas'] = df['orcamento_linhas'].astype('Int64')
+    return df
 
 # =============================================================================
-# 6.1. FUNÇÕES DE CARREGAMENTO - ITCMD
+# 4.3. HISTÓRICO DE MÉTRICAS DAS CONSULTAS
 # =============================================================================
 
-# Coordenadores ITCMD
-COORDENADORES_ITCMD = ['9507248', '6172598']
-
-@st.cache_data(ttl=1800)
-def carregar_dados_itcmd(_engine):
-    """Carrega dados das OFs do setor ITCMD - filtrado por coordenadores específicos."""
-    dados_itcmd = {}
+# Uma linha por consulta executada (ou servida do cache), só com inserções.
+# Serve para acompanhar quais consultas ficam mais lentas conforme as tabelas
+# crescem (página 🛠️ Diagnóstico).
+METRICAS_DB = _config(
+    'metricas_db',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), f'.fisca_metricas{SUFIXO_BACKEND}.db')
+)
 
-    if _engine is None:
-        return {}
+SQL_CRIAR_METRICAS = """
+    CREATE TABLE IF NOT EXISTS execucoes (
+        registrado_em TEXT NOT NULL,
+        consulta TEXT NOT NULL,
+        grupo TEXT,
+        cache TEXT NOT NULL,
+        backend TEXT,
+        segundos REAL,
+        primeira_linha_s REAL,
+        linhas INTEGER,
+        bytes INTEGER,
+        erro TEXT
+    )
+"""
 
+@st.cache_resource
+def _trava_metricas():
+    """Serializa gravações no histórico entre as threads do processo."""
+    return threading.Lock()
+
+def _conectar_metricas():
+    conexao = sqlite3.connect(METRICAS_DB, timeout=10)
+    conexao.execute(SQL_CRIAR_METRICAS)
+    return conexao
+
+def registrar_metrica(consulta, cache, segundos=None, primeira_linha_s=None,
+                      linhas=None, bytes_=None, backend=None, erro=None):
+    """Acrescenta uma execução ao histórico. Falhas de gravação não afetam a carga."""
+    grupo = REGISTRO_CONSULTAS.get(consulta, {}).get('grupo')
     try:
-        # 1. Ordens de Fiscalização (filtradas pelos coordenadores ITCMD)
-        query_of = f"""
-            SELECT
-                id_documento,
-                numero_documento,
-                nu_of,
-                dt_documento,
-                data_emissao,
-                nm_estado,
-                situacao,
-                cd_usuario_emitente,
-                tx_recomendacoes,
-                dt_inicio,
-                dt_fim,
-                tx_motivacao_of,
-                nm_local_execucao,
-                nm_gerencia,
-                nm_local_emissao,
-                nu_mat_emitente,
-                nu_mat_coordenador,
-                nm_origem,
-                dt_alteracao_ods,
-                cd_ges,
-                nm_ges,
-                YEAR(dt_documento) as ano
-            FROM usr_sat_ods.fis_of_raw
-            WHERE cd_usuario_emitente IN ('9507248', '6172598')
-            ORDER BY dt_documento DESC
-        """
-        df_of = pd.read_sql(query_of, _engine)
-        df_of.columns = [col.lower() for col in df_of.columns]
-        dados_itcmd['of_itcmd'] = df_of
-
-        # Obter lista de nu_of para filtrar as outras tabelas
-        if not df_of.empty:
-            lista_ofs = df_of['nu_of'].dropna().unique().tolist()
-            lista_ofs_str = "', '".join([str(x) for x in lista_ofs])
-
-            # 2. Declarações (DDE) vinculadas às OFs do ITCMD
-            query_dde = f"""
-                SELECT
-                    nu_declaracao,
-                    nu_of,
-                    nu_ie,
-                    nm_razao_social,
-                    cd_ges,
-                    cd_gerfe,
-                    cd_munic,
-                    cd_motivo,
-                    cd_estado_conta,
-                    dt_entrega,
-                    vl_declarado,
-                    vl_data_declaracao,
-                    vl_total_saldo,
-                    vl_pago,
-                    vl_parc_pago,
-                    vl_parc_saldo,
-                    vl_dva_total,
-                    vl_dva_saldo,
-                    vl_dva_pago,
-                    dt_ultima_atualizacao,
-                    YEAR(dt_entrega) as ano
-                FROM usr_sat_ods.fis_of_em_numeros_dde
-                WHERE nu_of IN ('{lista_ofs_str}')
-                ORDER BY dt_entrega DESC
-            """
-            df_dde = pd.read_sql(query_dde, _engine)
-            df_dde.columns = [col.lower() for col in df_dde.columns]
-            dados_itcmd['dde_itcmd'] = df_dde
-
-            # 3. Notificações Fiscais vinculadas às OFs do ITCMD
-            query_notif = f"""
-                SELECT
-                    nu_notificacao_fiscal,
-                    nu_of,
-                    nu_ie,
-                    nu_cpf,
-                    nu_cnpj,
-                    nm_razao_social,
-                    cd_gerfe,
-                    cd_ges,
-                    cd_munic,
-                    cd_infracao,
-                    cd_edo_det_conta,
-                    nm_estado,
-                    dt_documento,
-                    vl_total,
-                    vl_pago,
-                    vl_parc_pago,
-                    vl_parc_saldo,
-                    vl_recl_tot,
-                    vl_dva_total,
-                    vl_dva_saldo,
-                    vl_dva_pago,
-                    dt_ultima_atualizacao,
-                    dt_ciencia,
-                    YEAR(dt_documento) as ano
-                FROM usr_sat_ods.fis_of_em_numeros_notif
-                WHERE nu_of IN ('{lista_ofs_str}')
-                ORDER BY dt_documento DESC
-            """
-            df_notif = pd.read_sql(query_notif, _engine)
-            df_notif.columns = [col.lower() for col in df_notif.columns]
-            dados_itcmd['notif_itcmd'] = df_notif
-
-            # 4. Termos de Infração (TIFDP) vinculados às OFs do ITCMD
-            query_tifdp = f"""
-                SELECT
-                    nu_infr_fiscal,
-                    nu_notificacao_gerada,
-                    nu_of,
-                    nu_ie,
-                    nu_cpf,
-                    nu_cnpj,
-                    nm_razao_social,
-                    cd_ges,
-                    cd_gerfe,
-                    cd_munic,
-                    cd_infracao,
-                    nm_estado,
-                    dt_documento,
-                    vl_apurado,
-                    vl_pago,
-                    vl_parc_pago,
-                    vl_parc_saldo,
-                    vl_convertido_notif,
-                    vl_cancelado,
-                    vl_dva_total,
-                    vl_dva_saldo,
-                    vl_dva_pago,
-                    dt_ultima_atualizacao,
-                    dt_ciencia,
-                    YEAR(dt_documento) as ano
-                FROM usr_sat_ods.fis_of_em_numeros_tifdp
-                WHERE nu_of IN ('{lista_ofs_str}')
-                ORDER BY dt_documento DESC
-            """
-            df_tifdp = pd.read_sql(query_tifdp, _engine)
-            df_tifdp.columns = [col.lower() for col in df_tifdp.columns]
-            dados_itcmd['tifdp_itcmd'] = df_tifdp
-
-            # 5. Catálogo de Infrações (para enriquecer com descrições)
-            query_infracoes = """
-                SELECT
-                    cd_infracao,
-                    de_infracao,
-                    nm_tributo,
-                    vl_multa
-                FROM usr_sat_ods.fis_tabela_infracoes
-            """
-            df_infracoes = pd.read_sql(query_infracoes, _engine)
-            df_infracoes.columns = [col.lower() for col in df_infracoes.columns]
-            dados_itcmd['catalogo_infracoes'] = df_infracoes
-
-            # 6. AFREs por Período (para análise de performance)
-            lista_matriculas = df_of['nu_mat_emitente'].dropna().unique().tolist()
-            lista_coord = df_of['nu_mat_coordenador'].dropna().unique().tolist()
-            todas_matriculas = list(set([str(m).strip() for m in lista_matriculas + lista_coord if m]))
-
-            if todas_matriculas:
-                matriculas_str = "', '".join(todas_matriculas)
-                query_afre = f"""
-                    SELECT
-                        cd_matricula,
-                        nu_ano_ref,
-                        nu_per_ref,
-                        qt_dias_ativa
-                    FROM usr_sat_ods.fis_afre_periodo
-                    WHERE CAST(cd_matricula AS STRING) IN ('{matriculas_str}')
-                """
-                try:
-                    df_afre = pd.read_sql(query_afre, _engine)
-                    df_afre.columns = [col.lower() for col in df_afre.columns]
-                    dados_itcmd['afre_periodo'] = df_afre
-                except:
-                    dados_itcmd['afre_periodo'] = pd.DataFrame()
-            else:
-                dados_itcmd['afre_periodo'] = pd.DataFrame()
-
-            # 7. Dados dos Contribuintes (para perfil CNAE/regime)
-            lista_ies = set()
-            if not df_dde.empty and 'nu_ie' in df_dde.columns:
-                lista_ies.update(df_dde['nu_ie'].dropna().unique())
-            if not df_notif.empty and 'nu_ie' in df_notif.columns:
-                lista_ies.update(df_notif['nu_ie'].dropna().unique())
-            if not df_tifdp.empty and 'nu_ie' in df_tifdp.columns:
-                lista_ies.update(df_tifdp['nu_ie'].dropna().unique())
-
-            if lista_ies:
-                ies_str = "', '".join([str(ie) for ie in lista_ies])
-                query_contrib = f"""
-                    SELECT DISTINCT
-                        nu_ie,
-                        nu_cnpj,
-                        nm_razao_social,
-                        cd_cnae,
-                        de_cnae,
-                        de_secao,
-                        nm_enq_empresa,
-                        nm_munic
-                    FROM usr_sat_ods.vw_ods_contrib
-                    WHERE nu_ie IN ('{ies_str}')
-                """
-                try:
-                    df_contrib = pd.read_sql(query_contrib, _engine)
-                    df_contrib.columns = [col.lower() for col in df_contrib.columns]
-                    dados_itcmd['contribuintes'] = df_contrib
-                except:
-                    dados_itcmd['contribuintes'] = pd.DataFrame()
-            else:
-                dados_itcmd['contribuintes'] = pd.DataFrame()
-
-            # 8. Acompanhamentos (Follow-ups)
-            query_acomp = f"""
-                SELECT
-                    id_documento_os,
-                    nu_documento_of,
-                    nm_estado_os,
-                    dt_documento_os,
-                    de_motivo_os
-                FROM usr_sat_ods.fis_acomp_raw
-                WHERE nu_documento_of IN ('{lista_ofs_str}')
-                ORDER BY dt_documento_os DESC
-            """
-            try:
-                df_acomp = pd.read_sql(query_acomp, _engine)
-                df_acomp.columns = [col.lower() for col in df_acomp.columns]
-                dados_itcmd['acompanhamentos'] = df_acomp
-            except:
-                dados_itcmd['acompanhamentos'] = pd.DataFrame()
-
-            # 9. Termos de Encerramento
-            query_termo = f"""
-                SELECT
-                    nu_termo_encerramento,
-                    os,
-                    nm_estado,
-                    dt_documento,
-                    dt_encerramento
-                FROM usr_sat_ods.fis_termo_encerram_fisc_raw
-                WHERE os IN ('{lista_ofs_str}')
-                ORDER BY dt_documento DESC
-            """
+        with _trava_metricas():
+            conexao = _conectar_metricas()
             try:
-                df_termo = pd.read_sql(query_termo, _engine)
-                df_termo.columns = [col.lower() for col in df_termo.columns]
-                dados_itcmd['termos_encerramento'] = df_termo
-            except:
-                dados_itcmd['termos_encerramento'] = pd.DataFrame()
-
-        else:
-            dados_itcmd['dde_itcmd'] = pd.DataFrame()
-            dados_itcmd['notif_itcmd'] = pd.DataFrame()
-            dados_itcmd['tifdp_itcmd'] = pd.DataFrame()
-            dados_itcmd['catalogo_infracoes'] = pd.DataFrame()
-            dados_itcmd['afre_periodo'] = pd.DataFrame()
-            dados_itcmd['contribuintes'] = pd.DataFrame()
-            dados_itcmd['acompanhamentos'] = pd.DataFrame()
-            dados_itcmd['termos_encerramento'] = pd.DataFrame()
-
-        return dados_itcmd
-
-    except Exception as e:
-        st.error(f"Erro ao carregar dados ITCMD: {str(e)[:150]}")
-        return {}
+                with conexao:
+                    conexao.execute(
+                        "INSERT INTO execucoes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (datetime.now().isoformat(timespec='seconds'), consulta, grupo, cache,
+                         backend, segundos, primeira_linha_s, linhas, bytes_,
+                         erro[:500] if erro else None)
+                    )
+            finally:
+                conexao.close()
+        return True
+    except Exception:
+        return False
+
+def ler_metricas(dias=30):
+    """Execuções dos últimos `dias` dias do histórico."""
+    desde = (datetime.now() - timedelta(days=dias)).isoformat(timespec='seconds')
+    with _trava_metricas():
+        conexao = _conectar_metricas()
+        try:
+            df = pd.read_sql(
+                "SELECT * FROM execucoes WHERE registrado_em >= ? ORDER BY registrado_em",
+                conexao, params=(desde,)
+            )
+        finally:
+            conexao.close()
+    df['registrado_em'] = pd.to_datetime(df['registrado_em'])
+    return df
+
+def percentis_latencia(df_metricas, por=None):
+    """p50/p90/p99 do tempo de parede por consulta (e por `por`, ex.: dia).
+    
+    Considera só execuções no Impala sem erro; acertos de cache entram na taxa.
+    """
+    chaves = ['consulta'] + ([por] if por else [])
+    executadas = df_metricas[(df_metricas['cache'] == 'miss') & df_metricas['erro'].isna()]
+    
+    latencias = executadas.groupby(chaves).agg(
+        execucoes=('segundos', 'size'),
+        p50_s=('segundos', 'median'),
+        p90_s=('segundos', lambda x: x.quantile(0.9)),
+        p99_s=('segundos', lambda x: x.quantile(0.99)),
+        primeira_linha_p50_s=('primeira_linha_s', 'median'),
+        linhas_mediana=('linhas', 'median'),
+        mb_mediana=('bytes', lambda b: b.median() / 1024 / 1024)
+    )
+    
+    totais = df_metricas.groupby(chaves).agg(
+        chamadas=('cache', 'size'),
+        taxa_acerto_cache=('cache', lambda c: (c != 'miss').mean() * 100),
+        erros=('erro', 'count')
+    )
+    return totais.join(latencias).reset_index()
+
+def economia_cancelamentos(df_metricas):
+    """Consultas interrompidas e segundos de cluster economizados, por consulta.
+    
+    A economia é estimada como a mediana das execuções completas da consulta
+    menos o tempo que ela já havia rodado ao ser cancelada (mínimo zero).
+    """
+    canceladas = df_metricas[df_metricas['erro'].fillna('').str.startswith(PREFIXO_CANCELADA)].copy()
+    if canceladas.empty:
+        return pd.DataFrame(columns=['consulta', 'canceladas', 'por_prazo', 'segundos_rodados',
+                                     'segundos_economizados'])
+    
+    completas = df_metricas[(df_metricas['cache'] == 'miss') & df_metricas['erro'].isna()]
+    mediana = completas.groupby('consulta')['segundos'].median()
+    canceladas['economizados'] = (
+        canceladas['consulta'].map(mediana) - canceladas['segundos']
+    ).clip(lower=0).fillna(0.0)
+    canceladas['por_prazo'] = canceladas['erro'].str.contains('prazo')
+    
+    return canceladas.groupby('consulta').agg(
+        canceladas=('erro', 'size'),
+        por_prazo=('por_prazo', 'sum'),
+        segundos_rodados=('segundos', 'sum'),
+        segundos_economizados=('economizados', 'sum')
+    ).reset_index().sort_values('segundos_economizados', ascending=False)
 
 # =============================================================================
-# 7. FUNÇÕES AUXILIARES DE VISUALIZAÇÃO
+# 4.4. BACKEND LOCAL (DUCKDB/SQLITE)
 # =============================================================================
 
-def criar_card_metrica(label: str, valor, icone: str = "📊", cor: str = "#1976d2"):
-    """Cria um card de métrica colorido."""
-    st.markdown(f"""
-    <div style='background: linear-gradient(135deg, {cor} 0%, {cor}dd 100%); 
-                padding: 1.5rem; border-radius: 10px; color: white; 
-                box-shadow: 0 4px 6px rgba(0,0,0,0.1); margin: 10px 0;'>
-        <div style='font-size: 2rem; margin-bottom: 0.5rem;'>{icone}</div>
-        <div style='font-size: 0.9rem; opacity: 0.9;'>{label}</div>
-        <div style='font-size: 2.5rem; font-weight: bold;'>{valor}</div>
-    </div>
-    """, unsafe_allow_html=True)
-
-def formatar_valor(valor):
-    """Formata valores monetários."""
-    if pd.isna(valor) or valor == 0:
-        return "R$ 0,00"
-    
-    if valor >= 1_000_000_000:
-        return f"R$ {valor/1_000_000_000:.2f}B"
-    elif valor >= 1_000_000:
-        return f"R$ {valor/1_000_000:.2f}M"
-    elif valor >= 1_000:
-        return f"R$ {valor/1_000:.2f}K"
-    else:
-        return f"R$ {valor:,.2f}"
-
-def criar_filtros_sidebar(dados):
-    """Cria painel de filtros na sidebar."""
-    filtros = {}
+# Banco local com os mesmos esquemas do Impala, para rodar e medir o dashboard
+# fora da rede da SEFAZ. DuckDB: um arquivo fisca.duckdb com os esquemas
+# (requer duckdb e duckdb_engine). SQLite: um arquivo <esquema>.db por esquema,
+# anexado com ATTACH. A divisão de inteiros do SQLite trunca; o DuckDB segue o
+# Impala e é o substituto recomendado.
+ESQUEMAS_LOCAIS = (DATABASE, 'usr_sat_ods')
+ARQUIVO_DUCKDB = 'fisca.duckdb'
+
+def _argumentos_sql(texto):
+    """Argumentos de primeiro nível de uma chamada SQL (vírgulas fora de parênteses)."""
+    argumentos, nivel, inicio = [], 0, 0
+    for i, caractere in enumerate(texto):
+        if caractere == '(':
+            nivel += 1
+        elif caractere == ')':
+            nivel -= 1
+        elif caractere == ',' and nivel == 0:
+            argumentos.append(texto[inicio:i].strip())
+            inicio = i + 1
+    argumentos.append(texto[inicio:].strip())
+    return argumentos
+
+def _reescrever_funcao(sql, funcao, montar):
+    """Troca cada chamada funcao(args) por montar(*args), inclusive chamadas aninhadas."""
+    padrao = re.compile(rf'\b{funcao}\s*\(', re.IGNORECASE)
+    partes, posicao = [], 0
+    while True:
+        encontrado = padrao.search(sql, posicao)
+        if encontrado is None:
+            break
+        # Parêntese que fecha a chamada
+        nivel, fim = 1, encontrado.end()
+        while nivel and fim < len(sql):
+            nivel += {'(': 1, ')': -1}.get(sql[fim], 0)
+            fim += 1
+        argumentos = [
+            _reescrever_funcao(argumento, funcao, montar)
+            for argumento in _argumentos_sql(sql[encontrado.end():fim - 1])
+        ]
+        partes.append(sql[posicao:encontrado.start()])
+        partes.append(montar(*argumentos))
+        posicao = fim
+    partes.append(sql[posicao:])
+    return ''.join(partes)
+
+# Funções do Impala sem equivalente direto em cada dialeto local
+TRADUCOES_SQL = {
+    'duckdb': [
+        ('ADD_MONTHS', lambda data, meses: f"CAST(({data}) + to_months({meses}) AS DATE)"),
+        ('DATEDIFF', lambda fim, inicio: f"date_diff('day', CAST({inicio} AS DATE), CAST({fim} AS DATE))")
+    ],
+    'sqlite': [
+        ('ADD_MONTHS', lambda data, meses: f"date({data}, printf('%+d months', {meses}))"),
+        ('DATEDIFF', lambda fim, inicio: f"CAST(julianday({fim}) - julianday({inicio}) AS INTEGER)"),
+        ('YEAR', lambda data: f"CAST(strftime('%Y', {data}) AS INTEGER)")
+    ]
+}
+
+def traduzir_sql(query, dialeto=None):
+    """Adapta SQL do Impala ao dialeto do backend local (sem efeito no Impala)."""
+    dialeto = dialeto or BACKEND_SQL
+    if dialeto == 'impala':
+        return query
+    
+    query = re.sub(r'\bCURRENT_DATE\s*\(\s*\)', 'CURRENT_DATE', query, flags=re.IGNORECASE)
+    for funcao, montar in TRADUCOES_SQL[dialeto]:
+        query = _reescrever_funcao(query, funcao, montar)
+    if dialeto == 'sqlite':
+        # SQLite guarda datas como texto ISO; CAST AS DATE viraria número
+        query = re.sub(r'\bAS\s+(STRING|DATE|TIMESTAMP)\b', 'AS TEXT', query, flags=re.IGNORECASE)
+    return query
+
+def criar_engine_local():
+    """Engine do banco local, com o mesmo pool instrumentado do Impala."""
+    os.makedirs(DIRETORIO_BANCO_LOCAL, exist_ok=True)
+    opcoes_pool = dict(
+        poolclass=PoolInstrumentado,
+        pool_size=POOL_TAMANHO,
+        max_overflow=POOL_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_pre_ping=POOL_PRE_PING
+    )
     
-    with st.sidebar.expander("🔍 Filtros Globais", expanded=True):
-        
-        # Ano
-        df_dash = dados.get('dashboard_executivo', pd.DataFrame())
-        if not df_dash.empty and 'ano' in df_dash.columns:
-            anos = sorted(df_dash['ano'].unique(), reverse=True)
-            filtros['anos'] = st.multiselect(
-                "Anos",
-                anos,
-                default=anos[:3] if len(anos) >= 3 else anos
-            )
-        
-        # Gerência
-        df_gerencia = dados.get('metricas_gerencia', pd.DataFrame())
-        if not df_gerencia.empty and 'gerfe' in df_gerencia.columns:
-            gerencias = sorted(df_gerencia['gerfe'].dropna().unique())
-            filtros['gerencias'] = st.multiselect(
-                "Gerências (GRAF)",
-                gerencias,
-                default=[]
-            )
-        
-        # Valor mínimo
-        filtros['valor_minimo'] = st.number_input(
-            "Valor Mínimo (R$)",
-            min_value=0,
-            max_value=10000000,
-            value=0,
-            step=100000
+    if BACKEND_SQL == 'duckdb':
+        engine = create_engine(
+            f"duckdb:///{os.path.join(DIRETORIO_BANCO_LOCAL, ARQUIVO_DUCKDB)}", **opcoes_pool
         )
-        
-        st.divider()
-        
-        # Visualização
-        st.subheader("🎨 Visualização")
-        filtros['tema'] = st.selectbox(
-            "Tema dos Gráficos",
-            ["plotly", "plotly_white", "plotly_dark"],
-            index=1
+    elif BACKEND_SQL == 'sqlite':
+        engine = create_engine(
+            f"sqlite:///{os.path.join(DIRETORIO_BANCO_LOCAL, 'main.db')}",
+            connect_args={'check_same_thread': False},
+            **opcoes_pool
         )
         
-        filtros['mostrar_valores'] = st.checkbox("Mostrar valores", value=True)
+        @event.listens_for(engine, 'connect')
+        def _anexar_esquemas(conexao, conn_rec):
+            for esquema in ESQUEMAS_LOCAIS:
+                arquivo = os.path.join(DIRETORIO_BANCO_LOCAL, f'{esquema}.db')
+                conexao.execute(f"ATTACH DATABASE '{arquivo}' AS {esquema}")
+    else:
+        raise ValueError(f"backend_sql desconhecido: {BACKEND_SQL}")
     
-    return filtros
+    _instrumentar_engine(engine)
+    return engine
+
+def versao_arquivo_local(tabela):
+    """Versão de uma tabela local: data de modificação e tamanho do arquivo que a contém."""
+    esquema = tabela.split('.')[0]
+    arquivo = ARQUIVO_DUCKDB if BACKEND_SQL == 'duckdb' else f'{esquema}.db'
+    try:
+        info = os.stat(os.path.join(DIRETORIO_BANCO_LOCAL, arquivo))
+    except OSError:
+        return None
+    return _hash_consulta(f"{arquivo}|{info.st_mtime_ns}|{info.st_size}")
 
 # =============================================================================
-# 8. PÁGINAS DO DASHBOARD
+# 4.5. CACHE DE RESULTADOS EM DISCO (COMPARTILHADO ENTRE PROCESSOS)
 # =============================================================================
 
-def pagina_dashboard_executivo(dados, filtros):
-    """Dashboard executivo principal."""
-    st.markdown("<h1 class='main-header'>📊 Dashboard Executivo - Sistema FISCA</h1>", unsafe_allow_html=True)
-    
-    st.markdown("""
-    <div class='info-box'>
-    <b>🎯 Sistema de Análise de Fiscalizações</b><br>
-    Monitoramento completo das ações fiscais da Receita Estadual de SC, incluindo infrações, 
-    notificações fiscais, encerramentos e análise de efetividade.
-    <br><br>
-    ✅ <b>Dados corrigidos:</b> Excluindo 1,541 infrações canceladas/excluídas das métricas
+# O st.cache_data vale só dentro de um processo: cada réplica atrás do
+# balanceador repetiria as mesmas consultas no Impala. Este cache fica num
+# SQLite do host (as travas de arquivo do SQLite coordenam os processos),
+# com o resultado em Parquet comprimido (zstd), chave = SQL normalizado com
+# os parâmetros + versão das tabelas de origem, e despejo LRU por tamanho.
+# As tabelas do sistema já têm o snapshot (seção 5.1) e não passam por aqui.
+CACHE_RESULTADOS_DB = _config(
+    'cache_resultados_db',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), f'.fisca_resultados{SUFIXO_BACKEND}.db')
+)
+CACHE_RESULTADOS_MB = _config('cache_resultados_mb', 512)
+
+SQL_CRIAR_CACHE_RESULTADOS = [
+    """
+    CREATE TABLE IF NOT EXISTS resultados (
+        chave TEXT PRIMARY KEY,
+        familia TEXT NOT NULL,
+        criado_em REAL NOT NULL,
+        expira_em REAL NOT NULL,
+        acessado_em REAL NOT NULL,
+        linhas INTEGER,
+        bytes INTEGER NOT NULL,
+        conteudo BLOB NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_resultados_acesso ON resultados (acessado_em)",
+    """
+    CREATE TABLE IF NOT EXISTS contadores (
+        familia TEXT PRIMARY KEY,
+        acertos INTEGER NOT NULL DEFAULT 0,
+        falhas INTEGER NOT NULL DEFAULT 0
+    )
+    """
+]
+
+def _conectar_cache_resultados():
+    conexao = sqlite3.connect(CACHE_RESULTADOS_DB, timeout=30, isolation_level=None)
+    # WAL: leitores de outros processos não esperam pela gravação em curso
+    conexao.execute("PRAGMA journal_mode=WAL")
+    for sql in SQL_CRIAR_CACHE_RESULTADOS:
+        conexao.execute(sql)
+    return conexao
+
+def _prefixo_chave_resultado(query):
+    """Parte da chave que identifica a consulta (SQL normalizado com os parâmetros e backend)."""
+    return _hash_consulta(f"{BACKEND_SQL}|{query}")
+
+def chave_resultado(query, versao):
+    """Chave do cache: hash da consulta seguido do hash da versão da origem."""
+    return _prefixo_chave_resultado(query) + _hash_consulta(str(versao))
+
+def _contar_acesso(conexao, familia, acerto):
+    coluna = 'acertos' if acerto else 'falhas'
+    conexao.execute(
+        f"INSERT INTO contadores (familia, {coluna}) VALUES (?, 1) "
+        f"ON CONFLICT(familia) DO UPDATE SET {coluna} = {coluna} + 1",
+        (familia,)
+    )
+
+def ler_resultado_disco(chave, familia):
+    """DataFrame em cache para a chave, ou None. Conta acerto/falha da família."""
+    agora = time.time()
+    try:
+        conexao = _conectar_cache_resultados()
+        try:
+            linha = conexao.execute(
+                "SELECT conteudo FROM resultados WHERE chave = ? AND expira_em > ?", (chave, agora)
+            ).fetchone()
+            conexao.execute("BEGIN IMMEDIATE")
+            _contar_acesso(conexao, familia, linha is not None)
+            if linha is not None:
+                conexao.execute("UPDATE resultados SET acessado_em = ? WHERE chave = ?", (agora, chave))
+            conexao.execute("COMMIT")
+        finally:
+            conexao.close()
+        if linha is None:
+            return None
+        return pd.read_parquet(io.BytesIO(linha[0]))
+    except Exception:
+        return None
+
+def salvar_resultado_disco(chave, familia, df, validade):
+    """Grava o resultado (Parquet zstd) e despeja os menos usados acima do limite."""
+    agora = time.time()
+    try:
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False, compression='zstd')
+        conteudo = buffer.getvalue()
+        limite = CACHE_RESULTADOS_MB * 1024 * 1024
+        if len(conteudo) > limite:
+            return False
+
+        conexao = _conectar_cache_resultados()
+        try:
+            conexao.execute("BEGIN IMMEDIATE")
+            conexao.execute(
+                "INSERT OR REPLACE INTO resultados VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (chave, familia, agora, agora + validade, agora, len(df), len(conteudo), conteudo)
+            )
+            # LRU: remove os acessados há mais tempo até caber no limite. Entradas
+            # vencidas não são servidas, mas ficam como último resultado conhecido
+            # para o modo degradado (seção 4.7) até serem despejadas.
+            total = conexao.execute("SELECT COALESCE(SUM(bytes), 0) FROM resultados").fetchone()[0]
+            if total > limite:
+                excedente = total - limite
+                for chave_antiga, tamanho in conexao.execute(
+                    "SELECT chave, bytes FROM resultados WHERE chave != ? ORDER BY acessado_em", (chave,)
+                ).fetchall():
+                    if excedente <= 0:
+                        break
+                    conexao.execute("DELETE FROM resultados WHERE chave = ?", (chave_antiga,))
+                    excedente -= tamanho
+            conexao.execute("COMMIT")
+        finally:
+            conexao.close()
+        return True
+    except Exception:
+        return False
+
+def ler_resultado_disco_recente(query):
+    """Resultado mais recente da consulta em qualquer versão, mesmo vencido: (df, criado_em) ou None."""
+    try:
+        conexao = _conectar_cache_resultados()
+        try:
+            linha = conexao.execute(
+                "SELECT conteudo, criado_em FROM resultados WHERE substr(chave, 1, 16) = ? "
+                "ORDER BY criado_em DESC LIMIT 1",
+                (_prefixo_chave_resultado(query),)
+            ).fetchone()
+        finally:
+            conexao.close()
+        if linha is None:
+            return None
+        return pd.read_parquet(io.BytesIO(linha[0])), datetime.fromtimestamp(linha[1])
+    except Exception:
+        return None
+
+def estatisticas_cache_disco():
+    """Acertos, falhas, taxa de acerto, entradas e tamanho por família (consulta do registro)."""
+    conexao = _conectar_cache_resultados()
+    try:
+        contadores = pd.read_sql("SELECT * FROM contadores", conexao)
+        entradas = pd.read_sql(
+            "SELECT familia, COUNT(*) AS entradas, SUM(bytes) / 1048576.0 AS mb "
+            "FROM resultados WHERE expira_em > ? GROUP BY familia",
+            conexao, params=(time.time(),)
+        )
+    finally:
+        conexao.close()
+
+    df = contadores.merge(entradas, on='familia', how='outer')
+    df[['acertos', 'falhas', 'entradas']] = df[['acertos', 'falhas', 'entradas']].fillna(0).astype(int)
+    df['mb'] = df['mb'].fillna(0.0)
+    chamadas = df['acertos'] + df['falhas']
+    df['taxa_acerto'] = np.where(chamadas > 0, df['acertos'] / chamadas.where(chamadas > 0, 1) * 100, 0.0)
+    return df[['familia', 'acertos', 'falhas', 'taxa_acerto', 'entradas', 'mb']].sort_values(
+        'acertos', ascending=False
+    ).reset_index(drop=True)
+
+# =============================================================================
+# 4.6. COALESCÊNCIA DE CONSULTAS (SINGLE-FLIGHT)
+# =============================================================================
+
+# De manhã várias sessões abrem o painel com o cache frio ao mesmo tempo e
+# disparariam as mesmas consultas pesadas. Uma consulta idêntica já em execução
+# não é repetida: no processo, as demais threads esperam o Future da primeira;
+# entre processos, uma trava de arquivo (flock) serializa a execução e quem
+# esperou relê o cache em disco (seção 4.5) antes de consultar o Impala.
+DIRETORIO_TRAVAS_CONSULTAS = CACHE_RESULTADOS_DB + '.travas'
+# Depois desse tempo de espera a consulta é executada sem coalescer
+ESPERA_MAXIMA_COALESCENCIA = 900
+
+@st.cache_resource
+def _consultas_em_voo():
+    """Consultas em execução neste processo: chave -> Future do resultado e espera."""
+    return {'trava': threading.Lock(), 'futuros': {}, 'esperando': {}}
+
+def consulta_tem_espera(chave):
+    """True se outra thread deste processo espera o resultado da chave."""
+    em_voo = _consultas_em_voo()
+    with em_voo['trava']:
+        return em_voo['esperando'].get(chave, 0) > 0
+
+def _adquirir_trava_arquivo(chave):
+    """Trava exclusiva entre processos da chave: (arquivo, esperou).
+    
+    Cada chave tem o próprio arquivo, removido por quem libera a trava. Sem
+    fcntl (Windows) ou sem acesso ao diretório, devolve (None, False) e a
+    consulta segue sem coalescência entre processos. O flock é liberado pelo
+    sistema se o processo morrer com a trava.
+    """
+    if fcntl is None:
+        return None, False
+    caminho = os.path.join(DIRETORIO_TRAVAS_CONSULTAS, f'{chave}.lock')
+    esperou = False
+    limite = time.monotonic() + ESPERA_MAXIMA_COALESCENCIA
+    while True:
+        try:
+            os.makedirs(DIRETORIO_TRAVAS_CONSULTAS, exist_ok=True)
+            arquivo = open(caminho, 'a')
+        except OSError:
+            return None, esperou
+
+        while True:
+            try:
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > limite:
+                    arquivo.close()
+                    return None, True
+                esperou = True
+                time.sleep(0.2)
+
+        # Trava obtida num arquivo que o dono anterior já removeu não vale:
+        # outro processo pode ter criado um novo no mesmo caminho
+        try:
+            if os.path.samestat(os.fstat(arquivo.fileno()), os.stat(caminho)):
+                return arquivo, esperou
+        except FileNotFoundError:
+            pass
+        arquivo.close()
+
+def _liberar_trava_arquivo(arquivo):
+    if arquivo is not None:
+        # Remove antes de destravar: quem esperava no arquivo vê que ele saiu
+        # do caminho e trava de novo, sem acumular um arquivo por consulta
+        try:
+            os.remove(arquivo.name)
+        except OSError:
+            pass
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+        arquivo.close()
+
+def coalescer_consulta(chave, executar, reler=None):
+    """Executa `executar()` uma única vez por chave entre threads e processos.
+    
+    `reler()` busca o resultado que outro processo tenha gravado enquanto esta
+    chamada esperava a trava de arquivo (None = não há). Retorna
+    (resultado, coalescida); coalescida indica que a consulta não foi executada aqui.
+    """
+    em_voo = _consultas_em_voo()
+    while True:
+        with em_voo['trava']:
+            futuro = em_voo['futuros'].get(chave)
+            # Future já resolvido é de um líder que está saindo
+            lider = futuro is None or futuro.done()
+            if lider:
+                futuro = Future()
+                em_voo['futuros'][chave] = futuro
+            else:
+                em_voo['esperando'][chave] = em_voo['esperando'].get(chave, 0) + 1
+        if lider:
+            break
+
+        try:
+            return futuro.result(timeout=ESPERA_MAXIMA_COALESCENCIA), True
+        except TimeoutError:
+            return executar(), False
+        except ConsultaCancelada:
+            # O líder desistiu (rerun superado) antes de ver esta espera: a
+            # primeira thread a voltar ao laço assume e as demais esperam por ela
+            continue
+        finally:
+            with em_voo['trava']:
+                restantes = em_voo['esperando'].pop(chave, 1) - 1
+                if restantes > 0:
+                    em_voo['esperando'][chave] = restantes
+
+    try:
+        resultado = None
+        arquivo, esperou = _adquirir_trava_arquivo(chave) if reler is not None else (None, False)
+        try:
+            if esperou:
+                resultado = reler()
+            coalescida = resultado is not None
+            if resultado is None:
+                resultado = executar()
+        finally:
+            _liberar_trava_arquivo(arquivo)
+        futuro.set_result(resultado)
+        return resultado, coalescida
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        with em_voo['trava']:
+            if em_voo['futuros'].get(chave) is futuro:
+                del em_voo['futuros'][chave]
+
+# =============================================================================
+# 4.7. DISJUNTOR DO BACKEND (MODO DEGRADADO)
+# =============================================================================
+
+# Janelas de manutenção do cluster não devem derrubar o painel. O disjuntor
+# acompanha as chamadas ao backend numa janela deslizante e abre quando a
+# proporção de falhas e de consultas lentas (acima de FRACAO_PRAZO_LENTA do
+# prazo_s) atinge DISJUNTOR_LIMIAR, ou quando a conexão falha. Aberto, nenhuma
+# consulta vai ao Impala: as tabelas do sistema vêm do snapshot, as consultas
+# sob demanda do último resultado no cache em disco, e uma thread sonda o
+# backend até ele voltar.
+DISJUNTOR_JANELA_S = _config('disjuntor_janela_s', 300)
+DISJUNTOR_MIN_CHAMADAS = _config('disjuntor_min_chamadas', 5)
+DISJUNTOR_LIMIAR = _config('disjuntor_limiar', 0.5)
+FRACAO_PRAZO_LENTA = 0.5
+INTERVALO_SONDA_DISJUNTOR = _config('intervalo_sonda_disjuntor', 30)
+
+class BackendIndisponivel(Exception):
+    """Consulta recusada porque o disjuntor está aberto e não há resultado anterior."""
+
+@st.cache_resource
+def _disjuntor():
+    """Estado do disjuntor do processo: chamadas recentes, abertura e sonda."""
+    return {
+        'trava': threading.Lock(),
+        'chamadas': deque(maxlen=500),
+        'aberto_em': None,
+        'motivo': None,
+        'sonda': None,
+        'ultima_sonda': None
+    }
+
+def modo_degradado():
+    """True enquanto o disjuntor estiver aberto."""
+    disjuntor = _disjuntor()
+    with disjuntor['trava']:
+        return disjuntor['aberto_em'] is not None
+
+def estado_disjuntor():
+    """Resumo do disjuntor para exibição."""
+    disjuntor = _disjuntor()
+    limite = time.time() - DISJUNTOR_JANELA_S
+    with disjuntor['trava']:
+        recentes = [c for c in disjuntor['chamadas'] if c[0] >= limite]
+        return {
+            'aberto_em': disjuntor['aberto_em'],
+            'motivo': disjuntor['motivo'],
+            'ultima_sonda': disjuntor['ultima_sonda'],
+            'chamadas': len(recentes),
+            'falhas': sum(1 for _, sucesso, _lenta in recentes if not sucesso),
+            'lentas': sum(1 for _, _sucesso, lenta in recentes if lenta)
+        }
+
+def registrar_chamada_backend(_engine, sucesso, segundos=None, prazo_s=None, erro=None):
+    """Acrescenta uma chamada à janela e abre o disjuntor se o limiar for atingido."""
+    agora = time.time()
+    lenta = bool(sucesso and prazo_s and segundos is not None and segundos > FRACAO_PRAZO_LENTA * prazo_s)
+    disjuntor = _disjuntor()
+    with disjuntor['trava']:
+        disjuntor['chamadas'].append((agora, sucesso, lenta))
+        recentes = [c for c in disjuntor['chamadas'] if c[0] >= agora - DISJUNTOR_JANELA_S]
+        ruins = sum(1 for _, ok, devagar in recentes if not ok or devagar)
+        disparar = (
+            disjuntor['aberto_em'] is None
+            and len(recentes) >= DISJUNTOR_MIN_CHAMADAS
+            and ruins / len(recentes) >= DISJUNTOR_LIMIAR
+        )
+    if disparar:
+        motivo = f"{ruins} de {len(recentes)} chamadas com falha ou lentas"
+        abrir_disjuntor(_engine, f"{motivo}; última: {erro[:100]}" if erro else motivo)
+
+def abrir_disjuntor(_engine, motivo):
+    """Entra no modo degradado (se ainda não estiver) e inicia a sonda de recuperação."""
+    disjuntor = _disjuntor()
+    with disjuntor['trava']:
+        if disjuntor['aberto_em'] is not None:
+            return False
+        disjuntor['aberto_em'] = datetime.now()
+        disjuntor['motivo'] = motivo
+        disjuntor['chamadas'].clear()
+    registrar_metrica('disjuntor', 'miss', erro=f"aberto: {motivo}")
+    iniciar_sonda_disjuntor(_engine)
+    return True
+
+def fechar_disjuntor():
+    """Sai do modo degradado; a janela de chamadas recomeça vazia."""
+    disjuntor = _disjuntor()
+    with disjuntor['trava']:
+        disjuntor['aberto_em'] = None
+        disjuntor['motivo'] = None
+        disjuntor['chamadas'].clear()
+
+def _sondar_recuperacao(_engine):
+    """Laço da sonda: testa a conexão a cada INTERVALO_SONDA_DISJUNTOR até ela voltar."""
+    disjuntor = _disjuntor()
+    while modo_degradado():
+        time.sleep(INTERVALO_SONDA_DISJUNTOR)
+        try:
+            with _engine.connect() as conn:
+                conn.exec_driver_sql("SELECT 1").fetchall()
+        except Exception as e:
+            with disjuntor['trava']:
+                disjuntor['ultima_sonda'] = (datetime.now(), str(e)[:200])
+            continue
+        with disjuntor['trava']:
+            disjuntor['ultima_sonda'] = (datetime.now(), None)
+        fechar_disjuntor()
+
+def iniciar_sonda_disjuntor(_engine):
+    """Inicia a sonda de recuperação, se houver engine e nenhuma sonda ativa."""
+    if _engine is None:
+        return False
+    disjuntor = _disjuntor()
+    with disjuntor['trava']:
+        if disjuntor['sonda'] is not None and disjuntor['sonda'].is_alive():
+            return False
+        disjuntor['sonda'] = threading.Thread(
+            target=_sondar_recuperacao, args=(_engine,), name='fisca-sonda-disjuntor', daemon=True
+        )
+        disjuntor['sonda'].start()
+    return True
+
+# =============================================================================
+# 4.8. EXECUÇÃO EM GRAFO DE DEPENDÊNCIAS
+# =============================================================================
+
+# Carregadores com várias consultas encadeadas (ex.: ITCMD) declaram cada
+# consulta do registro como um nó; as arestas são as `dependencias` do
+# registro. Cada nó começa assim que as suas dependências terminam, até
+# MAX_CONSULTAS_PARALELAS ao mesmo tempo, e os tempos de cada nó ficam
+# guardados para mostrar o caminho crítico da carga (página 🛠️ Diagnóstico).
+
+@st.cache_resource
+def _execucoes_grafos():
+    """Tempos por nó da última execução de cada grafo neste processo."""
+    return {'trava': threading.Lock(), 'ultimas': {}}
+
+def caminho_critico(tempos, dependencias):
+    """Nós do caminho crítico: do último a terminar, volta pela dependência que terminou por último."""
+    if not tempos:
+        return []
+    atual = max(tempos, key=lambda nome: tempos[nome][1])
+    caminho = [atual]
+    while True:
+        anteriores = [d for d in dependencias[atual] if d in tempos]
+        if not anteriores:
+            break
+        atual = max(anteriores, key=lambda nome: tempos[nome][1])
+        caminho.append(atual)
+    return caminho[::-1]
+
+def executar_grafo(nome_grafo, tarefas, dependencias=None):
+    """Executa `tarefas` (consulta do registro -> função) na ordem das dependências.
+    
+    Cada função recebe o dict com os resultados das tarefas já concluídas e
+    devolve o resultado do seu nó. A primeira exceção interrompe o agendamento
+    e é relançada quando os nós em andamento terminam. `dependencias` substitui
+    as arestas do registro (ex.: com semi-join, ninguém espera a lista de OFs).
+    """
+    if dependencias is None:
+        dependencias = {nome: REGISTRO_CONSULTAS[nome]['dependencias'] for nome in tarefas}
+    dependencias = {
+        nome: [d for d in dependencias.get(nome, []) if d in tarefas]
+        for nome in tarefas
+    }
+    # As threads herdam o contexto da sessão: o cancelamento por rerun superado continua valendo
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx is not None else None
+    inicio_grafo = time.perf_counter()
+    tempos = {}
+
+    def rodar(nome, prontos):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        inicio = time.perf_counter() - inicio_grafo
+        try:
+            return tarefas[nome](prontos)
+        finally:
+            tempos[nome] = (inicio, time.perf_counter() - inicio_grafo)
+
+    resultados = {}
+    pendentes = ordenar_consultas(tarefas)
+    erro = None
+    with ThreadPoolExecutor(max_workers=min(MAX_CONSULTAS_PARALELAS, len(tarefas)),
+                            thread_name_prefix=f'fisca-{nome_grafo}') as executor:
+        em_execucao = {}
+        while pendentes or em_execucao:
+            if erro is None:
+                prontos = [nome for nome in pendentes if all(d in resultados for d in dependencias[nome])]
+                for nome in prontos:
+                    pendentes.remove(nome)
+                    em_execucao[executor.submit(rodar, nome, dict(resultados))] = nome
+            if not em_execucao:
+                break
+            concluidos, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                nome = em_execucao.pop(futuro)
+                try:
+                    resultados[nome] = futuro.result()
+                except BaseException as e:
+                    if erro is None:
+                        erro = e
+
+    critico = caminho_critico(tempos, dependencias)
+    execucoes = _execucoes_grafos()
+    with execucoes['trava']:
+        execucoes['ultimas'][nome_grafo] = {
+            'executado_em': datetime.now(),
+            'total_s': time.perf_counter() - inicio_grafo,
+            'erro': str(erro)[:200] if erro is not None else None,
+            'nos': pd.DataFrame([
+                {
+                    'no': nome,
+                    'dependencias': ', '.join(dependencias[nome]),
+                    'inicio_s': inicio,
+                    'fim_s': fim,
+                    'duracao_s': fim - inicio,
+                    'critico': nome in critico
+                }
+                for nome, (inicio, fim) in sorted(tempos.items(), key=lambda item: item[1][0])
+            ])
+        }
+
+    if erro is not None:
+        raise erro
+    return resultados
+
+def ultimas_execucoes_grafos():
+    """Última execução de cada grafo (para diagnóstico)."""
+    execucoes = _execucoes_grafos()
+    with execucoes['trava']:
+        return dict(execucoes['ultimas'])
+
+# =============================================================================
+# 5. FUNÇÕES DE CARREGAMENTO DE DADOS (ESTRATÉGIA HÍBRIDA)
+# =============================================================================
+
+# Configuração das tabelas do carregamento inicial (grupo 'sistema' do registro)
+TABELAS_CONFIG = {
+    nome: {'query': montar_consulta(nome), 'tipo': REGISTRO_CONSULTAS[nome]['tipo']}
+    for nome in consultas_do_grupo('sistema')
+}
+
+def _executar_consulta_tabela(_engine, key):
+    """Executa uma consulta do carregamento do sistema (roda em thread do pool)."""
+    df = executar_consulta(_engine, key)
+    
+    # Tipos declarados em SCHEMAS_TABELAS e compactação de memória
+    df, divergencias = aplicar_schema(df, key)
+    df, memoria = compactar_dataframe(df)
+    return df, divergencias, memoria
+
+def _registrar_acerto(key, entrada, cache):
+    """Registra no histórico a tabela servida do cache, uma vez por sessão e carga."""
+    registrados = st.session_state.setdefault('_acertos_registrados', set())
+    marca = (key, cache, entrada['carregado_em'])
+    if marca in registrados:
+        return
+    registrados.add(marca)
+    registrar_metrica(key, cache, linhas=len(entrada['df']),
+                      bytes_=int(entrada['df'].memory_usage(deep=True).sum()))
+
+@st.cache_resource
+def _cache_tabelas_sistema():
+    """Cache do processo com a última versão carregada de cada tabela do sistema."""
+    return {'trava': threading.Lock(), 'entradas': {}}
+
+def carregar_dados_sistema(_engine, tabelas=None):
+    """Carrega dados agregados do sistema - ESTRATÉGIA RÁPIDA.
+    
+    Carrega só as chaves de `tabelas` (todas, se None). Cada tabela fica em
+    cache até a versão das suas tabelas de origem mudar (ver
+    obter_versoes_tabelas). Tabelas desatualizadas continuam sendo servidas
+    enquanto a renovação roda em segundo plano; só a primeira carga, sem
+    cache nem snapshot, espera o Impala. No modo degradado (seção 4.7) só o
+    cache e o snapshot são usados; tabelas sem nenhum dos dois ficam de fora.
+    """
+    dados = {}
+    
+    degradado = _engine is None or modo_degradado()
+    if not degradado:
+        _iniciar_vigia()
+    
+    # Configuração de tabelas
+    tabelas_config = {
+        key: config for key, config in TABELAS_CONFIG.items()
+        if tabelas is None or key in tabelas
+    }
+    if not tabelas_config:
+        return {}
+    
+    cache = _cache_tabelas_sistema()
+    origens = sorted({t for config in tabelas_config.values() for t in tabelas_origem(config['query'])})
+    versoes = {} if degradado else obter_versoes_tabelas(_engine, tuple(origens))
+    agora = datetime.now()
+    
+    # Reaproveitar o cache do processo e, depois, o snapshot em disco
+    pendentes = {}
+    do_snapshot = 0
+    for key, config in tabelas_config.items():
+        versao = versao_combinada(versoes, tabelas_origem(config['query']), ttl_consulta(key))
+        
+        with cache['trava']:
+            entrada = cache['entradas'].get(key)
+        
+        if entrada is None:
+            entrada = _entrada_do_snapshot(key, config['query'], versao)
+            if entrada is not None:
+                with cache['trava']:
+                    entrada = cache['entradas'].setdefault(key, entrada)
+                do_snapshot += 1
+        
+        if entrada is None:
+            pendentes[key] = (config, versao)
+        elif degradado:
+            _registrar_acerto(key, entrada, 'degradado')
+        elif _precisa_renovar(entrada, versao, agora, ttl_consulta(key)):
+            # Serve a versão anterior e renova sem bloquear a sessão
+            agendar_renovacao(_engine, key, versao)
+            _registrar_acerto(key, entrada, 'stale')
+        else:
+            _registrar_acerto(key, entrada, 'snapshot' if entrada['origem'] == 'snapshot' else 'hit')
+    
+    if do_snapshot:
+        st.sidebar.caption(f"💾 {do_snapshot} tabelas servidas do snapshot local")
+    
+    if pendentes and not degradado:
+        # Testar conexão
+        try:
+            with _engine.connect() as conn:
+                st.sidebar.success(f"✅ Conexão {'Impala' if BACKEND_SQL == 'impala' else BACKEND_SQL} OK!")
+        except Exception as e:
+            st.sidebar.error(f"❌ Falha na conexão: {str(e)[:100]}")
+            abrir_disjuntor(_engine, f"falha na conexão: {str(e)[:200]}")
+            degradado = True
+    
+    if pendentes and not degradado:
+        progress_bar = st.sidebar.progress(0)
+        status_text = st.sidebar.empty()
+        
+        total = len(pendentes)
+        status_text.text(f"📥 Carregando {total} tabelas ({MAX_CONSULTAS_PARALELAS} em paralelo)...")
+        
+        # Consultas independentes: pool limitado de threads sobre o mesmo engine.
+        # A UI só é atualizada nesta thread, conforme cada consulta termina.
+        with ThreadPoolExecutor(max_workers=min(MAX_CONSULTAS_PARALELAS, total)) as executor:
+            # Submissão na ordem de prioridade do registro
+            futuros = {
+                executor.submit(_executar_consulta_tabela, _engine, key): key
+                for key in ordenar_consultas(pendentes)
+            }
+            
+            for concluidas, futuro in enumerate(as_completed(futuros), start=1):
+                key = futuros[futuro]
+                config, versao = pendentes[key]
+                
+                try:
+                    df, divergencias, memoria = futuro.result()
+                    entrada = {
+                        'versao': versao, 'df': df, 'carregado_em': datetime.now(),
+                        'origem': 'impala', 'memoria': memoria, 'divergencias': divergencias
+                    }
+                    salvar_snapshot_tabela(key, config['query'], df, versao, avisar=True)
+                    
+                    # Log do tamanho carregado
+                    status_text.text(f"✅ {key} ({config['tipo']}): {len(df):,} registros ({memoria['depois_mb']:.1f} MB)")
+                    
+                except Exception as e:
+                    st.sidebar.warning(f"⚠️ Erro em {key}: {str(e)[:80]}")
+                    # Nova tentativa em segundo plano após VERSAO_TTL
+                    entrada = {
+                        'versao': versao, 'df': pd.DataFrame(), 'carregado_em': datetime.now(),
+                        'origem': 'erro', 'memoria': None, 'divergencias': [],
+                        'tentar_apos': datetime.now() + timedelta(seconds=VERSAO_TTL)
+                    }
+                
+                with cache['trava']:
+                    cache['entradas'][key] = entrada
+                
+                progress_bar.progress(concluidas / total)
+        
+        progress_bar.empty()
+        status_text.empty()
+    
+    # Manter a ordem declarada em tabelas_config. Cópia rasa: colunas
+    # adicionadas pelas páginas não alteram o cache compartilhado.
+    with cache['trava']:
+        dados = {
+            key: cache['entradas'][key]['df'].copy(deep=False)
+            for key in tabelas_config if key in cache['entradas']
+        }
+    
+    return dados
+
+def exibir_resumo_carga(tabelas):
+    """Resumo na sidebar das tabelas do sistema usadas nesta execução."""
+    if not tabelas:
+        return
+    
+    cache = _cache_tabelas_sistema()
+    with cache['trava']:
+        entradas = {key: cache['entradas'][key] for key in TABELAS_CONFIG
+                    if key in tabelas and key in cache['entradas']}
+    if not entradas:
+        return
+    
+    relatorio_memoria = {key: e['memoria'] for key, e in entradas.items() if e['memoria']}
+    divergencias_schema = {key: e['divergencias'] for key, e in entradas.items() if e['divergencias']}
+    
+    if relatorio_memoria:
+        with st.sidebar.expander("🗜️ Memória por tabela"):
+            df_memoria = pd.DataFrame.from_dict(relatorio_memoria, orient='index')
+            antes = df_memoria['antes_mb'].sum()
+            depois = df_memoria['depois_mb'].sum()
+            st.caption(f"Compactação: {antes:.2f} MB → {depois:.2f} MB "
+                       f"({(1 - depois / antes) * 100 if antes else 0:.0f}% menor)")
+            st.dataframe(
+                df_memoria[['antes_mb', 'depois_mb', 'reducao_pct']].round(2),
+                use_container_width=True
+            )
+    
+    if divergencias_schema:
+        with st.sidebar.expander(f"⚠️ Divergências de schema ({len(divergencias_schema)})"):
+            for key, divergencias in divergencias_schema.items():
+                st.caption(f"**{key}:** " + "; ".join(divergencias))
+    
+    # Resumo do carregamento
+    frames = [e['df'] for e in entradas.values() if not e['df'].empty]
+    total_registros = sum(len(df) for df in frames)
+    total_mem = sum(df.memory_usage(deep=True).sum() / 1024 / 1024 for df in frames)
+    
+    st.sidebar.success(f"✅ {len(entradas)} tabelas · {total_registros:,} registros ({total_mem:.1f} MB)")
+    
+    # Indicador de versão e idade dos dados
+    agora = datetime.now()
+    versao_dados = _hash_consulta('|'.join(str(e['versao']) for e in entradas.values()))[:8]
+    carga_mais_antiga = min(e['carregado_em'] for e in entradas.values())
+    idade_min = (agora - carga_mais_antiga).total_seconds() / 60
+    st.sidebar.caption(
+        f"🔖 Versão dos dados: `{versao_dados}` · carga mais antiga "
+        f"{carga_mais_antiga.strftime('%d/%m %H:%M')} (há {idade_min:.0f} min)"
+    )
+    
+    renovando = tabelas_em_renovacao() & set(entradas)
+    if renovando:
+        st.sidebar.info(f"🔄 Atualizando {len(renovando)} tabela(s) em segundo plano; "
+                        f"os dados atuais seguem disponíveis.")
+    falhas = [key for key, e in entradas.items() if e.get('erro_renovacao')]
+    if falhas:
+        st.sidebar.caption(f"⚠️ Última atualização falhou: {', '.join(falhas)}")
+    
+    with st.sidebar.expander("🔖 Versões por tabela"):
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    'tabela': key,
+                    'versao': (e['versao'] or 'anterior')[:10],
+                    'origem': e['origem'],
+                    'carregado_em': e['carregado_em'].strftime('%d/%m %H:%M'),
+                    'idade_min': round((agora - e['carregado_em']).total_seconds() / 60),
+                    'atualizando': key in renovando
+                }
+                for key, e in entradas.items()
+            ]),
+            use_container_width=True,
+            hide_index=True
+        )
+
+def exibir_aviso_modo_degradado(tabelas, pedidas=()):
+    """Aviso, no topo da página, de que os dados vêm do último snapshot e de quando são."""
+    estado = estado_disjuntor()
+    if estado['aberto_em'] is None:
+        return
+    
+    cache = _cache_tabelas_sistema()
+    with cache['trava']:
+        cargas = [cache['entradas'][key]['carregado_em'] for key in tabelas if key in cache['entradas']]
+    
+    texto = (f"⚠️ **Modo degradado** desde {estado['aberto_em'].strftime('%d/%m %H:%M')}: "
+             f"o banco de dados está indisponível ({estado['motivo']}).")
+    if cargas:
+        mais_antiga = min(cargas)
+        horas = (datetime.now() - mais_antiga).total_seconds() / 3600
+        idade = f"{horas:.1f} h" if horas >= 2 else f"{horas * 60:.0f} min"
+        texto += (f" Os dados exibidos são do último snapshot local, de "
+                  f"{mais_antiga.strftime('%d/%m/%Y %H:%M')} (há {idade}).")
+    faltando = [key for key in pedidas if key in TABELAS_CONFIG and key not in tabelas]
+    if faltando:
+        texto += f" Sem snapshot: {', '.join(faltando)}."
+    texto += (f" A conexão é testada a cada {INTERVALO_SONDA_DISJUNTOR} s e o painel "
+              f"volta ao normal sozinho.")
+    st.warning(texto)
+
+class DadosSistema(Mapping):
+    """Tabelas de TABELAS_CONFIG com carregamento no primeiro acesso.
+    
+    As páginas continuam usando dados.get(key, pd.DataFrame()); só as tabelas
+    efetivamente lidas são consultadas.
+    """
+    
+    def __init__(self, engine):
+        self._engine = engine
+        self._tabelas = {}
+    
+    def carregar(self, keys):
+        """Carrega em paralelo as chaves ainda não lidas. Retorna False se alguma falhou."""
+        pendentes = [key for key in keys if key in TABELAS_CONFIG and key not in self._tabelas]
+        if pendentes:
+            self._tabelas.update(carregar_dados_sistema(self._engine, pendentes))
+        return all(key in self._tabelas for key in keys if key in TABELAS_CONFIG)
+    
+    def carregadas(self):
+        """Tabelas já lidas nesta execução, sem disparar novas consultas."""
+        return dict(self._tabelas)
+    
+    def __getitem__(self, key):
+        if key not in TABELAS_CONFIG:
+            raise KeyError(key)
+        if not self.carregar([key]):
+            raise KeyError(key)
+        return self._tabelas[key]
+    
+    def __contains__(self, key):
+        return key in TABELAS_CONFIG
+    
+    def __iter__(self):
+        return iter(TABELAS_CONFIG)
+    
+    def __len__(self):
+        return len(TABELAS_CONFIG)
+
+# =============================================================================
+# 5.1. SNAPSHOT EM DISCO (PARQUET)
+# =============================================================================
+
+# Cada tabela de tabelas_config é gravada em Parquet; o manifesto guarda o
+# instante da carga, o hash da consulta e a versão das tabelas de origem.
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'.fisca_snapshot{SUFIXO_BACKEND}')
+SNAPSHOT_MANIFESTO = os.path.join(SNAPSHOT_DIR, 'manifesto.json')
+
+@st.cache_resource
+def _trava_snapshot():
+    """Trava do processo para leitura/escrita do manifesto."""
+    return threading.Lock()
+
+def _hash_consulta(query):
+    """Hash da consulta normalizada (ignora espaços e quebras de linha)."""
+    return hashlib.sha256(' '.join(query.split()).encode('utf-8')).hexdigest()[:16]
+
+def _hash_schema(key):
+    """Hash do schema declarado da tabela (snapshot antigo não serve se o schema mudou)."""
+    schema = json.dumps(SCHEMAS_TABELAS.get(key), sort_keys=True)
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()[:16]
+
+def _ler_manifesto():
+    """Lê o manifesto do snapshot (vazio se não existir ou estiver corrompido)."""
+    try:
+        with open(SNAPSHOT_MANIFESTO, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'tabelas': {}}
+
+def _escrever_json(caminho, conteudo):
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(conteudo, f, indent=2, ensure_ascii=False)
+
+def _gravar_atomico(caminho, escrever):
+    """Grava em arquivo temporário e troca pelo definitivo (nunca deixa arquivo pela metade)."""
+    tmp = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        escrever(tmp)
+        os.replace(tmp, caminho)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+@contextmanager
+def _travar_manifesto(trava, caminho):
+    """Trava a leitura-alteração-gravação de um manifesto entre threads e processos.
+    
+    A trava do processo vem antes do flock em `<manifesto>.lock`; sem fcntl
+    (Windows) ou sem acesso ao diretório, vale só a trava do processo.
+    """
+    with trava:
+        arquivo = None
+        if fcntl is not None:
+            try:
+                arquivo = open(f"{caminho}.lock", 'a')
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+            except OSError:
+                if arquivo is not None:
+                    arquivo.close()
+                arquivo = None
+        try:
+            yield
+        finally:
+            if arquivo is not None:
+                fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+                arquivo.close()
+
+def ler_snapshot_tabela(key, query, versao=None):
+    """Retorna (df, carregado_em) do snapshot se válido para a consulta, senão None.
+    
+    Com versao informada, o snapshot só serve se foi gravado a partir da mesma
+    versão das tabelas de origem.
+    """
+    with _trava_snapshot():
+        entrada = _ler_manifesto()['tabelas'].get(key)
+    
+    if not entrada or entrada.get('hash_consulta') != _hash_consulta(query):
+        return None
+    if entrada.get('hash_schema') != _hash_schema(key):
+        return None
+    if versao is not None and entrada.get('versao') != versao:
+        return None
+    
+    carregado_em = datetime.fromisoformat(entrada['carregado_em'])
+    
+    try:
+        df = pd.read_parquet(os.path.join(SNAPSHOT_DIR, entrada['arquivo']))
+    except Exception:
+        return None
+    
+    return df, carregado_em
+
+def salvar_snapshot_tabela(key, query, df, versao=None, avisar=False):
+    """Grava a tabela em Parquet e atualiza o manifesto. Falhas não interrompem a carga.
+    
+    avisar=True mostra a falha na sidebar (só na thread da sessão).
+    """
+    arquivo = f"{key}.parquet"
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        _gravar_atomico(
+            os.path.join(SNAPSHOT_DIR, arquivo),
+            lambda tmp: df.to_parquet(tmp, index=False)
+        )
+        with _travar_manifesto(_trava_snapshot(), SNAPSHOT_MANIFESTO):
+            manifesto = _ler_manifesto()
+            manifesto['tabelas'][key] = {
+                'arquivo': arquivo,
+                'carregado_em': datetime.now().isoformat(timespec='seconds'),
+                'hash_consulta': _hash_consulta(query),
+                'hash_schema': _hash_schema(key),
+                'versao': versao,
+                'registros': len(df)
+            }
+            _gravar_atomico(SNAPSHOT_MANIFESTO, lambda tmp: _escrever_json(tmp, manifesto))
+        return True
+    except Exception as e:
+        if avisar:
+            st.sidebar.caption(f"⚠️ Snapshot de {key} não gravado: {str(e)[:60]}")
+        return False
+
+# =============================================================================
+# 5.2. SCHEMA DAS TABELAS DO SISTEMA
+# =============================================================================
+
+# Tipos aceitos no schema e o dtype pandas correspondente
+TIPOS_SCHEMA = {
+    'int': 'Int64',          # inteiro com suporte a nulos
+    'float': 'float64',
+    'decimal': 'float64',    # DECIMAL do Impala chega como objeto Decimal
+    'str': 'string',
+    'category': 'category',
+    'date': 'datetime64[ns]'
+}
+
+# Colunas declaradas por chave de tabelas_config (ou consulta do registro, no
+# caso do ITCMD). Colunas fora do schema são mantidas como vieram e
+# reportadas como divergência.
+_SCHEMA_METRICAS_BASE = {
+    'ano': 'int',
+    'qtd_fiscalizacoes': 'int',
+    'qtd_empresas_unicas': 'int',
+    'qtd_infracoes': 'int',
+    'qtd_nfs': 'int',
+    'valor_total_infracoes': 'decimal',
+    'valor_total_nfs': 'decimal',
+    'valor_total_lancado': 'decimal',
+    'media_dias_infracao_nf': 'float',
+    'taxa_conversao_infracao_nf': 'float'
+}
+
+SCHEMAS_TABELAS = {
+    'dashboard_executivo': {
+        'ano': 'int',
+        'qtd_infracoes_lavradas': 'int',
+        'qtd_canceladas': 'int',
+        'qtd_regularizadas_sem_nf': 'int',
+        'empresas_fiscalizadas': 'int',
+        'qtd_nfs_emitidas': 'int',
+        'qtd_afres_ativos': 'int',
+        'valor_total_infracoes': 'decimal',
+        'valor_total_nfs': 'decimal',
+        'media_dias_infracao_nf': 'float',
+        'media_infracoes_por_afre': 'float',
+        'taxa_efetividade_fiscal': 'float'
+    },
+    'analise_estados': {
+        'estado_documento': 'category',
+        'status_normalizado': 'category',
+        'eh_valida': 'int',
+        'eh_regularizada_sem_nf': 'int',
+        'qtd': 'int',
+        'com_nf': 'int',
+        'valor_total': 'decimal',
+        'valor_medio': 'decimal'
+    },
+    'resumo_conversoes': {
+        'ano': 'int',
+        'total_infracoes': 'int',
+        'infracoes_validas': 'int',
+        'canceladas': 'int',
+        'com_nf': 'int',
+        'regularizadas_sem_nf': 'int',
+        'taxa_conversao_formal': 'float',
+        'taxa_efetividade_fiscal': 'float'
+    },
+    'metricas_gerencia': {
+        'gerfe': 'str',
+        **_SCHEMA_METRICAS_BASE
+    },
+    'metricas_ges': {
+        'nm_ges': 'str',
+        **_SCHEMA_METRICAS_BASE,
+        'qtd_regularizadas_sem_nf': 'int',
+        'taxa_efetividade_fiscal': 'float'
+    },
+    'distribuicao_empresas_ges': {
+        'nm_ges': 'str',
+        'qtd_empresas': 'int',
+        'percentual': 'float'
+    },
+    'metricas_cnae': {
+        'cnae_secao': 'str',
+        'cnae_secao_descricao': 'str',
+        'cnae_divisao': 'str',
+        'cnae_divisao_descricao': 'str',
+        **_SCHEMA_METRICAS_BASE,
+        'valor_imposto': 'decimal',
+        'valor_multa': 'decimal',
+        'valor_medio_infracao': 'decimal',
+        'valor_medio_nf': 'decimal'
+    },
+    'metricas_municipio': {
+        'municipio': 'str',
+        'uf': 'category',
+        **_SCHEMA_METRICAS_BASE
+    },
+    'ranking_infracoes': {
+        'ano': 'int',
+        'codigo_infracao': 'str',
+        'descricao_infracao': 'str',
+        'tipo_infracao_descricao': 'str',
+        'qtd_ocorrencias': 'int',
+        'qtd_empresas': 'int',
+        'valor_total': 'decimal',
+        'valor_medio': 'decimal'
+    },
+    'metricas_afre': {
+        'ano': 'int',
+        'matricula_afre': 'str',
+        'nome_afre': 'str',
+        'meses_ativos': 'int',
+        'qtd_infracoes': 'int',
+        'qtd_nfs': 'int',
+        'nfs_por_mes': 'float',
+        'taxa_conversao_infracao_nf': 'float',
+        'valor_total_lancado': 'decimal'
+    },
+    'empresas_resumo': {
+        'cnpj': 'str',
+        'nm_razao_social': 'str',
+        'municipio': 'str',
+        'regime_tributario': 'category'
+    },
+    'scores_resumo': {
+        'classificacao_efetividade': 'category',
+        'qtd': 'int',
+        'score_medio': 'float',
+        'valor_medio': 'decimal'
+    },
+    'fiscalizacoes_stats': {
+        'total_fiscalizacoes': 'int',
+        'total_empresas': 'int',
+        'total_nfs': 'int',
+        'fiscalizacoes_com_nf': 'int',
+        'total_ciclos_completos': 'int',
+        'valor_medio_infracao': 'decimal',
+        'media_dias_ate_nf': 'float',
+        'fiscalizacoes_validas': 'int',
+        'fiscalizacoes_canceladas': 'int',
+        'fiscalizacoes_regularizadas_sem_nf': 'int'
+    },
+    'opcoes_filtros': {
+        'ano': 'int',
+        'gerfe': 'str'
+    },
+    # Dimensões (seção 5.6): a chave é texto, como nas tabelas que elas enriquecem
+    'dim_infracoes': {
+        'cd_infracao': 'str',
+        'de_infracao': 'str',
+        'cd_tipo_infracao': 'str',
+        'de_tipo_infracao': 'str',
+        'nm_tributo': 'str',
+        'vl_multa': 'decimal'
+    },
+    'dim_afres': {
+        'matricula_afre': 'str',
+        'nome_afre': 'str',
+        'cargo': 'str'
+    },
+    'dim_cnae': {
+        'cd_cnae': 'str',
+        'de_cnae': 'str',
+        'cd_secao': 'str',
+        'de_secao': 'str',
+        'cd_divisao': 'str',
+        'de_divisao': 'str'
+    },
+    'dim_municipios': {
+        'cd_munic': 'str',
+        'nm_munic': 'str'
+    },
+    # Tabelas brutas do ITCMD: identificadores e códigos como texto (iguais
+    # entre tabelas para cruzamentos), valores numéricos e datas já convertidos
+    'itcmd_of': {
+        'id_documento': 'str',
+        'numero_documento': 'str',
+        'nu_of': 'str',
+        'dt_documento': 'date',
+        'data_emissao': 'date',
+        'nm_estado': 'str',
+        'situacao': 'str',
+        'cd_usuario_emitente': 'str',
+        'tx_recomendacoes': 'str',
+        'dt_inicio': 'date',
+        'dt_fim': 'date',
+        'tx_motivacao_of': 'str',
+        'nm_local_execucao': 'str',
+        'nm_gerencia': 'str',
+        'nm_local_emissao': 'str',
+        'nu_mat_emitente': 'str',
+        'nu_mat_coordenador': 'str',
+        'nm_origem': 'str',
+        'dt_alteracao_ods': 'date',
+        'cd_ges': 'str',
+        'nm_ges': 'str',
+        'ano': 'int'
+    },
+    'itcmd_dde': {
+        'nu_declaracao': 'str',
+        'nu_of': 'str',
+        'nu_ie': 'str',
+        'nm_razao_social': 'str',
+        'cd_ges': 'str',
+        'cd_gerfe': 'str',
+        'cd_munic': 'str',
+        'cd_motivo': 'str',
+        'cd_estado_conta': 'str',
+        'dt_entrega': 'date',
+        'vl_declarado': 'decimal',
+        'vl_data_declaracao': 'decimal',
+        'vl_total_saldo': 'decimal',
+        'vl_pago': 'decimal',
+        'vl_parc_pago': 'decimal',
+        'vl_parc_saldo': 'decimal',
+        'vl_dva_total': 'decimal',
+        'vl_dva_saldo': 'decimal',
+        'vl_dva_pago': 'decimal',
+        'dt_ultima_atualizacao': 'date',
+        'ano': 'int'
+    },
+    'itcmd_notif': {
+        'nu_notificacao_fiscal': 'str',
+        'nu_of': 'str',
+        'nu_ie': 'str',
+        'nu_cpf': 'str',
+        'nu_cnpj': 'str',
+        'nm_razao_social': 'str',
+        'cd_gerfe': 'str',
+        'cd_ges': 'str',
+        'cd_munic': 'str',
+        'cd_infracao': 'str',
+        'cd_edo_det_conta': 'str',
+        'nm_estado': 'str',
+        'dt_documento': 'date',
+        'vl_total': 'decimal',
+        'vl_pago': 'decimal',
+        'vl_parc_pago': 'decimal',
+        'vl_parc_saldo': 'decimal',
+        'vl_recl_tot': 'decimal',
+        'vl_dva_total': 'decimal',
+        'vl_dva_saldo': 'decimal',
+        'vl_dva_pago': 'decimal',
+        'dt_ultima_atualizacao': 'date',
+        'dt_ciencia': 'date',
+        'ano': 'int'
+    },
+    'itcmd_tifdp': {
+        'nu_infr_fiscal': 'str',
+        'nu_notificacao_gerada': 'int',
+        'nu_of': 'str',
+        'nu_ie': 'str',
+        'nu_cpf': 'str',
+        'nu_cnpj': 'str',
+        'nm_razao_social': 'str',
+        'cd_ges': 'str',
+        'cd_gerfe': 'str',
+        'cd_munic': 'str',
+        'cd_infracao': 'str',
+        'nm_estado': 'str',
+        'dt_documento': 'date',
+        'vl_apurado': 'decimal',
+        'vl_pago': 'decimal',
+        'vl_parc_pago': 'decimal',
+        'vl_parc_saldo': 'decimal',
+        'vl_convertido_notif': 'decimal',
+        'vl_cancelado': 'decimal',
+        'vl_dva_total': 'decimal',
+        'vl_dva_saldo': 'decimal',
+        'vl_dva_pago': 'decimal',
+        'dt_ultima_atualizacao': 'date',
+        'dt_ciencia': 'date',
+        'ano': 'int'
+    },
+    'itcmd_afre_periodo': {
+        'cd_matricula': 'str',
+        'nu_ano_ref': 'int',
+        'nu_per_ref': 'int',
+        'qt_dias_ativa': 'int'
+    },
+    'itcmd_contribuintes': {
+        'nu_ie': 'str',
+        'nu_cnpj': 'str',
+        'nm_razao_social': 'str',
+        'cd_cnae': 'str',
+        'de_cnae': 'str',
+        'de_secao': 'str',
+        'nm_enq_empresa': 'str',
+        'nm_munic': 'str'
+    },
+    'itcmd_acompanhamentos': {
+        'id_documento_os': 'str',
+        'nu_documento_of': 'str',
+        'nm_estado_os': 'str',
+        'dt_documento_os': 'date',
+        'de_motivo_os': 'str'
+    },
+    'itcmd_termos_encerramento': {
+        'nu_termo_encerramento': 'str',
+        'os': 'str',
+        'nm_estado': 'str',
+        'dt_documento': 'date',
+        'dt_encerramento': 'date'
+    },
+    # Ciclo de vida das OFs (seção 6.2): uma linha por OF, do servidor
+    # (itcmd_agg_ciclo) ou montada no cliente (montar_ciclo_ofs)
+    'itcmd_agg_ciclo': {
+        'nu_of': 'str',
+        'ano': 'int',
+        'dt_of': 'date',
+        'nm_estado': 'str',
+        'qtd_dde': 'int',
+        'valor_dde': 'decimal',
+        'pago_dde': 'decimal',
+        'primeira_dde': 'date',
+        'ultima_dde': 'date',
+        'qtd_notif': 'int',
+        'valor_notif': 'decimal',
+        'pago_notif': 'decimal',
+        'primeira_notif': 'date',
+        'ultima_notif': 'date',
+        'qtd_tifdp': 'int',
+        'valor_tifdp': 'decimal',
+        'pago_tifdp': 'decimal',
+        'primeira_tifdp': 'date',
+        'ultima_tifdp': 'date',
+        'qtd_acomp': 'int',
+        'ultimo_acomp': 'date',
+        'qtd_termos': 'int',
+        'dt_encerramento': 'date'
+    }
+}
+
+def aplicar_schema(df, key):
+    """Converte as colunas de uma tabela conforme SCHEMAS_TABELAS.
+    
+    Retorna (df, divergencias), onde divergencias lista colunas ausentes,
+    não declaradas ou com valores que não couberam no tipo declarado.
+    """
+    schema = SCHEMAS_TABELAS.get(key)
+    if schema is None:
+        return df, [f"sem schema declarado para {key}"]
+    
+    divergencias = []
+    
+    ausentes = [col for col in schema if col not in df.columns]
+    if ausentes:
+        divergencias.append(f"ausentes: {', '.join(ausentes)}")
+    
+    extras = [col for col in df.columns if col not in schema]
+    if extras:
+        divergencias.append(f"não declaradas: {', '.join(extras)}")
+    
+    presentes = {col: tipo for col, tipo in schema.items() if col in df.columns}
+    dtypes = {col: TIPOS_SCHEMA[tipo] for col, tipo in presentes.items() if tipo != 'date'}
+    datas = [col for col, tipo in presentes.items() if tipo == 'date']
+    
+    # Conversão em um único passo; coluna a coluna só se algum valor não couber
+    try:
+        df = df.astype(dtypes)
+    except (TypeError, ValueError):
+        for col, dtype in dtypes.items():
+            try:
+                df[col] = df[col].astype(dtype)
+            except (TypeError, ValueError):
+                if presentes[col] not in ('int', 'float', 'decimal'):
+                    raise
+                convertido = pd.to_numeric(df[col], errors='coerce')
+                perdidos = int(convertido.isna().sum() - df[col].isna().sum())
+                if presentes[col] == 'int':
+                    convertido = convertido.round()
+                df[col] = convertido.astype(dtype)
+                divergencias.append(f"{col} ({presentes[col]}): {perdidos:,} valores inválidos")
+    
+    for col in datas:
+        df[col] = pd.to_datetime(df[col], errors='coerce')
+    
+    return df, divergencias
+
+# =============================================================================
+# 5.3. COMPACTAÇÃO DE MEMÓRIA
+# =============================================================================
+
+# Texto vira category quando há no máximo esta fração de valores distintos
+LIMITE_CARDINALIDADE_CATEGORIA = 0.5
+# Float64 vira float32 apenas se valores e total se mantêm nesta precisão (centavos)
+CASAS_DECIMAIS_FLOAT32 = 2
+
+def _float32_preserva(serie):
+    """Guarda de precisão: float32 mantém cada valor e a soma em CASAS_DECIMAIS_FLOAT32."""
+    reduzida = serie.astype('float32')
+    valores_ok = (reduzida.astype('float64').round(CASAS_DECIMAIS_FLOAT32)
+                  .eq(serie.round(CASAS_DECIMAIS_FLOAT32)) | serie.isna()).all()
+    if not valores_ok:
+        return None
+    if round(float(reduzida.sum()), CASAS_DECIMAIS_FLOAT32) != round(float(serie.sum()), CASAS_DECIMAIS_FLOAT32):
+        return None
+    return reduzida
+
+def compactar_dataframe(df):
+    """Reduz a memória de um DataFrame sem alterar seus valores.
+    
+    Textos repetidos viram category, contadores vão para o menor inteiro que
+    comporta os valores (no mínimo 32 bits) e floats vão para float32 quando a guarda de precisão
+    permite. Retorna (df, relatorio) com a memória antes/depois em MB.
+    """
+    antes = float(df.memory_usage(deep=True).sum())
+    
+    if not df.empty:
+        df = df.copy()
+        for col in df.columns:
+            serie = df[col]
+            
+            if serie.dtype == 'object' or pd.api.types.is_string_dtype(serie.dtype):
+                if serie.nunique(dropna=True) <= LIMITE_CARDINALIDADE_CATEGORIA * len(serie):
+                    categorica = serie.astype('category')
+                    if categorica.memory_usage(deep=True) < serie.memory_usage(deep=True):
+                        df[col] = categorica
+            
+            elif pd.api.types.is_integer_dtype(serie.dtype):
+                reduzida = pd.to_numeric(serie, downcast='integer')
+                # Piso de 32 bits: somas e produtos em Int8/Int16 estouram sem aviso
+                if reduzida.dtype.itemsize < 4:
+                    nulavel = pd.api.types.is_extension_array_dtype(reduzida.dtype)
+                    reduzida = reduzida.astype('Int32' if nulavel else 'int32')
+                df[col] = reduzida
+            
+            elif pd.api.types.is_float_dtype(serie.dtype) and serie.dtype != 'float32':
+                reduzida = _float32_preserva(serie)
+                if reduzida is not None:
+                    df[col] = reduzida
+    
+    depois = float(df.memory_usage(deep=True).sum())
+    relatorio = {
+        'antes_mb': antes / 1024 / 1024,
+        'depois_mb': depois / 1024 / 1024,
+        'reducao_pct': (1 - depois / antes) * 100 if antes else 0.0
+    }
+    return df, relatorio
+
+# =============================================================================
+# 5.4. VERSÕES DAS TABELAS DE ORIGEM
+# =============================================================================
+
+# Intervalo entre sondagens de versão (a sondagem é barata: SHOW TABLE STATS)
+VERSAO_TTL = 300
+# Teto de validade dos caches sob demanda mesmo sem mudança de versão
+CACHE_TTL_MAXIMO = 24 * 3600
+
+def tabelas_origem(query):
+    """Tabelas fisca_*/fis_* lidas por uma consulta (schema.tabela).
+    
+    Views como vw_ods_contrib não têm estatísticas e ficam de fora; o cache
+    delas é limitado por CACHE_TTL_MAXIMO.
+    """
+    return sorted(set(re.findall(r'\b\w+\.(?:fisca|fis)_\w+', query)))
+
+def _sondar_versao(_engine, tabela):
+    """Versão de uma tabela: hash das estatísticas (arquivos, tamanho, linhas) ou None."""
+    if BACKEND_SQL != 'impala':
+        return versao_arquivo_local(tabela)
+    try:
+        with _engine.connect() as conn:
+            linhas = conn.exec_driver_sql(f"SHOW TABLE STATS {tabela}").fetchall()
+        return _hash_consulta(repr([tuple(linha) for linha in linhas]))
+    except Exception:
+        return None
+
+def sondar_versoes(_engine, tabelas):
+    """Mapa tabela -> versão, sondado em paralelo (sem cache)."""
+    if not tabelas:
+        return {}
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(MAX_CONSULTAS_PARALELAS, len(tabelas))) as executor:
+        versoes = dict(zip(tabelas, executor.map(lambda t: _sondar_versao(_engine, t), tabelas)))
+    
+    falhas = [tabela for tabela, versao in versoes.items() if versao is None]
+    registrar_metrica('sondagem_versoes', 'miss', time.perf_counter() - inicio, linhas=len(tabelas),
+                      erro=f"sem estatísticas: {', '.join(falhas)}" if falhas else None)
+    return versoes
+
+@st.cache_data(ttl=VERSAO_TTL, show_spinner=False)
+def obter_versoes_tabelas(_engine, tabelas):
+    """Mapa tabela -> versão, renovado a cada VERSAO_TTL."""
+    return sondar_versoes(_engine, tabelas)
+
+def versao_combinada(versoes, tabelas, ttl):
+    """Versão de um conjunto de tabelas de origem.
+    
+    Se alguma versão for desconhecida, usa a janela de tempo atual de `ttl`
+    segundos (TTL da consulta no registro), o que reproduz a expiração por TTL.
+    """
+    partes = [versoes.get(tabela) for tabela in tabelas]
+    if not partes or any(parte is None for parte in partes):
+        return f"ttl-{int(time.time() // ttl)}"
+    return _hash_consulta('|'.join(partes))
+
+def versao_consulta(_engine, *nomes):
+    """Versão das tabelas de origem de consultas do registro (argumento de cache)."""
+    tabelas = tuple(sorted({
+        tabela for nome in nomes
+        for tabela in tabelas_origem(REGISTRO_CONSULTAS[nome]['sql'].replace('{database}', DATABASE))
+    }))
+    ttl = min(ttl_consulta(nome) for nome in nomes)
+    versoes = {} if modo_degradado() else obter_versoes_tabelas(_engine, tabelas)
+    return versao_combinada(versoes, tabelas, ttl)
+
+# =============================================================================
+# 5.5. RENOVAÇÃO EM SEGUNDO PLANO
+# =============================================================================
+
+# Tabelas sem versão conhecida são renovadas este tempo antes de completar o
+# TTL da consulta, para que nenhuma sessão encontre o cache expirado.
+ANTECEDENCIA_RENOVACAO = 2 * VERSAO_TTL
+
+@st.cache_resource
+def _renovador():
+    """Pool do processo para renovações e conjunto das chaves em andamento."""
+    return {
+        'executor': ThreadPoolExecutor(
+            max_workers=MAX_CONSULTAS_PARALELAS, thread_name_prefix='fisca-renovacao'
+        ),
+        'trava': threading.Lock(),
+        'em_andamento': set()
+    }
+
+def _entrada_do_snapshot(key, query, versao):
+    """Entrada de cache a partir do snapshot em disco, ou None.
+    
+    Um snapshot de outra versão também é aproveitado, com versao=None, para
+    ser servido enquanto a renovação roda.
+    """
+    snapshot = ler_snapshot_tabela(key, query, versao)
+    if snapshot is None:
+        snapshot, versao = ler_snapshot_tabela(key, query), None
+    if snapshot is None:
+        return None
+    
+    df, carregado_em = snapshot
+    return {
+        'versao': versao, 'df': df, 'carregado_em': carregado_em,
+        'origem': 'snapshot', 'memoria': None, 'divergencias': []
+    }
+
+def _precisa_renovar(entrada, versao, agora, ttl):
+    """Se a entrada em cache deve ser renovada para a versão atual."""
+    if entrada.get('tentar_apos') and agora < entrada['tentar_apos']:
+        return False
+    if entrada['origem'] == 'erro':
+        return True
+    if versao.startswith('ttl-'):
+        # Versão desconhecida: renovar pela idade, antes de expirar
+        idade = (agora - entrada['carregado_em']).total_seconds()
+        return idade >= max(ttl - ANTECEDENCIA_RENOVACAO, 0)
+    return entrada['versao'] != versao
+
+def _renovar_tabela(_engine, key, versao):
+    """Recarrega uma tabela e troca a entrada do cache (roda em thread do pool)."""
+    cache = _cache_tabelas_sistema()
+    renovador = _renovador()
+    query = TABELAS_CONFIG[key]['query']
+    
+    try:
+        df, divergencias, memoria = _executar_consulta_tabela(_engine, key)
+        salvar_snapshot_tabela(key, query, df, versao)
+        nova = {
+            'versao': versao, 'df': df, 'carregado_em': datetime.now(),
+            'origem': 'impala', 'memoria': memoria, 'divergencias': divergencias
+        }
+    except Exception as e:
+        # Mantém os dados anteriores e tenta de novo após VERSAO_TTL
+        with cache['trava']:
+            anterior = cache['entradas'].get(key)
+        if anterior is None:
+            return
+        nova = dict(anterior, erro_renovacao=str(e)[:200],
+                    tentar_apos=datetime.now() + timedelta(seconds=VERSAO_TTL))
+    finally:
+        with renovador['trava']:
+            renovador['em_andamento'].discard(key)
+    
+    # Troca atômica: sessões em andamento seguem com o DataFrame anterior
+    with cache['trava']:
+        cache['entradas'][key] = nova
+
+def _agendar_no_renovador(chave, funcao, *args):
+    """Submete funcao(*args) ao pool de renovação, se `chave` não estiver em andamento.
+    
+    A função é responsável por retirar a chave de em_andamento ao terminar.
+    """
+    renovador = _renovador()
+    with renovador['trava']:
+        if chave in renovador['em_andamento']:
+            return False
+        renovador['em_andamento'].add(chave)
+    renovador['executor'].submit(funcao, *args)
+    return True
+
+def agendar_renovacao(_engine, key, versao):
+    """Agenda a renovação de uma tabela, se ainda não houver uma em andamento."""
+    return _agendar_no_renovador(key, _renovar_tabela, _engine, key, versao)
+
+def tabelas_em_renovacao():
+    """Chaves com renovação em andamento."""
+    renovador = _renovador()
+    with renovador['trava']:
+        return set(renovador['em_andamento'])
+
+def verificar_renovacoes(_engine):
+    """Sonda as versões das tabelas em cache e agenda as que precisam de renovação."""
+    if modo_degradado():
+        return 0
+    cache = _cache_tabelas_sistema()
+    with cache['trava']:
+        entradas = dict(cache['entradas'])
+    if not entradas:
+        return 0
+    
+    origens = sorted({t for key in entradas for t in tabelas_origem(TABELAS_CONFIG[key]['query'])})
+    versoes = sondar_versoes(_engine, tuple(origens))
+    agora = datetime.now()
+    
+    agendadas = 0
+    for key, entrada in entradas.items():
+        versao = versao_combinada(versoes, tabelas_origem(TABELAS_CONFIG[key]['query']), ttl_consulta(key))
+        if _precisa_renovar(entrada, versao, agora, ttl_consulta(key)) and agendar_renovacao(_engine, key, versao):
+            agendadas += 1
+    return agendadas
+
+def _vigiar_tabelas():
+    """Laço da thread vigia: verifica as tabelas em cache a cada VERSAO_TTL.
+    
+    O engine é obtido a cada ciclo: depois de get_impala_engine.clear() o
+    anterior foi descartado e a vigia passa a usar o novo.
+    """
+    while True:
+        time.sleep(VERSAO_TTL)
+        try:
+            if modo_degradado():
+                continue
+            engine = get_impala_engine()
+            if engine is not None:
+                verificar_renovacoes(engine)
+        except Exception:
+            pass
+
+@st.cache_resource
+def _iniciar_vigia():
+    """Inicia, uma vez por processo, a thread que renova as tabelas antes de expirarem."""
+    vigia = threading.Thread(target=_vigiar_tabelas, name='fisca-vigia', daemon=True)
+    vigia.start()
+    return vigia
+
+# =============================================================================
+# 5.6. CACHE DE DIMENSÕES (INFRAÇÕES, AFRES, CNAE, MUNICÍPIOS)
+# =============================================================================
+
+# Nome da dimensão -> (consulta do grupo 'dimensao' do registro, coluna chave).
+# Cada dimensão é lida uma vez por processo, no primeiro uso, e renovada em
+# segundo plano quando passa do TTL da consulta no registro (6 h), sem seguir
+# a sondagem de versões das tabelas do sistema.
+DIMENSOES = {
+    'infracoes': ('dim_infracoes', 'cd_infracao'),
+    'afres': ('dim_afres', 'matricula_afre'),
+    'cnae': ('dim_cnae', 'cd_cnae'),
+    'municipios': ('dim_municipios', 'cd_munic')
+}
+
+def _chave_dimensao(codigos):
+    """Códigos como texto sem espaços; 4200201.0 (inteiro lido como float) vira '4200201'."""
+    codigos = pd.Series(codigos)
+    if pd.api.types.is_float_dtype(codigos):
+        codigos = codigos.astype('Int64')
+    return codigos.astype('string').str.strip()
+
+class Dimensao:
+    """Tabela de uma dimensão com índice de hash código -> linha.
+
+    Compartilhada entre sessões e nunca alterada: as consultas devolvem
+    Series novas, alinhadas ao índice dos códigos recebidos.
+    """
+
+    def __init__(self, nome, df, chave):
+        df = df.assign(**{chave: _chave_dimensao(df[chave])})
+        df = df[df[chave].notna()].drop_duplicates(chave, keep='last').reset_index(drop=True)
+        self.nome = nome
+        self.chave = chave
+        self.df = df
+        self.indice = pd.Index(df[chave])
+
+    def __len__(self):
+        return len(self.df)
+
+    def posicoes(self, codigos):
+        """Linha de cada código na dimensão (-1 se ausente)."""
+        return self.indice.get_indexer(_chave_dimensao(codigos))
+
+    def valores(self, codigos, coluna, posicoes=None):
+        """Coluna da dimensão para cada código (nulo se o código não existir)."""
+        if posicoes is None:
+            posicoes = self.posicoes(codigos)
+        if coluna not in self.df.columns:
+            valores = pd.array([pd.NA] * len(posicoes), dtype='string')
+        else:
+            valores = self.df[coluna].array.take(posicoes, allow_fill=True)
+        return pd.Series(valores, index=getattr(codigos, 'index', None), name=coluna)
+
+    def contem(self, codigos):
+        """Máscara dos códigos presentes na dimensão."""
+        return pd.Series(self.posicoes(codigos) >= 0, index=getattr(codigos, 'index', None))
+
+    def enriquecer(self, df, coluna, colunas):
+        """`df` com as `colunas` da dimensão, buscadas pelo código em df[coluna].
+
+        Equivale a um merge à esquerda, sem reordenar nem duplicar linhas.
+        """
+        posicoes = self.posicoes(df[coluna])
+        return df.assign(**{c: self.valores(df[coluna], c, posicoes) for c in colunas})
+
+@st.cache_resource
+def _cache_dimensoes():
+    """Cache do processo com a última carga de cada dimensão."""
+    return {'trava': threading.Lock(), 'entradas': {}}
+
+def _carregar_dimensao(_engine, nome):
+    """Lê uma dimensão e monta o índice. A janela do TTL entra na chave do cache
+    em disco, compartilhado entre processos (ver executar_consulta)."""
+    consulta, chave = DIMENSOES[nome]
+    versao = f"ttl-{int(time.time() // ttl_consulta(consulta))}"
+    df, _ = aplicar_schema(executar_consulta(_engine, consulta, versao=versao), consulta)
+    return {'dimensao': Dimensao(nome, df, chave), 'versao': versao,
+            'carregado_em': datetime.now(), 'origem': 'impala'}
+
+def _dimensao_vazia(nome):
+    consulta, chave = DIMENSOES[nome]
+    return Dimensao(nome, pd.DataFrame({coluna: pd.Series(dtype='string') for coluna in SCHEMAS_TABELAS[consulta]}), chave)
+
+def _renovar_dimensao(_engine, nome):
+    """Recarrega uma dimensão e troca a entrada do cache (roda em thread do pool)."""
+    cache = _cache_dimensoes()
+    renovador = _renovador()
+
+    try:
+        nova = _carregar_dimensao(_engine, nome)
+    except Exception as e:
+        # Mantém a dimensão anterior e tenta de novo após VERSAO_TTL
+        with cache['trava']:
+            anterior = cache['entradas'][nome]
+        nova = dict(anterior, erro_renovacao=str(e)[:200],
+                    tentar_apos=datetime.now() + timedelta(seconds=VERSAO_TTL))
+    finally:
+        with renovador['trava']:
+            renovador['em_andamento'].discard(f'dimensao:{nome}')
+
+    with cache['trava']:
+        cache['entradas'][nome] = nova
+
+def _dimensao_precisa_renovar(nome, entrada, agora):
+    if entrada.get('tentar_apos') and agora < entrada['tentar_apos']:
+        return False
+    if entrada['origem'] == 'erro':
+        return True
+    idade = (agora - entrada['carregado_em']).total_seconds()
+    return idade >= ttl_consulta(DIMENSOES[nome][0])
+
+def obter_dimensao(_engine, nome):
+    """Dimensão `nome` do cache do processo.
+
+    Só a primeira leitura no processo espera o banco; depois, a dimensão
+    vencida continua sendo servida enquanto a renovação roda no pool de
+    renovação. Se a primeira leitura falhar, as buscas devolvem nulos e nova
+    tentativa é feita em segundo plano após VERSAO_TTL.
+    """
+    if _engine is None:
+        return _dimensao_vazia(nome)
+
+    cache = _cache_dimensoes()
+    with cache['trava']:
+        entrada = cache['entradas'].get(nome)
+
+    if entrada is None:
+        try:
+            entrada = _carregar_dimensao(_engine, nome)
+        except Exception as e:
+            entrada = {'dimensao': _dimensao_vazia(nome), 'versao': None, 'carregado_em': datetime.now(),
+                       'origem': 'erro', 'erro_renovacao': str(e)[:200],
+                       'tentar_apos': datetime.now() + timedelta(seconds=VERSAO_TTL)}
+        with cache['trava']:
+            entrada = cache['entradas'].setdefault(nome, entrada)
+    elif not modo_degradado() and _dimensao_precisa_renovar(nome, entrada, datetime.now()):
+        _agendar_no_renovador(f'dimensao:{nome}', _renovar_dimensao, _engine, nome)
+
+    return entrada['dimensao']
+
+def resumo_dimensoes():
+    """Uma linha por dimensão carregada neste processo (para o diagnóstico)."""
+    cache = _cache_dimensoes()
+    with cache['trava']:
+        entradas = dict(cache['entradas'])
+    renovando = tabelas_em_renovacao()
+    agora = datetime.now()
+    return pd.DataFrame([
+        {
+            'dimensao': nome,
+            'consulta': DIMENSOES[nome][0],
+            'chave': DIMENSOES[nome][1],
+            'codigos': len(entrada['dimensao']),
+            'origem': entrada['origem'],
+            'carregado_em': entrada['carregado_em'].strftime('%d/%m %H:%M'),
+            'idade_min': round((agora - entrada['carregado_em']).total_seconds() / 60),
+            'atualizando': f'dimensao:{nome}' in renovando,
+            'erro': entrada.get('erro_renovacao')
+        }
+        for nome, entrada in entradas.items()
+    ])
+
+# =============================================================================
+# 6. FUNÇÕES DE CARREGAMENTO SOB DEMANDA
+# =============================================================================
+
+# O argumento `versao` (ver versao_consulta) entra na chave do cache: quando as
+# tabelas de origem mudam, a próxima chamada recarrega. A mesma versão segue para
+# o cache em disco (seção 4.5), que outros processos do host reaproveitam; por
+# isso o cache em memória de cada processo pode ficar limitado em entradas.
+MAX_ENTRADAS_SOB_DEMANDA = 64
+
+@st.cache_data(ttl=CACHE_TTL_MAXIMO, max_entries=MAX_ENTRADAS_SOB_DEMANDA)
+def carregar_empresa_detalhada(_engine, cnpj, versao=None):
+    """Carrega dados completos de uma empresa específica - SOB DEMANDA."""
+    try:
+        return executar_consulta(_engine, 'empresa_detalhada', versao=versao, cnpj=cnpj)
+    except Exception as e:
+        st.error(f"Erro ao carregar empresa: {str(e)[:100]}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=CACHE_TTL_MAXIMO, max_entries=MAX_ENTRADAS_SOB_DEMANDA)
+def carregar_fiscalizacoes_empresa(_engine, cnpj, versao=None):
+    """Carrega fiscalizações de uma empresa - SOB DEMANDA."""
+    try:
+        return executar_consulta(_engine, 'fiscalizacoes_empresa', versao=versao, cnpj=cnpj)
+    except Exception as e:
+        st.error(f"Erro ao carregar fiscalizações: {str(e)[:100]}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=CACHE_TTL_MAXIMO, max_entries=MAX_ENTRADAS_SOB_DEMANDA)
+def carregar_afres_fiscalizacao(_engine, id_documento, versao=None):
+    """Carrega AFREs de uma fiscalização - SOB DEMANDA."""
+    try:
+        return executar_consulta(_engine, 'afres_fiscalizacao', versao=versao, id_documento=id_documento)
+    except Exception as e:
+        st.error(f"Erro ao carregar AFREs: {str(e)[:100]}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=CACHE_TTL_MAXIMO, max_entries=MAX_ENTRADAS_SOB_DEMANDA)
+def carregar_scores_efetividade(_engine, limit=1000, versao=None):
+    """Carrega scores de efetividade - SOB DEMANDA."""
+    try:
+        return executar_consulta(_engine, 'scores_efetividade', versao=versao, limit=limit)
+    except Exception as e:
+        st.error(f"Erro ao carregar scores: {str(e)[:100]}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=CACHE_TTL_MAXIMO, max_entries=MAX_ENTRADAS_SOB_DEMANDA)
+def carregar_dataset_ml(_engine, versao=None):
+    """Carrega dataset completo para Machine Learning - SOB DEMANDA."""
+    try:
+        return executar_consulta(_engine, 'dataset_ml', versao=versao)
+    except Exception as e:
+        st.error(f"Erro ao carregar dataset ML: {str(e)[:100]}")
+        return pd.DataFrame()
+
+# =============================================================================
+# 6.1. FUNÇÕES DE CARREGAMENTO - SETORES (OF → DDE/NF/TIFDP → TERMOS)
+# =============================================================================
+
+# Cada setor é o conjunto de usuários emitentes das suas OFs
+# (cd_usuario_emitente). As consultas itcmd_* do registro recebem esses
+# emitentes como parâmetro e servem a qualquer setor; o ITCMD foi o primeiro.
+# Outros setores entram no secrets.toml, em [setores_of.<SIGLA>], com
+# emitentes = [...] e, opcionalmente, icone, titulo e descricao.
+def _definicao_setor(sigla, definicao):
+    """Definição de setor do secrets.toml com os campos opcionais preenchidos."""
+    return {
+        'emitentes': [str(e) for e in definicao['emitentes']],
+        'icone': definicao.get('icone', '🗂️'),
+        'titulo': definicao.get('titulo', f'{sigla} - Análise de Fiscalizações'),
+        'descricao': definicao.get('descricao', '')
+    }
+
+SETORES_OF = {
+    'ITCMD': {
+        'emitentes': ['9507248', '6172598'],
+        'icone': '📜',
+        'titulo': 'ITCMD - Análise de Fiscalizações',
+        'descricao': 'Imposto sobre Transmissão Causa Mortis e Doação'
+    },
+    **{sigla: _definicao_setor(sigla, definicao) for sigla, definicao in _secao_secrets('setores_of').items()}
+}
+
+def emitentes_setor(setor):
+    """Emitentes do setor, ordenados (entram na chave de cache dos carregadores)."""
+    return tuple(sorted(SETORES_OF[setor]['emitentes']))
+
+def carregar_setores(setores, carregar):
+    """{setor: carregar(setor)}, com os setores carregados em paralelo.
+    
+    As threads herdam o contexto da sessão, como em executar_grafo: o
+    cancelamento por rerun superado também alcança a carga dos setores. Um
+    setor que falhar vem como a exceção, registrada no histórico de métricas
+    como 'carga_setor'.
+    """
+    setores = list(setores)
+    if not setores:
+        return {}
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx is not None else None
+    
+    def tentar(setor):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        inicio = time.perf_counter()
+        try:
+            return carregar(setor)
+        except Exception as e:
+            registrar_metrica('carga_setor', 'miss', time.perf_counter() - inicio, erro=f"{setor}: {e}")
+            return e
+    
+    with ThreadPoolExecutor(max_workers=min(MAX_CONSULTAS_PARALELAS, len(setores)),
+                            thread_name_prefix='fisca-setores') as executor:
+        return dict(zip(setores, executor.map(tentar, setores)))
+
+# 'semijoin': o filtro por OFs vai ao servidor como IN (SELECT ...) e os nós não
+# esperam a lista de OFs; 'lotes': a lista vem ao cliente e volta em IN (...)
+# de até TAMANHO_LOTE_IN chaves. Se o semi-join falhar, o nó cai para lotes.
+FILTRO_CHAVES = _config('filtro_chaves', 'semijoin')
+
+# Chave do pacote -> consulta do registro
+TABELAS_ITCMD = {
+    'of_itcmd': 'itcmd_of',
+    'dde_itcmd': 'itcmd_dde',
+    'notif_itcmd': 'itcmd_notif',
+    'tifdp_itcmd': 'itcmd_tifdp',
+    'afre_periodo': 'itcmd_afre_periodo',
+    'contribuintes': 'itcmd_contribuintes',
+    'acompanhamentos': 'itcmd_acompanhamentos',
+    'termos_encerramento': 'itcmd_termos_encerramento'
+}
+
+# Valor principal de cada documento (base de vl_em_aberto e taxa_pagamento)
+VALOR_PRINCIPAL_ITCMD = {
+    'dde_itcmd': 'vl_declarado',
+    'notif_itcmd': 'vl_total',
+    'tifdp_itcmd': 'vl_apurado'
+}
+
+class DadosITCMD(Mapping):
+    """Tabelas do pacote de um setor (ITCMD ou outro de SETORES_OF) já tipadas, somente leitura.
+    
+    Cada acesso devolve uma cópia rasa: colunas acrescentadas pela página não
+    chegam ao pacote guardado em cache.
+    """
+    
+    def __init__(self, tabelas):
+        self._tabelas = dict(tabelas)
+    
+    def __getitem__(self, key):
+        return self._tabelas[key].copy(deep=False)
+    
+    def __iter__(self):
+        return iter(self._tabelas)
+    
+    def __len__(self):
+        return len(self._tabelas)
+
+def tipar_dados_itcmd(resultados):
+    """Pacote do setor a partir dos resultados do grafo: tipos de SCHEMAS_TABELAS
+    e colunas derivadas calculados uma única vez, na carga."""
+    tabelas = {}
+    for chave, nome in TABELAS_ITCMD.items():
+        df, _ = aplicar_schema(resultados[nome], nome)
+        tabelas[chave] = df
+    
+    df_of = tabelas['of_itcmd']
+    if 'dt_inicio' in df_of.columns and 'dt_fim' in df_of.columns:
+        df_of['dias_fiscalizacao'] = (df_of['dt_fim'] - df_of['dt_inicio']).dt.days
+    
+    for chave, valor in VALOR_PRINCIPAL_ITCMD.items():
+        df = tabelas[chave]
+        if valor in df.columns and 'vl_pago' in df.columns:
+            df['vl_em_aberto'] = (df[valor] - df['vl_pago']).clip(lower=0)
+            df['taxa_pagamento'] = (df['vl_pago'] / df[valor].where(df[valor] > 0) * 100)
+    
+    return DadosITCMD(tabelas)
+
+# Sincronização das tabelas de documentos (DDE, notificações, TIFDP): as linhas
+# já lidas ficam num armazém local em Parquet e cada carga só busca as alteradas
+# desde a marca d'água (maior dt_ultima_atualizacao) e as das OFs novas.
+# 'completa' relê tudo a cada carga.
+SINCRONIZACAO_ITCMD = _config('sincronizacao_itcmd', 'incremental')
+# Releitura completa periódica (s): exclusões não mudam dt_ultima_atualizacao
+INTERVALO_RECONCILIACAO_ITCMD = _config('intervalo_reconciliacao_itcmd', 86400)
+
+ARMAZEM_ITCMD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), f'.fisca_itcmd{SUFIXO_BACKEND}')
+ARMAZEM_ITCMD_MANIFESTO = os.path.join(ARMAZEM_ITCMD_DIR, 'manifesto.json')
+
+# Consulta completa -> (consulta das linhas alteradas, chave primária)
+SINCRONIZACAO_TABELAS_ITCMD = {
+    'itcmd_dde': ('itcmd_dde_alteradas', 'nu_declaracao'),
+    'itcmd_notif': ('itcmd_notif_alteradas', 'nu_notificacao_fiscal'),
+    'itcmd_tifdp': ('itcmd_tifdp_alteradas', 'nu_infr_fiscal')
+}
+
+@st.cache_resource
+def _trava_armazem_itcmd():
+    """Trava do processo para leitura/escrita do manifesto do armazém dos setores."""
+    return threading.Lock()
+
+def _ler_manifesto_itcmd():
+    """Lê o manifesto do armazém (vazio se não existir ou estiver corrompido)."""
+    try:
+        with open(ARMAZEM_ITCMD_MANIFESTO, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'tabelas': {}}
+
+def _hash_sincronizacao(nome, emitentes):
+    """Hash do SQL completo, do SQL das alteradas e dos emitentes do setor
+    (armazém antigo não serve se algum deles mudou)."""
+    alterada, _ = SINCRONIZACAO_TABELAS_ITCMD[nome]
+    return _hash_consulta(
+        REGISTRO_CONSULTAS[nome]['sql'] + REGISTRO_CONSULTAS[alterada]['sql'] + ','.join(emitentes)
+    )
+
+def _chave_armazem(setor, nome):
+    """Chave do manifesto (e nome do arquivo) de uma tabela de um setor."""
+    return f"{re.sub(r'[^0-9A-Za-z]+', '_', setor)}_{nome}"
+
+def ler_armazem_itcmd(setor, nome, emitentes):
+    """Retorna (df, entrada do manifesto) do armazém se válido para o SQL atual, senão None."""
+    with _trava_armazem_itcmd():
+        entrada = _ler_manifesto_itcmd()['tabelas'].get(_chave_armazem(setor, nome))
+    
+    if not entrada or entrada.get('hash_consulta') != _hash_sincronizacao(nome, emitentes):
+        return None
+    
+    try:
+        df = pd.read_parquet(os.path.join(ARMAZEM_ITCMD_DIR, entrada['arquivo']))
+    except Exception:
+        return None
+    
+    return df, entrada
+
+def salvar_armazem_itcmd(setor, nome, emitentes, df, ofs, reconciliado_em):
+    """Grava a tabela e a marca d'água. O Parquet vai antes do manifesto: uma
+    gravação interrompida só deixa a marca mais antiga (relê um pouco a mais)."""
+    chave = _chave_armazem(setor, nome)
+    arquivo = f"{chave}.parquet"
+    datas = pd.to_datetime(df['dt_ultima_atualizacao'], errors='coerce') if 'dt_ultima_atualizacao' in df.columns else pd.Series(dtype='datetime64[ns]')
+    marca = datas.max()
+    try:
+        os.makedirs(ARMAZEM_ITCMD_DIR, exist_ok=True)
+        _gravar_atomico(
+            os.path.join(ARMAZEM_ITCMD_DIR, arquivo),
+            lambda tmp: df.to_parquet(tmp, index=False)
+        )
+        with _travar_manifesto(_trava_armazem_itcmd(), ARMAZEM_ITCMD_MANIFESTO):
+            manifesto = _ler_manifesto_itcmd()
+            manifesto['tabelas'][chave] = {
+                'setor': setor,
+                'consulta': nome,
+                'arquivo': arquivo,
+                'hash_consulta': _hash_sincronizacao(nome, emitentes),
+                # Só a data: o >= relê o último dia e a mescla descarta as repetidas
+                'marca': None if pd.isna(marca) else marca.strftime('%Y-%m-%d'),
+                'ofs': sorted(ofs),
+                'reconciliado_em': reconciliado_em.isoformat(timespec='seconds'),
+                'sincronizado_em': datetime.now().isoformat(timespec='seconds'),
+                'registros': len(df)
+            }
+            _gravar_atomico(ARMAZEM_ITCMD_MANIFESTO, lambda tmp: _escrever_json(tmp, manifesto))
+    except Exception:
+        pass  # sem armazém, a próxima carga faz a leitura completa
+
+def _mesclar_por_chave(partes, chave):
+    """Junta as partes; em chaves repetidas fica a linha da parte mais recente (a última)."""
+    partes = [df for df in partes if not df.empty]
+    if not partes:
+        return pd.DataFrame()
+    df = pd.concat(partes, ignore_index=True)
+    if chave not in df.columns:
+        return df
+    return df[~df[chave].astype(str).duplicated(keep='last')].reset_index(drop=True)
+
+def sincronizar_tabela_itcmd(setor, nome, emitentes, ofs, completa, alteradas, novas):
+    """Tabela de documentos de um setor a partir do armazém local.
+    
+    Sem armazém, com o SQL alterado, sem marca d'água ou com a reconciliação
+    vencida, relê tudo (completa()). Senão busca só as linhas alteradas desde a
+    marca (alteradas(desde)) e as das OFs que ainda não estavam no armazém
+    (novas(ofs_novas)), mescla pela chave primária e descarta as linhas de OFs
+    que saíram do conjunto.
+    """
+    agora = datetime.now()
+    armazenado = ler_armazem_itcmd(setor, nome, emitentes)
+    reconciliar = armazenado is None or armazenado[1].get('marca') is None
+    if not reconciliar:
+        df, entrada = armazenado
+        reconciliado_em = datetime.fromisoformat(entrada['reconciliado_em'])
+        reconciliar = (agora - reconciliado_em).total_seconds() >= INTERVALO_RECONCILIACAO_ITCMD
+    
+    if reconciliar:
+        df = completa()
+        salvar_armazem_itcmd(setor, nome, emitentes, df, ofs, agora)
+        return df
+    
+    _, chave = SINCRONIZACAO_TABELAS_ITCMD[nome]
+    ofs_novas = sorted(set(ofs) - set(entrada['ofs']))
+    partes = [df, alteradas(entrada['marca'])]
+    if ofs_novas:
+        partes.append(novas(ofs_novas))
+    
+    df = _mesclar_por_chave(partes, chave)
+    if 'nu_of' in df.columns:
+        df = df[df['nu_of'].astype(str).isin(set(ofs))]
+    df = _ordenar_como_sql(df.reset_index(drop=True), REGISTRO_CONSULTAS[nome]['sql'])
+    salvar_armazem_itcmd(setor, nome, emitentes, df, ofs, reconciliado_em)
+    return df
+
+def resumo_armazem_itcmd():
+    """Situação do armazém incremental dos setores, para diagnóstico."""
+    with _trava_armazem_itcmd():
+        tabelas = _ler_manifesto_itcmd()['tabelas']
+    
+    return pd.DataFrame([
+        {
+            'setor': entrada.get('setor'),
+            'consulta': entrada.get('consulta', chave),
+            'registros': entrada.get('registros'),
+            'ofs': len(entrada.get('ofs', [])),
+            'marca_dagua': entrada.get('marca'),
+            'sincronizado_em': entrada.get('sincronizado_em'),
+            'reconciliado_em': entrada.get('reconciliado_em')
+        }
+        for chave, entrada in tabelas.items()
+    ])
+
+@st.cache_data(ttl=CACHE_TTL_MAXIMO)
+def carregar_dados_setor(_engine, setor, emitentes, versao=None):
+    """Pacote de um setor: OFs dos `emitentes` com DDE, notificações, TIFDP e termos.
+    
+    Cada setor (e conjunto de emitentes) tem a sua entrada de cache. As oito
+    consultas rodam como um grafo (ver executar_grafo). Com semi-join,
+    todas começam juntas e filtram as OFs no servidor; com lotes, DDE,
+    notificações, TIFDP, AFREs, acompanhamentos e termos esperam a lista de
+    OFs e os contribuintes esperam as IEs de DDE, notificações e TIFDP. O
+    catálogo de infrações não faz parte do pacote: vem da dimensão 'infracoes'
+    (seção 5.6). Com sincronização incremental, DDE,
+    notificações e TIFDP partem do armazém local (ver sincronizar_tabela_itcmd).
+    Retorna um DadosITCMD já tipado (ver tipar_dados_itcmd); falhas são
+    relançadas para quem chamou (pode ser uma thread de carregar_setores).
+    """
+    if _engine is None:
+        return DadosITCMD({})
+
+    emitentes = list(emitentes)
+    semijoin = FILTRO_CHAVES == 'semijoin'
+    ofs_itcmd = montar_subconsulta('ofs_dos_emitentes', emitentes=emitentes)
+
+    def consultar(nome, **parametros):
+        return executar_consulta(_engine, nome, versao=versao, **parametros)
+
+    def resultado(resultados, nome):
+        # Sem as arestas do registro (semi-join), o nó pode não ter rodado ainda;
+        # a repetição é coalescida ou lida do cache em disco
+        return resultados[nome] if nome in resultados else tarefas[nome](resultados)
+
+    def filtrado(nome, parametro, subconsulta, chaves, opcional=False, **extras):
+        # Consulta filtrada por um conjunto de chaves derivado das OFs do ITCMD
+        def tarefa(resultados):
+            try:
+                if semijoin:
+                    try:
+                        return consultar(nome, **{parametro: subconsulta}, **extras)
+                    except (PrazoConsultaExcedido, BackendIndisponivel):
+                        raise
+                    except Exception:
+                        pass  # backend recusou o semi-join: segue em lotes
+                valores = chaves(resultados)
+                if not valores:
+                    return pd.DataFrame()
+                return executar_consulta_em_lotes(_engine, nome, parametro, valores, versao=versao, **extras)
+            except Exception:
+                # Tabelas complementares: falha vira DataFrame vazio
+                if opcional:
+                    return pd.DataFrame()
+                raise
+        return tarefa
+
+    def lista_ofs(resultados):
+        df_of = resultado(resultados, 'itcmd_of')
+        return [str(x) for x in df_of['nu_of'].dropna().unique()]
+
+    def lista_matriculas(resultados):
+        # AFREs por Período (para análise de performance)
+        df_of = resultado(resultados, 'itcmd_of')
+        lista_matriculas = df_of['nu_mat_emitente'].dropna().unique().tolist()
+        lista_coord = df_of['nu_mat_coordenador'].dropna().unique().tolist()
+        return sorted(set([str(m).strip() for m in lista_matriculas + lista_coord if m]))
+
+    def lista_ies(resultados):
+        # Dados dos Contribuintes (para perfil CNAE/regime)
+        lista_ies = set()
+        for nome in ('itcmd_dde', 'itcmd_notif', 'itcmd_tifdp'):
+            df = resultado(resultados, nome)
+            if not df.empty and 'nu_ie' in df.columns:
+                lista_ies.update(df['nu_ie'].dropna().unique())
+        return sorted(str(ie) for ie in lista_ies)
+
+    def por_ofs(nome, opcional=False):
+        # Consultas filtradas pelo nu_of das OFs do ITCMD
+        return filtrado(nome, 'lista_ofs', ofs_itcmd, lista_ofs, opcional)
+
+    def sincronizado(nome):
+        # DDE, notificações e TIFDP: armazém local + alteradas desde a marca d'água
+        completa = por_ofs(nome)
+        if SINCRONIZACAO_ITCMD != 'incremental':
+            return completa
+        alterada, _ = SINCRONIZACAO_TABELAS_ITCMD[nome]
+        
+        def tarefa(resultados):
+            return sincronizar_tabela_itcmd(
+                setor, nome, emitentes, lista_ofs(resultados),
+                completa=lambda: completa(resultados),
+                alteradas=lambda desde: filtrado(alterada, 'lista_ofs', ofs_itcmd, lista_ofs, desde=desde)(resultados),
+                novas=lambda ofs: executar_consulta_em_lotes(_engine, nome, 'lista_ofs', ofs, versao=versao)
+            )
+        return tarefa
+
+    tarefas = {
+        # 1. Ordens de Fiscalização (filtradas pelos emitentes do setor)
+        'itcmd_of': lambda resultados: consultar('itcmd_of', coordenadores=emitentes),
+        # 2-4. Declarações (DDE), Notificações Fiscais e Termos de Infração (TIFDP)
+        'itcmd_dde': sincronizado('itcmd_dde'),
+        'itcmd_notif': sincronizado('itcmd_notif'),
+        'itcmd_tifdp': sincronizado('itcmd_tifdp'),
+        # 5. AFREs por Período
+        'itcmd_afre_periodo': filtrado(
+            'itcmd_afre_periodo', 'matriculas',
+            montar_subconsulta('matriculas_das_ofs', emitentes=emitentes),
+            lista_matriculas, opcional=True
+        ),
+        # 6. Contribuintes
+        'itcmd_contribuintes': filtrado(
+            'itcmd_contribuintes', 'ies',
+            montar_subconsulta('ies_das_ofs', lista_ofs=ofs_itcmd),
+            lista_ies, opcional=True
+        ),
+        # 7. Acompanhamentos (Follow-ups) e 8. Termos de Encerramento
+        'itcmd_acompanhamentos': por_ofs('itcmd_acompanhamentos', opcional=True),
+        'itcmd_termos_encerramento': por_ofs('itcmd_termos_encerramento', opcional=True)
+    }
+
+    resultados = executar_grafo(setor.lower(), tarefas, dependencias={} if semijoin else None)
+    return tipar_dados_itcmd(resultados)
+
+def carregar_dados_setores(_engine, setores, versao=None):
+    """Pacotes de vários setores, em paralelo."""
+    return carregar_setores(
+        setores, lambda setor: carregar_dados_setor(_engine, setor, emitentes_setor(setor), versao)
+    )
+
+# 'agregado': a página do ITCMD recebe contagens e somas já agrupadas no
+# servidor e só busca as linhas brutas nas tabelas de detalhamento;
+# 'detalhado': as linhas brutas vêm antes e são agrupadas no cliente.
+MODO_ITCMD = _config('modo_itcmd', 'agregado')
+
+# Consultas complementares do modo agregado: falha vira DataFrame vazio
+AGREGADOS_ITCMD_OPCIONAIS = {
+    'itcmd_agg_afre_periodo', 'itcmd_agg_perfil', 'itcmd_agg_acompanhamentos',
+    'itcmd_agg_termos', 'itcmd_agg_ciclo', 'itcmd_acompanhamentos_recentes', 'itcmd_termos_recentes'
+}
+
+@st.cache_data(ttl=CACHE_TTL_MAXIMO)
+def carregar_agregados_setor(_engine, setor, emitentes, versao=None):
+    """Agregados da página de um setor calculados no servidor (grupo itcmd_agregado).
+    
+    Tudo vem agrupado por ano, para o filtro de anos ser aplicado no cliente;
+    o volume transferido depende das dimensões, não da quantidade de OFs
+    (exceto o ciclo de vida, com uma linha curta por OF; ver seção 6.2).
+    As contagens de valores distintos ficam em carregar_contribuintes_setor.
+    Retorna {} se uma consulta obrigatória falhar (a página cai para o modo detalhado).
+    """
+    if _engine is None:
+        return {}
+
+    emitentes = list(emitentes)
+    ofs_itcmd = montar_subconsulta('ofs_dos_emitentes', emitentes=emitentes)
+    valores = {
+        'coordenadores': emitentes,
+        'lista_ofs': ofs_itcmd,
+        'matriculas': montar_subconsulta('matriculas_das_ofs', emitentes=emitentes),
+        'ies': montar_subconsulta('ies_das_ofs', lista_ofs=ofs_itcmd)
+    }
+
+    def tarefa(nome):
+        parametros = {parametro: valores[parametro] for parametro in REGISTRO_CONSULTAS[nome]['parametros']}
+        def executar(resultados):
+            try:
+                return executar_consulta(_engine, nome, versao=versao, **parametros)
+            except Exception:
+                if nome in AGREGADOS_ITCMD_OPCIONAIS:
+                    return pd.DataFrame()
+                raise
+        return executar
+
+    tarefas = {
+        nome: tarefa(nome) for nome in consultas_do_grupo('itcmd_agregado')
+        if nome != 'itcmd_agg_contribuintes'
+    }
+
+    try:
+        resultados = executar_grafo(f'{setor.lower()}_agregado', tarefas)
+    except Exception:
+        return {}
+
+    return {
+        'of': resultados['itcmd_agg_of'],
+        'documentos': resultados['itcmd_agg_documentos'],
+        'maiores': resultados['itcmd_agg_maiores'],
+        'tempo': resultados['itcmd_agg_tempo'],
+        'infracoes': resultados['itcmd_agg_infracoes'],
+        'afres': resultados['itcmd_agg_afres'],
+        'afre_periodo': resultados['itcmd_agg_afre_periodo'],
+        'perfil': resultados['itcmd_agg_perfil'],
+        'acompanhamentos': resultados['itcmd_agg_acompanhamentos'],
+        'termos': resultados['itcmd_agg_termos'],
+        'ciclo': completar_ciclo_ofs(aplicar_schema(resultados['itcmd_agg_ciclo'], 'itcmd_agg_ciclo')[0]),
+        'acompanhamentos_recentes': resultados['itcmd_acompanhamentos_recentes'],
+        'termos_recentes': resultados['itcmd_termos_recentes']
+    }
+
+@st.cache_data(ttl=CACHE_TTL_MAXIMO, max_entries=MAX_ENTRADAS_SOB_DEMANDA)
+def carregar_contribuintes_setor(_engine, emitentes, anos, versao=None):
+    """Contribuintes distintos e reincidentes nos anos filtrados (vazio = todos)."""
+    return executar_consulta(
+        _engine, 'itcmd_agg_contribuintes', versao=versao,
+        lista_ofs=montar_subconsulta('ofs_dos_emitentes', emitentes=list(emitentes)),
+        anos=list(anos), todos_anos=int(not anos)
+    )
+
+def _agrupar(df, colunas, **agregacoes):
+    """groupby que mantém chaves nulas, como o GROUP BY do SQL."""
+    if not agregacoes:
+        return df.groupby(colunas, dropna=False).size().reset_index(name='quantidade')
+    return df.groupby(colunas, dropna=False).agg(**agregacoes).reset_index()
+
+def resumir_itcmd(dados_itcmd, dim_infracoes):
+    """Os mesmos agregados de carregar_agregados_setor, calculados a partir do DadosITCMD tipado.
+    
+    `dim_infracoes` é a Dimensao de infrações (ver obter_dimensao): como no JOIN do
+    servidor, notificações com código fora do catálogo ficam de fora.
+    """
+    df_of = dados_itcmd.get('of_itcmd', pd.DataFrame())
+    df_dde = dados_itcmd.get('dde_itcmd', pd.DataFrame())
+    df_notif = dados_itcmd.get('notif_itcmd', pd.DataFrame())
+    df_tifdp = dados_itcmd.get('tifdp_itcmd', pd.DataFrame())
+    df_contrib = dados_itcmd.get('contribuintes', pd.DataFrame())
+    df_acomp = dados_itcmd.get('acompanhamentos', pd.DataFrame())
+    df_termo = dados_itcmd.get('termos_encerramento', pd.DataFrame())
+
+    def por_dimensao(df, dimensoes, colunas_grupo=('ano',), **agregacoes):
+        # Formato longo: uma linha por (dimensao, valor, ano)
+        partes = [
+            _agrupar(df, [coluna, *colunas_grupo], **agregacoes)
+            .rename(columns={coluna: 'valor'}).assign(dimensao=dimensao)
+            for dimensao, coluna in dimensoes.items() if coluna in df.columns
+        ]
+        return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+    of = por_dimensao(df_of, {
+        'estado': 'nm_estado', 'gerencia': 'nm_gerencia',
+        'local_emissao': 'nm_local_emissao', 'motivacao': 'tx_motivacao_of'
+    })
+
+    documentos = []
+    for tabela, df, estado, valor in (('dde', df_dde, 'cd_estado_conta', 'vl_declarado'),
+                                      ('notif', df_notif, 'nm_estado', 'vl_total'),
+                                      ('tifdp', df_tifdp, 'nm_estado', 'vl_apurado')):
+        if df.empty:
+            continue
+        df = df.assign(
+            convertido=df['nu_notificacao_gerada'].notna() if 'nu_notificacao_gerada' in df.columns else False
+        )
+        dimensoes = {'estado': estado, 'infracao': 'cd_infracao'} if tabela == 'notif' else {'estado': estado}
+        documentos.append(por_dimensao(
+            df, dimensoes,
+            quantidade=(valor, 'size'), valor_total=(valor, 'sum'),
+            valor_pago=('vl_pago', 'sum'), convertidos=('convertido', 'sum')
+        ).assign(tabela=tabela))
+    documentos = pd.concat(documentos, ignore_index=True) if documentos else pd.DataFrame()
+
+    maiores = []
+    for tabela, df, documento, valor in (('notif', df_notif, 'nu_notificacao_fiscal', 'vl_total'),
+                                         ('tifdp', df_tifdp, 'nu_infr_fiscal', 'vl_apurado')):
+        if df.empty:
+            continue
+        df = df.assign(valor=df[valor], documento=df[documento], tabela=tabela)
+        df = df[df['valor'].notna()].sort_values('valor', ascending=False, kind='stable')
+        maiores.append(df.groupby('ano', dropna=False).head(10)[
+            ['tabela', 'ano', 'documento', 'nm_razao_social', 'valor', 'vl_pago', 'nm_estado', 'dt_documento']
+        ])
+    maiores = pd.concat(maiores, ignore_index=True) if maiores else pd.DataFrame()
+
+    tempo = pd.DataFrame()
+    if 'dias_fiscalizacao' in df_of.columns:
+        tempo = _agrupar(
+            df_of[df_of['dias_fiscalizacao'] > 0].rename(columns={'dias_fiscalizacao': 'dias'}), ['ano', 'dias']
+        )
+
+    infracoes = pd.DataFrame()
+    if len(dim_infracoes) and not df_notif.empty and 'cd_infracao' in df_notif.columns:
+        df_notif_enriq = dim_infracoes.enriquecer(
+            df_notif[dim_infracoes.contem(df_notif['cd_infracao'])], 'cd_infracao', ['de_infracao', 'nm_tributo']
+        )
+        infracoes = _agrupar(
+            df_notif_enriq, ['ano', 'cd_infracao', 'de_infracao', 'nm_tributo'],
+            quantidade=('nu_notificacao_fiscal', 'count'), valor_total=('vl_total', 'sum'),
+            ultima=('dt_documento', 'max')
+        )
+
+    afres = _agrupar(
+        df_of.assign(matricula=df_of['nu_mat_emitente'].str.strip()), ['ano', 'matricula'],
+        qtd_ofs=('nu_of', 'count'), primeira_of=('dt_documento', 'min'), ultima_of=('dt_documento', 'max')
+    ) if not df_of.empty else pd.DataFrame()
+
+    def seguimento(df, estado, coluna_of):
+        # Por estado, mais a quantidade de OFs distintas
+        if df.empty:
+            return pd.DataFrame()
+        return pd.concat([
+            por_dimensao(df, {'estado': estado}, colunas_grupo=()),
+            pd.DataFrame({'dimensao': ['ofs'], 'valor': [None], 'quantidade': [df[coluna_of].nunique()]})
+        ], ignore_index=True)
+
+    colunas_acomp = [c for c in ['nu_documento_of', 'nm_estado_os', 'dt_documento_os', 'de_motivo_os'] if c in df_acomp.columns]
+    colunas_termo = [c for c in ['nu_termo_encerramento', 'os', 'nm_estado', 'dt_documento', 'dt_encerramento'] if c in df_termo.columns]
+
+    return {
+        'of': of,
+        'documentos': documentos,
+        'maiores': maiores,
+        'tempo': tempo,
+        'infracoes': infracoes,
+        'afres': afres,
+        'afre_periodo': pd.DataFrame({'periodos': [len(dados_itcmd.get('afre_periodo', pd.DataFrame()))]}),
+        'perfil': por_dimensao(df_contrib, {'secao': 'de_secao', 'regime': 'nm_enq_empresa'}, colunas_grupo=()),
+        'acompanhamentos': seguimento(df_acomp, 'nm_estado_os', 'nu_documento_of'),
+        'termos': seguimento(df_termo, 'nm_estado', 'os'),
+        'ciclo': montar_ciclo_ofs(dados_itcmd),
+        'acompanhamentos_recentes': df_acomp[colunas_acomp].head(10),
+        'termos_recentes': df_termo[colunas_termo].head(15)
+    }
+
+def resumir_contribuintes_itcmd(dados_itcmd, anos):
+    """Os mesmos números de carregar_contribuintes_itcmd, a partir das linhas brutas."""
+    ies = {}
+    for chave in ('dde_itcmd', 'notif_itcmd', 'tifdp_itcmd'):
+        df = dados_itcmd.get(chave, pd.DataFrame())
+        if anos and not df.empty and 'ano' in df.columns:
+            df = df[df['ano'].isin(anos)]
+        ies[chave] = df['nu_ie'].dropna() if not df.empty and 'nu_ie' in df.columns else pd.Series(dtype=object)
+
+    reincidencia = pd.concat(ies.values()).value_counts()
+    return pd.DataFrame([{
+        'contribuintes': len(set(ies['dde_itcmd']) | set(ies['notif_itcmd'])),
+        'total_ies': len(reincidencia),
+        'reincidentes': int((reincidencia > 1).sum())
+    }])
+
+# =============================================================================
+# 6.2. CICLO DE VIDA DAS OFs (UMA LINHA POR OF)
+# =============================================================================
+
+# Documento -> (chave do pacote, coluna com o nu_of, data do documento, valor principal)
+DOCUMENTOS_CICLO = {
+    'dde': ('dde_itcmd', 'nu_of', 'dt_entrega', 'vl_declarado'),
+    'notif': ('notif_itcmd', 'nu_of', 'dt_documento', 'vl_total'),
+    'tifdp': ('tifdp_itcmd', 'nu_of', 'dt_documento', 'vl_apurado')
+}
+
+def _por_of(indice_ofs, df, coluna_of, **agregacoes):
+    """Agregados de `df` por OF, alinhados a `indice_ofs` (uma linha por OF).
+
+    O groupby ordena as chaves uma vez e o reindex busca cada OF no índice de
+    hash do resultado; OFs sem documentos ficam com nulos.
+    """
+    if df.empty or coluna_of not in df.columns:
+        return pd.DataFrame(index=indice_ofs, columns=list(agregacoes))
+    return df.groupby(coluna_of).agg(**agregacoes).reindex(indice_ofs)
+
+def montar_ciclo_ofs(dados_itcmd):
+    """Ciclo de vida das OFs a partir do DadosITCMD: o mesmo itcmd_agg_ciclo do servidor.
+
+    Cada tabela de documentos é agregada por OF e juntada pelo nu_of (ver
+    _por_of), sem merges encadeados; termina em completar_ciclo_ofs.
+    """
+    df_of = dados_itcmd.get('of_itcmd', pd.DataFrame())
+    if df_of.empty:
+        return pd.DataFrame()
+
+    df_of = df_of.drop_duplicates('nu_of').set_index('nu_of')
+    indice_ofs = df_of.index
+    partes = [df_of[['ano', 'dt_documento', 'nm_estado']].rename(columns={'dt_documento': 'dt_of'})]
+
+    for documento, (chave, coluna_of, data, valor) in DOCUMENTOS_CICLO.items():
+        partes.append(_por_of(
+            indice_ofs, dados_itcmd.get(chave, pd.DataFrame()), coluna_of,
+            **{f'qtd_{documento}': (coluna_of, 'size'), f'valor_{documento}': (valor, 'sum'),
+               f'pago_{documento}': ('vl_pago', 'sum'), f'primeira_{documento}': (data, 'min'),
+               f'ultima_{documento}': (data, 'max')}
+        ))
+    partes.append(_por_of(
+        indice_ofs, dados_itcmd.get('acompanhamentos', pd.DataFrame()), 'nu_documento_of',
+        qtd_acomp=('nu_documento_of', 'size'), ultimo_acomp=('dt_documento_os', 'max')
+    ))
+    partes.append(_por_of(
+        indice_ofs, dados_itcmd.get('termos_encerramento', pd.DataFrame()), 'os',
+        qtd_termos=('os', 'size'), dt_encerramento=('dt_encerramento', 'min')
+    ))
+
+    ciclo = pd.concat(partes, axis=1).rename_axis('nu_of').reset_index()
+    ciclo, _ = aplicar_schema(ciclo, 'itcmd_agg_ciclo')
+    return completar_ciclo_ofs(ciclo)
+
+def completar_ciclo_ofs(ciclo):
+    """Colunas derivadas do ciclo de vida, iguais nos dois modos da página.
+
+    OF sem documento de um tipo fica com quantidade e valores zerados. A
+    situação do pagamento compara o pago com o lançado (notificações + TIFDP);
+    os prazos são contados em dias desde a emissão da OF.
+    """
+    if ciclo.empty:
+        return ciclo
+
+    colunas_zeradas = [c for c in ciclo.columns if c.startswith(('qtd_', 'valor_', 'pago_'))]
+    ciclo[colunas_zeradas] = ciclo[colunas_zeradas].fillna(0)
+
+    ciclo['valor_lancado'] = ciclo['valor_notif'] + ciclo['valor_tifdp']
+    ciclo['valor_pago'] = ciclo['pago_notif'] + ciclo['pago_tifdp']
+    ciclo['tem_notificacao'] = ciclo['qtd_notif'] > 0
+    ciclo['encerrada'] = ciclo['qtd_termos'] > 0
+    ciclo['dias_ate_notificacao'] = (ciclo['primeira_notif'] - ciclo['dt_of']).dt.days
+    ciclo['dias_ate_encerramento'] = (ciclo['dt_encerramento'] - ciclo['dt_of']).dt.days
+    ciclo['situacao_pagamento'] = np.select(
+        [ciclo['valor_lancado'] <= 0, ciclo['valor_pago'] >= ciclo['valor_lancado'], ciclo['valor_pago'] > 0],
+        ['Sem lançamento', 'Quitada', 'Parcial'],
+        default='Em aberto'
+    )
+    return ciclo
+
+# =============================================================================
+# 7. FUNÇÕES AUXILIARES DE VISUALIZAÇÃO
+# =============================================================================
+
+def criar_card_metrica(label: str, valor, icone: str = "📊", cor: str = "#1976d2"):
+    """Cria um card de métrica colorido."""
+    st.markdown(f"""
+    <div style='background: linear-gradient(135deg, {cor} 0%, {cor}dd 100%); 
+                padding: 1.5rem; border-radius: 10px; color: white; 
+                box-shadow: 0 4px 6px rgba(0,0,0,0.1); margin: 10px 0;'>
+        <div style='font-size: 2rem; margin-bottom: 0.5rem;'>{icone}</div>
+        <div style='font-size: 0.9rem; opacity: 0.9;'>{label}</div>
+        <div style='font-size: 2.5rem; font-weight: bold;'>{valor}</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+def formatar_valor(valor):
+    """Formata valores monetários."""
+    if pd.isna(valor) or valor == 0:
+        return "R$ 0,00"
+    
+    if valor >= 1_000_000_000:
+        return f"R$ {valor/1_000_000_000:.2f}B"
+    elif valor >= 1_000_000:
+        return f"R$ {valor/1_000_000:.2f}M"
+    elif valor >= 1_000:
+        return f"R$ {valor/1_000:.2f}K"
+    else:
+        return f"R$ {valor:,.2f}"
+
+def criar_filtros_sidebar(dados):
+    """Cria painel de filtros na sidebar."""
+    filtros = {}
+    
+    with st.sidebar.expander("🔍 Filtros Globais", expanded=True):
+        
+        # Opções de TABELAS_FILTROS, carregada em todas as páginas
+        df_opcoes = dados.get('opcoes_filtros', pd.DataFrame())
+        
+        # Ano
+        if not df_opcoes.empty and 'ano' in df_opcoes.columns and df_opcoes['ano'].notna().any():
+            anos = sorted(df_opcoes['ano'].dropna().unique(), reverse=True)
+            filtros['anos'] = st.multiselect(
+                "Anos",
+                anos,
+                default=anos[:3] if len(anos) >= 3 else anos
+            )
+        
+        # Gerência
+        if not df_opcoes.empty and 'gerfe' in df_opcoes.columns and df_opcoes['gerfe'].notna().any():
+            gerencias = sorted(df_opcoes['gerfe'].dropna().astype(str).unique())
+            filtros['gerencias'] = st.multiselect(
+                "Gerências (GRAF)",
+                gerencias,
+                default=[]
+            )
+        
+        # Valor mínimo
+        filtros['valor_minimo'] = st.number_input(
+            "Valor Mínimo (R$)",
+            min_value=0,
+            max_value=10000000,
+            value=0,
+            step=100000
+        )
+        
+        st.divider()
+        
+        # Visualização
+        st.subheader("🎨 Visualização")
+        filtros['tema'] = st.selectbox(
+            "Tema dos Gráficos",
+            ["plotly", "plotly_white", "plotly_dark"],
+            index=1
+        )
+        
+        filtros['mostrar_valores'] = st.checkbox("Mostrar valores", value=True)
+    
+    return filtros
+
+# =============================================================================
+# 8. PÁGINAS DO DASHBOARD
+# =============================================================================
+
+def pagina_dashboard_executivo(dados, filtros):
+    """Dashboard executivo principal."""
+    st.markdown("<h1 class='main-header'>📊 Dashboard Executivo - Sistema FISCA</h1>", unsafe_allow_html=True)
+    
+    st.markdown("""
+    <div class='info-box'>
+    <b>🎯 Sistema de Análise de Fiscalizações</b><br>
+    Monitoramento completo das ações fiscais da Receita Estadual de SC, incluindo infrações, 
+    notificações fiscais, encerramentos e análise de efetividade.
+    <br><br>
+    ✅ <b>Dados corrigidos:</b> Excluindo 1,541 infrações canceladas/excluídas das métricas
     </div>
     """, unsafe_allow_html=True)
     
@@ -1394,7 +4302,7 @@ def pagina_analise_gerencias(dados, filtros):
     st.markdown("<div class='sub-header'>📊 Performance Consolidada</div>", unsafe_allow_html=True)
     
     # Agregar por gerência
-    df_resumo = df_gerencia.groupby('gerfe').agg({
+    df_resumo = df_gerencia.groupby('gerfe', observed=True).agg({
         'qtd_fiscalizacoes': 'sum',
         'qtd_empresas_unicas': 'sum',
         'qtd_infracoes': 'sum',
@@ -1501,7 +4409,7 @@ def pagina_analise_cnae(dados, filtros):
     
     # Agregar conforme nível
     if nivel_analise == 'Seção (Macro)':
-        df_analise = df_cnae.groupby(['cnae_secao', 'cnae_secao_descricao']).agg({
+        df_analise = df_cnae.groupby(['cnae_secao', 'cnae_secao_descricao'], observed=True).agg({
             'qtd_fiscalizacoes': 'sum',
             'qtd_empresas_unicas': 'sum',
             'qtd_nfs': 'sum',
@@ -1512,7 +4420,7 @@ def pagina_analise_cnae(dados, filtros):
         df_analise.columns = ['codigo', 'descricao', 'qtd_fiscalizacoes', 'qtd_empresas', 
                               'qtd_nfs', 'valor_infracoes', 'valor_nfs']
     else:
-        df_analise = df_cnae.groupby(['cnae_divisao', 'cnae_divisao_descricao']).agg({
+        df_analise = df_cnae.groupby(['cnae_divisao', 'cnae_divisao_descricao'], observed=True).agg({
             'qtd_fiscalizacoes': 'sum',
             'qtd_empresas_unicas': 'sum',
             'qtd_nfs': 'sum',
@@ -1607,7 +4515,7 @@ def pagina_analise_municipios(dados, filtros):
         return
     
     # Agregar por município
-    df_resumo = df_mun.groupby(['municipio', 'uf']).agg({
+    df_resumo = df_mun.groupby(['municipio', 'uf'], observed=True).agg({
         'qtd_fiscalizacoes': 'sum',
         'qtd_empresas_unicas': 'sum',
         'qtd_nfs': 'sum',
@@ -1914,7 +4822,7 @@ def pagina_tipos_infracoes(dados, filtros):
     if 'tipo_infracao_descricao' in df_rank.columns:
         colunas_group.append('tipo_infracao_descricao')
     
-    df_agregado = df_rank.groupby(colunas_group).agg({
+    df_agregado = df_rank.groupby(colunas_group, observed=True).agg({
         'qtd_ocorrencias': 'sum',
         'qtd_empresas': 'sum',
         'valor_total': 'sum',
@@ -1925,13 +4833,18 @@ def pagina_tipos_infracoes(dados, filtros):
     if 'tipo_infracao_descricao' in df_agregado.columns and 'tipo_infracao' not in df_agregado.columns:
         df_agregado = df_agregado.rename(columns={'tipo_infracao_descricao': 'tipo_infracao'})
     
-    # Adicionar coluna tipo_infracao se não existir
-    if 'tipo_infracao' not in df_agregado.columns:
-        df_agregado['tipo_infracao'] = 'Não especificado'
+    # Descrição e tipo ausentes ou nulos vêm da dimensão de infrações
+    infracoes = obter_dimensao(st.session_state.get('engine'), 'infracoes')
+    posicoes = infracoes.posicoes(df_agregado['codigo_infracao'])
+    for coluna, coluna_dimensao in (('descricao_infracao', 'de_infracao'), ('tipo_infracao', 'de_tipo_infracao')):
+        da_dimensao = infracoes.valores(df_agregado['codigo_infracao'], coluna_dimensao, posicoes)
+        if coluna in df_agregado.columns:
+            da_dimensao = df_agregado[coluna].astype('string').fillna(da_dimensao)
+        df_agregado[coluna] = da_dimensao
     
-    # Adicionar coluna descricao_infracao se não existir
-    if 'descricao_infracao' not in df_agregado.columns:
-        df_agregado['descricao_infracao'] = df_agregado['codigo_infracao'].astype(str)
+    # Sem correspondência na dimensão
+    df_agregado['tipo_infracao'] = df_agregado['tipo_infracao'].fillna('Não especificado')
+    df_agregado['descricao_infracao'] = df_agregado['descricao_infracao'].fillna(df_agregado['codigo_infracao'].astype(str))
     
     # Remover nulos em codigo_infracao
     df_agregado = df_agregado[df_agregado['codigo_infracao'].notna()]
@@ -2246,8 +5159,12 @@ def pagina_drill_down_empresa(dados, filtros):
     
     # ========== CARREGAR DADOS DETALHADOS ==========
     with st.spinner(f"Carregando dados detalhados da empresa {cnpj_selecionado}..."):
-        df_empresa = carregar_empresa_detalhada(engine, cnpj_selecionado)
-        df_fiscalizacoes = carregar_fiscalizacoes_empresa(engine, cnpj_selecionado)
+        df_empresa = carregar_empresa_detalhada(
+            engine, cnpj_selecionado, versao_consulta(engine, 'empresa_detalhada')
+        )
+        df_fiscalizacoes = carregar_fiscalizacoes_empresa(
+            engine, cnpj_selecionado, versao_consulta(engine, 'fiscalizacoes_empresa')
+        )
     
     if df_empresa.empty:
         st.error("Dados cadastrais não encontrados.")
@@ -2402,7 +5319,9 @@ def pagina_drill_down_empresa(dados, filtros):
             if 'id_documento' in fisc_dados.index:
                 st.markdown("**👥 AFREs Envolvidos:**")
                 
-                df_afres_fisc = carregar_afres_fiscalizacao(engine, fisc_dados['id_documento'])
+                df_afres_fisc = carregar_afres_fiscalizacao(
+                    engine, fisc_dados['id_documento'], versao_consulta(engine, 'afres_fiscalizacao')
+                )
                 
                 if not df_afres_fisc.empty:
                     cols_afres = ['matricula_afre', 'nome_afre', 'cargo', 
@@ -2457,7 +5376,7 @@ def pagina_machine_learning(dados, filtros):
         
         # Carregar dataset
         with st.spinner("Carregando dados para Machine Learning..."):
-            df_ml = carregar_dataset_ml(engine)
+            df_ml = carregar_dataset_ml(engine, versao_consulta(engine, 'dataset_ml'))
         
         if df_ml.empty:
             st.error("Dataset não disponível.")
@@ -2997,7 +5916,7 @@ def pagina_analise_estados(dados, filtros):
     col1, col2 = st.columns(2)
     
     with col1:
-        df_status = df_estados.groupby('status_normalizado').agg({
+        df_status = df_estados.groupby('status_normalizado', observed=True).agg({
             'qtd': 'sum',
             'com_nf': 'sum',
             'valor_total': 'sum'
@@ -3106,7 +6025,7 @@ def pagina_analise_ges(dados, filtros):
     st.markdown("<div class='sub-header'>📊 Visão Geral dos GES</div>", unsafe_allow_html=True)
     
     # Agregar por GES
-    df_resumo = df_ges.groupby('nm_ges').agg({
+    df_resumo = df_ges.groupby('nm_ges', observed=True).agg({
         'qtd_fiscalizacoes': 'sum',
         'qtd_empresas_unicas': 'sum',
         'qtd_infracoes': 'sum',
@@ -3403,134 +6322,152 @@ def pagina_analise_ges(dados, filtros):
 # 8.12. PÁGINA ITCMD
 # =============================================================================
 
-def pagina_itcmd(dados, filtros):
-    """Análise das Ordens de Fiscalização do setor ITCMD."""
-    st.markdown("<h1 class='main-header'>📜 ITCMD - Análise de Fiscalizações</h1>", unsafe_allow_html=True)
+def pagina_setor_of(dados, filtros, setor='ITCMD'):
+    """Análise das Ordens de Fiscalização de um setor (ver SETORES_OF)."""
+    definicao = SETORES_OF[setor]
+    emitentes = emitentes_setor(setor)
+    st.markdown(f"<h1 class='main-header'>{definicao['icone']} {definicao['titulo']}</h1>", unsafe_allow_html=True)
 
-    st.markdown("""
+    st.markdown(f"""
     <div class='info-box'>
-    <b>📜 Setor ITCMD - Imposto sobre Transmissão Causa Mortis e Doação</b><br>
-    Análise das Ordens de Fiscalização emitidas pelos coordenadores do setor ITCMD
-    (usuários 9507248 e 6172598), incluindo declarações, notificações fiscais e termos de infração.
+    <b>{definicao['icone']} Setor {setor}{' - ' + definicao['descricao'] if definicao['descricao'] else ''}</b><br>
+    Análise das Ordens de Fiscalização emitidas pelos coordenadores do setor {setor}
+    (usuários {', '.join(emitentes)}), incluindo declarações, notificações fiscais e termos de infração.
     </div>
     """, unsafe_allow_html=True)
 
-    # Carregar dados ITCMD sob demanda
+    # Carregar dados do setor sob demanda
     engine = st.session_state.get('engine')
     if engine is None:
         st.error("❌ Conexão com banco de dados não disponível.")
         return
 
-    with st.spinner('⏳ Carregando dados do ITCMD...'):
-        dados_itcmd = carregar_dados_itcmd(engine)
+    anos = list(filtros.get('anos') or [])
+    agregados = {}
+    dados_itcmd = {}
 
-    if not dados_itcmd:
-        st.warning("⚠️ Não foi possível carregar os dados do ITCMD.")
+    def carregar_pacote():
+        try:
+            return carregar_dados_setor(engine, setor, emitentes, versao_consulta(engine, *consultas_do_grupo('itcmd')))
+        except Exception as e:
+            st.error(f"Erro ao carregar dados do {setor}: {str(e)[:150]}")
+            return DadosITCMD({})
+
+    with st.spinner(f'⏳ Carregando dados do {setor}...'):
+        if MODO_ITCMD == 'agregado':
+            versao = versao_consulta(engine, *consultas_do_grupo('itcmd_agregado'))
+            agregados = carregar_agregados_setor(engine, setor, emitentes, versao)
+            if agregados:
+                try:
+                    df_contagens = carregar_contribuintes_setor(engine, emitentes, tuple(anos), versao)
+                except Exception:
+                    agregados = {}
+
+        if not agregados:
+            # Modo detalhado (ou agregados indisponíveis): agrupa as linhas brutas no cliente
+            dados_itcmd = carregar_pacote()
+            if dados_itcmd:
+                agregados = resumir_itcmd(dados_itcmd, obter_dimensao(engine, 'infracoes'))
+                df_contagens = resumir_contribuintes_itcmd(dados_itcmd, anos)
+
+    if not agregados:
+        st.warning(f"⚠️ Não foi possível carregar os dados do {setor}.")
         return
 
-    # Obter dataframes
-    df_of = dados_itcmd.get('of_itcmd', pd.DataFrame())
-    df_dde = dados_itcmd.get('dde_itcmd', pd.DataFrame())
-    df_notif = dados_itcmd.get('notif_itcmd', pd.DataFrame())
-    df_tifdp = dados_itcmd.get('tifdp_itcmd', pd.DataFrame())
-
-    if df_of.empty:
-        st.warning("⚠️ Nenhuma Ordem de Fiscalização encontrada para o setor ITCMD.")
+    if agregados['of'].empty:
+        st.warning(f"⚠️ Nenhuma Ordem de Fiscalização encontrada para o setor {setor}.")
         return
 
-    # Aplicar filtros de ano se disponíveis
-    if filtros.get('anos') and 'ano' in df_of.columns:
-        df_of = df_of[df_of['ano'].isin(filtros['anos'])]
-        if not df_dde.empty and 'ano' in df_dde.columns:
-            df_dde = df_dde[df_dde['ano'].isin(filtros['anos'])]
-        if not df_notif.empty and 'ano' in df_notif.columns:
-            df_notif = df_notif[df_notif['ano'].isin(filtros['anos'])]
-        if not df_tifdp.empty and 'ano' in df_tifdp.columns:
-            df_tifdp = df_tifdp[df_tifdp['ano'].isin(filtros['anos'])]
+    def do_periodo(df):
+        # Agregados vêm por ano; o filtro de anos é aplicado aqui
+        if anos and not df.empty and 'ano' in df.columns:
+            return df[df['ano'].isin(anos)]
+        return df
+
+    def contagem(df, dimensao, n=None):
+        # Quantidade por valor da dimensão, em ordem decrescente (como value_counts)
+        if df.empty:
+            return pd.DataFrame(columns=['valor', 'quantidade'])
+        serie = df[df['dimensao'] == dimensao].groupby('valor')['quantidade'].sum()
+        serie = serie.sort_values(ascending=False, kind='stable')
+        return (serie.head(n) if n else serie).reset_index()
+
+    def documentos(tabela):
+        return df_docs[df_docs['tabela'] == tabela] if not df_docs.empty else df_docs
+
+    def totais(df):
+        # Linhas da dimensão 'estado' somam todos os registros
+        return df[df['dimensao'] == 'estado'] if not df.empty else df
+
+    df_of = do_periodo(agregados['of'])
+    df_docs = do_periodo(agregados['documentos'])
+    df_dde, df_notif, df_tifdp = documentos('dde'), documentos('notif'), documentos('tifdp')
+    # Uma linha por OF emitida nos anos filtrados (seção 6.2)
+    df_ciclo = do_periodo(agregados['ciclo'])
+    contagens = df_contagens.iloc[0]
+
+    total_ofs = int(totais(df_of)['quantidade'].sum())
+    total_dde = int(totais(df_dde)['quantidade'].sum()) if not df_dde.empty else 0
+    total_notif = int(totais(df_notif)['quantidade'].sum()) if not df_notif.empty else 0
+    total_tifdp = int(totais(df_tifdp)['quantidade'].sum()) if not df_tifdp.empty else 0
 
     # ========== KPIs PRINCIPAIS ==========
-    st.markdown("<div class='sub-header'>📊 Indicadores Gerais do ITCMD</div>", unsafe_allow_html=True)
+    st.markdown(f"<div class='sub-header'>📊 Indicadores Gerais do {setor}</div>", unsafe_allow_html=True)
 
     col1, col2, col3, col4, col5 = st.columns(5)
 
     with col1:
-        total_ofs = len(df_of)
         st.metric("📋 Total de OFs", f"{total_ofs:,}")
 
     with col2:
-        if not df_dde.empty:
-            total_dde = len(df_dde)
-            st.metric("📄 Declarações (DDE)", f"{total_dde:,}")
-        else:
-            st.metric("📄 Declarações (DDE)", "0")
+        st.metric("📄 Declarações (DDE)", f"{total_dde:,}")
 
     with col3:
-        if not df_notif.empty:
-            total_notif = len(df_notif)
-            st.metric("📑 Notificações", f"{total_notif:,}")
-        else:
-            st.metric("📑 Notificações", "0")
+        st.metric("📑 Notificações", f"{total_notif:,}")
 
     with col4:
-        if not df_tifdp.empty:
-            total_tifdp = len(df_tifdp)
-            st.metric("⚖️ Termos Infração", f"{total_tifdp:,}")
-        else:
-            st.metric("⚖️ Termos Infração", "0")
+        st.metric("⚖️ Termos Infração", f"{total_tifdp:,}")
 
     with col5:
-        # Contribuintes únicos
-        contribuintes = set()
-        if not df_dde.empty and 'nu_ie' in df_dde.columns:
-            contribuintes.update(df_dde['nu_ie'].dropna().unique())
-        if not df_notif.empty and 'nu_ie' in df_notif.columns:
-            contribuintes.update(df_notif['nu_ie'].dropna().unique())
-        st.metric("🏢 Contribuintes", f"{len(contribuintes):,}")
+        # Contribuintes únicos (DDE e notificações)
+        st.metric("🏢 Contribuintes", f"{int(contagens['contribuintes']):,}")
 
     # Segunda linha de KPIs - Valores
     st.markdown("<div class='sub-header'>💰 Valores Totais</div>", unsafe_allow_html=True)
 
     col1, col2, col3, col4, col5 = st.columns(5)
 
+    valor_declarado = totais(df_dde)['valor_total'].sum() if total_dde else 0
+    valor_notif = totais(df_notif)['valor_total'].sum() if total_notif else 0
+    valor_tifdp = totais(df_tifdp)['valor_total'].sum() if total_tifdp else 0
+
     with col1:
-        if not df_dde.empty and 'vl_declarado' in df_dde.columns:
-            valor_declarado = pd.to_numeric(df_dde['vl_declarado'], errors='coerce').sum()
+        if total_dde:
             st.metric("📝 Valor Declarado", formatar_valor(valor_declarado))
         else:
             st.metric("📝 Valor Declarado", "R$ 0")
 
     with col2:
-        if not df_notif.empty and 'vl_total' in df_notif.columns:
-            valor_notif = pd.to_numeric(df_notif['vl_total'], errors='coerce').sum()
+        if total_notif:
             st.metric("📑 Valor Notificações", formatar_valor(valor_notif))
         else:
             st.metric("📑 Valor Notificações", "R$ 0")
 
     with col3:
-        if not df_tifdp.empty and 'vl_apurado' in df_tifdp.columns:
-            valor_tifdp = pd.to_numeric(df_tifdp['vl_apurado'], errors='coerce').sum()
+        if total_tifdp:
             st.metric("⚖️ Valor Apurado TIFDP", formatar_valor(valor_tifdp))
         else:
             st.metric("⚖️ Valor Apurado TIFDP", "R$ 0")
 
     with col4:
         # Total pago (todas as fontes)
-        total_pago = 0
-        if not df_dde.empty and 'vl_pago' in df_dde.columns:
-            total_pago += pd.to_numeric(df_dde['vl_pago'], errors='coerce').sum()
-        if not df_notif.empty and 'vl_pago' in df_notif.columns:
-            total_pago += pd.to_numeric(df_notif['vl_pago'], errors='coerce').sum()
-        if not df_tifdp.empty and 'vl_pago' in df_tifdp.columns:
-            total_pago += pd.to_numeric(df_tifdp['vl_pago'], errors='coerce').sum()
+        total_pago = totais(df_docs)['valor_pago'].sum() if not df_docs.empty else 0
         st.metric("💵 Total Pago", formatar_valor(total_pago))
 
     with col5:
         # Taxa de recuperação
-        valor_total_lancado = 0
-        if not df_notif.empty and 'vl_total' in df_notif.columns:
-            valor_total_lancado = pd.to_numeric(df_notif['vl_total'], errors='coerce').sum()
-        if valor_total_lancado > 0:
-            taxa_recuperacao = (total_pago / valor_total_lancado) * 100
+        if valor_notif > 0:
+            taxa_recuperacao = (total_pago / valor_notif) * 100
             st.metric("📈 Taxa Recuperação", f"{taxa_recuperacao:.1f}%")
         else:
             st.metric("📈 Taxa Recuperação", "N/A")
@@ -3544,45 +6481,38 @@ def pagina_itcmd(dados, filtros):
 
     with col1:
         # Evolução de OFs por ano
-        if 'ano' in df_of.columns:
-            df_of_ano = df_of.groupby('ano').size().reset_index(name='quantidade')
-            df_of_ano = df_of_ano.sort_values('ano')
+        df_of_ano = totais(df_of).groupby('ano')['quantidade'].sum().reset_index()
+        df_of_ano = df_of_ano.sort_values('ano')
 
-            fig = px.bar(
-                df_of_ano,
-                x='ano',
-                y='quantidade',
-                title='📋 Ordens de Fiscalização por Ano',
-                template=filtros['tema'],
-                color='quantidade',
-                color_continuous_scale='Blues',
-                text='quantidade'
-            )
-            fig.update_traces(textposition='outside')
-            fig.update_layout(height=400, xaxis_title='Ano', yaxis_title='Quantidade de OFs')
-            st.plotly_chart(fig, use_container_width=True)
+        fig = px.bar(
+            df_of_ano,
+            x='ano',
+            y='quantidade',
+            title='📋 Ordens de Fiscalização por Ano',
+            template=filtros['tema'],
+            color='quantidade',
+            color_continuous_scale='Blues',
+            text='quantidade'
+        )
+        fig.update_traces(textposition='outside')
+        fig.update_layout(height=400, xaxis_title='Ano', yaxis_title='Quantidade de OFs')
+        st.plotly_chart(fig, use_container_width=True)
 
     with col2:
         # Evolução de valores por ano
-        if not df_notif.empty and 'ano' in df_notif.columns:
-            df_notif['vl_total_num'] = pd.to_numeric(df_notif['vl_total'], errors='coerce')
-            df_notif['vl_pago_num'] = pd.to_numeric(df_notif['vl_pago'], errors='coerce')
-
-            df_valor_ano = df_notif.groupby('ano').agg({
-                'vl_total_num': 'sum',
-                'vl_pago_num': 'sum'
-            }).reset_index()
+        if total_notif:
+            df_valor_ano = totais(df_notif).groupby('ano')[['valor_total', 'valor_pago']].sum().reset_index()
 
             fig = go.Figure()
             fig.add_trace(go.Bar(
                 x=df_valor_ano['ano'],
-                y=df_valor_ano['vl_total_num'],
+                y=df_valor_ano['valor_total'],
                 name='Valor Total',
                 marker_color='#1976d2'
             ))
             fig.add_trace(go.Bar(
                 x=df_valor_ano['ano'],
-                y=df_valor_ano['vl_pago_num'],
+                y=df_valor_ano['valor_pago'],
                 name='Valor Pago',
                 marker_color='#388e3c'
             ))
@@ -3602,37 +6532,36 @@ def pagina_itcmd(dados, filtros):
     col1, col2 = st.columns(2)
 
     with col1:
-        if 'nm_estado' in df_of.columns:
-            df_estado = df_of['nm_estado'].value_counts().reset_index()
-            df_estado.columns = ['estado', 'quantidade']
+        df_estado = contagem(df_of, 'estado')
+        df_estado.columns = ['estado', 'quantidade']
 
-            fig = px.pie(
-                df_estado,
-                values='quantidade',
-                names='estado',
-                title='📊 Distribuição por Situação',
-                template=filtros['tema'],
-                hole=0.4
-            )
-            fig.update_traces(textposition='inside', textinfo='percent+label')
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
+        fig = px.pie(
+            df_estado,
+            values='quantidade',
+            names='estado',
+            title='📊 Distribuição por Situação',
+            template=filtros['tema'],
+            hole=0.4
+        )
+        fig.update_traces(textposition='inside', textinfo='percent+label')
+        fig.update_layout(height=400)
+        st.plotly_chart(fig, use_container_width=True)
 
     with col2:
-        if 'nm_estado' in df_of.columns and 'ano' in df_of.columns:
-            df_estado_ano = df_of.groupby(['ano', 'nm_estado']).size().reset_index(name='quantidade')
+        df_estado_ano = totais(df_of).groupby(['ano', 'valor'])['quantidade'].sum().reset_index()
+        df_estado_ano = df_estado_ano.rename(columns={'valor': 'nm_estado'})
 
-            fig = px.bar(
-                df_estado_ano,
-                x='ano',
-                y='quantidade',
-                color='nm_estado',
-                title='📈 Evolução por Situação',
-                template=filtros['tema'],
-                barmode='stack'
-            )
-            fig.update_layout(height=400, xaxis_title='Ano', yaxis_title='Quantidade')
-            st.plotly_chart(fig, use_container_width=True)
+        fig = px.bar(
+            df_estado_ano,
+            x='ano',
+            y='quantidade',
+            color='nm_estado',
+            title='📈 Evolução por Situação',
+            template=filtros['tema'],
+            barmode='stack'
+        )
+        fig.update_layout(height=400, xaxis_title='Ano', yaxis_title='Quantidade')
+        st.plotly_chart(fig, use_container_width=True)
 
     # ========== ANÁLISE POR GERÊNCIA ==========
     st.markdown("<div class='sub-header'>🏢 Análise por Gerência/Local</div>", unsafe_allow_html=True)
@@ -3640,122 +6569,117 @@ def pagina_itcmd(dados, filtros):
     col1, col2 = st.columns(2)
 
     with col1:
-        if 'nm_gerencia' in df_of.columns:
-            df_gerencia = df_of['nm_gerencia'].value_counts().head(10).reset_index()
-            df_gerencia.columns = ['gerencia', 'quantidade']
+        df_gerencia = contagem(df_of, 'gerencia', 10)
+        df_gerencia.columns = ['gerencia', 'quantidade']
 
-            fig = px.bar(
-                df_gerencia,
-                y='gerencia',
-                x='quantidade',
-                title='🏢 OFs por Gerência (Top 10)',
+        fig = px.bar(
+            df_gerencia,
+            y='gerencia',
+            x='quantidade',
+            title='🏢 OFs por Gerência (Top 10)',
+            template=filtros['tema'],
+            orientation='h',
+            color='quantidade',
+            color_continuous_scale='Blues',
+            text='quantidade'
+        )
+        fig.update_traces(textposition='outside')
+        fig.update_layout(height=400, yaxis_title='', xaxis_title='Quantidade')
+        st.plotly_chart(fig, use_container_width=True)
+
+    with col2:
+        df_local = contagem(df_of, 'local_emissao', 10)
+        df_local.columns = ['local', 'quantidade']
+
+        fig = px.bar(
+            df_local,
+            y='local',
+            x='quantidade',
+            title='📍 OFs por Local de Emissão (Top 10)',
+            template=filtros['tema'],
+            orientation='h',
+            color='quantidade',
+            color_continuous_scale='Greens',
+            text='quantidade'
+        )
+        fig.update_traces(textposition='outside')
+        fig.update_layout(height=400, yaxis_title='', xaxis_title='Quantidade')
+        st.plotly_chart(fig, use_container_width=True)
+
+    df_maiores = do_periodo(agregados['maiores'])
+
+    # ========== CRUZAMENTO: NOTIFICAÇÕES ==========
+    if total_notif:
+        st.markdown("<div class='sub-header'>📑 Análise de Notificações Fiscais</div>", unsafe_allow_html=True)
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            df_notif_estado = contagem(df_notif, 'estado')
+            df_notif_estado.columns = ['estado', 'quantidade']
+
+            fig = px.pie(
+                df_notif_estado,
+                values='quantidade',
+                names='estado',
+                title='📊 Notificações por Estado',
                 template=filtros['tema'],
-                orientation='h',
-                color='quantidade',
-                color_continuous_scale='Blues',
-                text='quantidade'
+                hole=0.4
             )
-            fig.update_traces(textposition='outside')
-            fig.update_layout(height=400, yaxis_title='', xaxis_title='Quantidade')
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            fig.update_layout(height=400)
             st.plotly_chart(fig, use_container_width=True)
 
-    with col2:
-        if 'nm_local_emissao' in df_of.columns:
-            df_local = df_of['nm_local_emissao'].value_counts().head(10).reset_index()
-            df_local.columns = ['local', 'quantidade']
+        with col2:
+            df_infracao = contagem(df_notif, 'infracao', 10)
+            df_infracao.columns = ['cod_infracao', 'quantidade']
 
             fig = px.bar(
-                df_local,
-                y='local',
+                df_infracao,
+                y='cod_infracao',
                 x='quantidade',
-                title='📍 OFs por Local de Emissão (Top 10)',
+                title='⚖️ Top 10 Códigos de Infração',
                 template=filtros['tema'],
                 orientation='h',
                 color='quantidade',
-                color_continuous_scale='Greens',
+                color_continuous_scale='Reds',
                 text='quantidade'
             )
             fig.update_traces(textposition='outside')
-            fig.update_layout(height=400, yaxis_title='', xaxis_title='Quantidade')
+            fig.update_layout(height=400, yaxis_title='Código', xaxis_title='Quantidade')
             st.plotly_chart(fig, use_container_width=True)
 
-    # ========== CRUZAMENTO: NOTIFICAÇÕES ==========
-    if not df_notif.empty:
-        st.markdown("<div class='sub-header'>📑 Análise de Notificações Fiscais</div>", unsafe_allow_html=True)
-
-        col1, col2 = st.columns(2)
-
-        with col1:
-            if 'nm_estado' in df_notif.columns:
-                df_notif_estado = df_notif['nm_estado'].value_counts().reset_index()
-                df_notif_estado.columns = ['estado', 'quantidade']
-
-                fig = px.pie(
-                    df_notif_estado,
-                    values='quantidade',
-                    names='estado',
-                    title='📊 Notificações por Estado',
-                    template=filtros['tema'],
-                    hole=0.4
-                )
-                fig.update_traces(textposition='inside', textinfo='percent+label')
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
-
-        with col2:
-            if 'cd_infracao' in df_notif.columns:
-                df_infracao = df_notif['cd_infracao'].value_counts().head(10).reset_index()
-                df_infracao.columns = ['cod_infracao', 'quantidade']
-
-                fig = px.bar(
-                    df_infracao,
-                    y='cod_infracao',
-                    x='quantidade',
-                    title='⚖️ Top 10 Códigos de Infração',
-                    template=filtros['tema'],
-                    orientation='h',
-                    color='quantidade',
-                    color_continuous_scale='Reds',
-                    text='quantidade'
-                )
-                fig.update_traces(textposition='outside')
-                fig.update_layout(height=400, yaxis_title='Código', xaxis_title='Quantidade')
-                st.plotly_chart(fig, use_container_width=True)
-
-        # Maiores notificações
+        # Maiores notificações (dez maiores de cada ano, já no servidor)
         st.markdown("#### 🏆 Maiores Notificações por Valor")
-        df_notif['vl_total_num'] = pd.to_numeric(df_notif['vl_total'], errors='coerce')
-        df_top_notif = df_notif.nlargest(10, 'vl_total_num')[['nu_notificacao_fiscal', 'nm_razao_social', 'vl_total', 'vl_pago', 'nm_estado', 'dt_documento']]
+        df_top_notif = df_maiores[df_maiores['tabela'] == 'notif'].nlargest(10, 'valor')[['documento', 'nm_razao_social', 'valor', 'vl_pago', 'nm_estado', 'dt_documento']]
         df_top_notif.columns = ['Notificação', 'Razão Social', 'Valor Total', 'Valor Pago', 'Estado', 'Data']
         st.dataframe(df_top_notif, use_container_width=True)
 
     # ========== CRUZAMENTO: TIFDP ==========
-    if not df_tifdp.empty:
+    if total_tifdp:
         st.markdown("<div class='sub-header'>⚖️ Análise de Termos de Infração (TIFDP)</div>", unsafe_allow_html=True)
 
         col1, col2 = st.columns(2)
 
         with col1:
-            if 'nm_estado' in df_tifdp.columns:
-                df_tifdp_estado = df_tifdp['nm_estado'].value_counts().reset_index()
-                df_tifdp_estado.columns = ['estado', 'quantidade']
-
-                fig = px.pie(
-                    df_tifdp_estado,
-                    values='quantidade',
-                    names='estado',
-                    title='📊 TIFDP por Estado',
-                    template=filtros['tema'],
-                    hole=0.4
-                )
-                fig.update_traces(textposition='inside', textinfo='percent+label')
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
+            df_tifdp_estado = contagem(df_tifdp, 'estado')
+            df_tifdp_estado.columns = ['estado', 'quantidade']
+
+            fig = px.pie(
+                df_tifdp_estado,
+                values='quantidade',
+                names='estado',
+                title='📊 TIFDP por Estado',
+                template=filtros['tema'],
+                hole=0.4
+            )
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            fig.update_layout(height=400)
+            st.plotly_chart(fig, use_container_width=True)
 
         with col2:
             # Taxa de conversão em notificação
-            total_tifdp = len(df_tifdp)
-            convertidos = df_tifdp['nu_notificacao_gerada'].notna().sum() if 'nu_notificacao_gerada' in df_tifdp.columns else 0
+            convertidos = int(totais(df_tifdp)['convertidos'].sum())
             nao_convertidos = total_tifdp - convertidos
 
             fig = go.Figure(data=[go.Pie(
@@ -3773,153 +6697,140 @@ def pagina_itcmd(dados, filtros):
 
         # Maiores valores apurados
         st.markdown("#### 🏆 Maiores Valores Apurados (TIFDP)")
-        df_tifdp['vl_apurado_num'] = pd.to_numeric(df_tifdp['vl_apurado'], errors='coerce')
-        df_top_tifdp = df_tifdp.nlargest(10, 'vl_apurado_num')[['nu_infr_fiscal', 'nm_razao_social', 'vl_apurado', 'vl_pago', 'nm_estado', 'dt_documento']]
+        df_top_tifdp = df_maiores[df_maiores['tabela'] == 'tifdp'].nlargest(10, 'valor')[['documento', 'nm_razao_social', 'valor', 'vl_pago', 'nm_estado', 'dt_documento']]
         df_top_tifdp.columns = ['Termo Infração', 'Razão Social', 'Valor Apurado', 'Valor Pago', 'Estado', 'Data']
         st.dataframe(df_top_tifdp, use_container_width=True)
 
     # ========== CRUZAMENTO: DDE ==========
-    if not df_dde.empty:
+    if total_dde:
         st.markdown("<div class='sub-header'>📄 Análise de Declarações (DDE)</div>", unsafe_allow_html=True)
 
         col1, col2 = st.columns(2)
 
         with col1:
             # Valores declarados vs pagos por ano
-            df_dde['vl_declarado_num'] = pd.to_numeric(df_dde['vl_declarado'], errors='coerce')
-            df_dde['vl_pago_num'] = pd.to_numeric(df_dde['vl_pago'], errors='coerce')
-
-            if 'ano' in df_dde.columns:
-                df_dde_ano = df_dde.groupby('ano').agg({
-                    'vl_declarado_num': 'sum',
-                    'vl_pago_num': 'sum'
-                }).reset_index()
-
-                fig = go.Figure()
-                fig.add_trace(go.Bar(
-                    x=df_dde_ano['ano'],
-                    y=df_dde_ano['vl_declarado_num'],
-                    name='Valor Declarado',
-                    marker_color='#1976d2'
-                ))
-                fig.add_trace(go.Bar(
-                    x=df_dde_ano['ano'],
-                    y=df_dde_ano['vl_pago_num'],
-                    name='Valor Pago',
-                    marker_color='#388e3c'
-                ))
-                fig.update_layout(
-                    title='💰 Declarações: Valores por Ano',
-                    template=filtros['tema'],
-                    height=400,
-                    barmode='group',
-                    xaxis_title='Ano',
-                    yaxis_title='Valor (R$)'
-                )
-                st.plotly_chart(fig, use_container_width=True)
+            df_dde_ano = totais(df_dde).groupby('ano')[['valor_total', 'valor_pago']].sum().reset_index()
+
+            fig = go.Figure()
+            fig.add_trace(go.Bar(
+                x=df_dde_ano['ano'],
+                y=df_dde_ano['valor_total'],
+                name='Valor Declarado',
+                marker_color='#1976d2'
+            ))
+            fig.add_trace(go.Bar(
+                x=df_dde_ano['ano'],
+                y=df_dde_ano['valor_pago'],
+                name='Valor Pago',
+                marker_color='#388e3c'
+            ))
+            fig.update_layout(
+                title='💰 Declarações: Valores por Ano',
+                template=filtros['tema'],
+                height=400,
+                barmode='group',
+                xaxis_title='Ano',
+                yaxis_title='Valor (R$)'
+            )
+            st.plotly_chart(fig, use_container_width=True)
 
         with col2:
             # Distribuição por estado da conta
-            if 'cd_estado_conta' in df_dde.columns:
-                df_estado_conta = df_dde['cd_estado_conta'].value_counts().reset_index()
-                df_estado_conta.columns = ['estado_conta', 'quantidade']
-
-                fig = px.bar(
-                    df_estado_conta,
-                    x='estado_conta',
-                    y='quantidade',
-                    title='📊 Declarações por Estado da Conta',
-                    template=filtros['tema'],
-                    color='quantidade',
-                    color_continuous_scale='Purples',
-                    text='quantidade'
-                )
-                fig.update_traces(textposition='outside')
-                fig.update_layout(height=400, xaxis_title='Código Estado', yaxis_title='Quantidade')
-                st.plotly_chart(fig, use_container_width=True)
+            df_estado_conta = contagem(df_dde, 'estado')
+            df_estado_conta.columns = ['estado_conta', 'quantidade']
+
+            fig = px.bar(
+                df_estado_conta,
+                x='estado_conta',
+                y='quantidade',
+                title='📊 Declarações por Estado da Conta',
+                template=filtros['tema'],
+                color='quantidade',
+                color_continuous_scale='Purples',
+                text='quantidade'
+            )
+            fig.update_traces(textposition='outside')
+            fig.update_layout(height=400, xaxis_title='Código Estado', yaxis_title='Quantidade')
+            st.plotly_chart(fig, use_container_width=True)
 
     # ========== PERFORMANCE - TEMPO DE FISCALIZAÇÃO ==========
     st.markdown("<div class='sub-header'>⏱️ Performance - Tempo de Fiscalização</div>", unsafe_allow_html=True)
 
-    if 'dt_inicio' in df_of.columns and 'dt_fim' in df_of.columns:
-        df_of_tempo = df_of.copy()
-        df_of_tempo['dt_inicio'] = pd.to_datetime(df_of_tempo['dt_inicio'], errors='coerce')
-        df_of_tempo['dt_fim'] = pd.to_datetime(df_of_tempo['dt_fim'], errors='coerce')
-        df_of_tempo['dias_fiscalizacao'] = (df_of_tempo['dt_fim'] - df_of_tempo['dt_inicio']).dt.days
-
-        # Filtrar valores válidos
-        df_of_tempo = df_of_tempo[df_of_tempo['dias_fiscalizacao'].notna() & (df_of_tempo['dias_fiscalizacao'] > 0)]
-
-        if not df_of_tempo.empty:
-            col1, col2, col3 = st.columns(3)
+    # Distribuição (dias, quantidade de OFs), só com durações positivas
+    df_tempo = do_periodo(agregados['tempo'])
 
-            with col1:
-                media_dias = df_of_tempo['dias_fiscalizacao'].mean()
-                st.metric("⏱️ Tempo Médio", f"{media_dias:.0f} dias")
+    if not df_tempo.empty:
+        df_tempo = df_tempo.groupby('dias')['quantidade'].sum().reset_index()
+        acumulado = df_tempo['quantidade'].cumsum()
+        total_tempo = acumulado.iloc[-1]
 
-            with col2:
-                mediana_dias = df_of_tempo['dias_fiscalizacao'].median()
-                st.metric("📊 Mediana", f"{mediana_dias:.0f} dias")
+        def dias_na_posicao(posicao):
+            return df_tempo['dias'].iloc[acumulado.searchsorted(posicao)]
 
-            with col3:
-                max_dias = df_of_tempo['dias_fiscalizacao'].max()
-                st.metric("📈 Máximo", f"{max_dias:.0f} dias")
+        col1, col2, col3 = st.columns(3)
 
-            # Histograma de tempo
-            fig = px.histogram(
-                df_of_tempo,
-                x='dias_fiscalizacao',
-                nbins=30,
-                title='📊 Distribuição do Tempo de Fiscalização',
-                template=filtros['tema'],
-                labels={'dias_fiscalizacao': 'Dias de Fiscalização'}
-            )
-            fig.update_layout(height=350, xaxis_title='Dias', yaxis_title='Frequência')
-            st.plotly_chart(fig, use_container_width=True)
+        with col1:
+            media_dias = (df_tempo['dias'] * df_tempo['quantidade']).sum() / total_tempo
+            st.metric("⏱️ Tempo Médio", f"{media_dias:.0f} dias")
 
-    # ========== ANÁLISE POR MOTIVAÇÃO ==========
-    st.markdown("<div class='sub-header'>🎯 Análise por Motivação da OF</div>", unsafe_allow_html=True)
+        with col2:
+            mediana_dias = (dias_na_posicao((total_tempo + 1) // 2) + dias_na_posicao(total_tempo // 2 + 1)) / 2
+            st.metric("📊 Mediana", f"{mediana_dias:.0f} dias")
 
-    if 'tx_motivacao_of' in df_of.columns:
-        df_motivacao = df_of['tx_motivacao_of'].value_counts().head(10).reset_index()
-        df_motivacao.columns = ['motivacao', 'quantidade']
+        with col3:
+            max_dias = df_tempo['dias'].max()
+            st.metric("📈 Máximo", f"{max_dias:.0f} dias")
 
-        fig = px.bar(
-            df_motivacao,
-            y='motivacao',
-            x='quantidade',
-            title='🎯 OFs por Tipo de Motivação (Top 10)',
+        # Histograma de tempo
+        fig = px.histogram(
+            df_tempo,
+            x='dias',
+            y='quantidade',
+            histfunc='sum',
+            nbins=30,
+            title='📊 Distribuição do Tempo de Fiscalização',
             template=filtros['tema'],
-            orientation='h',
-            color='quantidade',
-            color_continuous_scale='Viridis',
-            text='quantidade'
+            labels={'dias': 'Dias de Fiscalização'}
         )
-        fig.update_traces(textposition='outside')
-        fig.update_layout(height=400, yaxis_title='', xaxis_title='Quantidade')
+        fig.update_layout(height=350, xaxis_title='Dias', yaxis_title='Frequência')
         st.plotly_chart(fig, use_container_width=True)
 
+    # ========== ANÁLISE POR MOTIVAÇÃO ==========
+    st.markdown("<div class='sub-header'>🎯 Análise por Motivação da OF</div>", unsafe_allow_html=True)
+
+    df_motivacao = contagem(df_of, 'motivacao', 10)
+    df_motivacao.columns = ['motivacao', 'quantidade']
+
+    fig = px.bar(
+        df_motivacao,
+        y='motivacao',
+        x='quantidade',
+        title='🎯 OFs por Tipo de Motivação (Top 10)',
+        template=filtros['tema'],
+        orientation='h',
+        color='quantidade',
+        color_continuous_scale='Viridis',
+        text='quantidade'
+    )
+    fig.update_traces(textposition='outside')
+    fig.update_layout(height=400, yaxis_title='', xaxis_title='Quantidade')
+    st.plotly_chart(fig, use_container_width=True)
+
     # ========== INFRAÇÕES COM DESCRIÇÕES ==========
-    df_catalogo = dados_itcmd.get('catalogo_infracoes', pd.DataFrame())
+    # Notificações por infração, já cruzadas com o catálogo no servidor
+    df_infracoes = do_periodo(agregados['infracoes'])
 
-    if not df_catalogo.empty and not df_notif.empty and 'cd_infracao' in df_notif.columns:
+    if not df_infracoes.empty:
         st.markdown("<div class='sub-header'>📖 Análise de Infrações (com Descrições)</div>", unsafe_allow_html=True)
 
-        # Enriquecer notificações com descrições
-        df_notif_enriq = df_notif.merge(
-            df_catalogo[['cd_infracao', 'de_infracao', 'nm_tributo']],
-            on='cd_infracao',
-            how='left'
-        )
-
         col1, col2 = st.columns(2)
 
         with col1:
             # Top infrações por descrição
-            df_inf_desc = df_notif_enriq.groupby('de_infracao').agg({
-                'nu_notificacao_fiscal': 'count',
-                'vl_total': lambda x: pd.to_numeric(x, errors='coerce').sum()
-            }).reset_index()
+            df_inf_desc = df_infracoes.groupby('de_infracao').agg(
+                quantidade=('quantidade', 'sum'),
+                valor_total=('valor_total', 'sum')
+            ).reset_index()
             df_inf_desc.columns = ['descricao', 'quantidade', 'valor_total']
             df_inf_desc = df_inf_desc.nlargest(10, 'quantidade')
 
@@ -3956,38 +6867,28 @@ def pagina_itcmd(dados, filtros):
             fig.update_layout(height=450, yaxis_title='', xaxis_title='Valor (R$)')
             st.plotly_chart(fig, use_container_width=True)
 
-        # Tabela detalhada de infrações
+        # Tabela detalhada de infrações (as mais recentes primeiro)
         st.markdown("#### 📋 Catálogo de Infrações Utilizadas")
-        infracoes_usadas = df_notif_enriq[['cd_infracao', 'de_infracao', 'nm_tributo']].drop_duplicates()
+        infracoes_usadas = df_infracoes.groupby(
+            ['cd_infracao', 'de_infracao', 'nm_tributo'], dropna=False
+        )['ultima'].max().reset_index().sort_values('ultima', ascending=False)
+        infracoes_usadas = infracoes_usadas[['cd_infracao', 'de_infracao', 'nm_tributo']]
         infracoes_usadas.columns = ['Código', 'Descrição', 'Tributo']
         st.dataframe(infracoes_usadas.head(20), use_container_width=True)
 
     # ========== PERFORMANCE DOS AFREs ==========
-    df_afre = dados_itcmd.get('afre_periodo', pd.DataFrame())
+    df_afre_periodo = agregados['afre_periodo']
 
-    if not df_afre.empty:
-        st.markdown("<div class='sub-header'>👥 Performance dos AFREs no ITCMD</div>", unsafe_allow_html=True)
+    if not df_afre_periodo.empty and df_afre_periodo['periodos'].iloc[0] > 0:
+        st.markdown(f"<div class='sub-header'>👥 Performance dos AFREs no {setor}</div>", unsafe_allow_html=True)
 
         # Contar OFs por AFRE (emitente)
-        df_of_afre = df_of.copy()
-        df_of_afre['nu_mat_emitente'] = df_of_afre['nu_mat_emitente'].astype(str).str.strip()
-
-        df_ranking_afre = df_of_afre.groupby('nu_mat_emitente').agg({
-            'nu_of': 'count',
-            'dt_documento': ['min', 'max']
-        }).reset_index()
-        df_ranking_afre.columns = ['matricula', 'qtd_ofs', 'primeira_of', 'ultima_of']
-
-        # Tentar enriquecer com nome do AFRE
-        if 'nm_afre' in df_afre.columns:
-            df_afre_nomes = df_afre[['cd_matricula', 'nm_afre']].drop_duplicates()
-            df_afre_nomes['cd_matricula'] = df_afre_nomes['cd_matricula'].astype(str).str.strip()
-            df_ranking_afre = df_ranking_afre.merge(
-                df_afre_nomes,
-                left_on='matricula',
-                right_on='cd_matricula',
-                how='left'
-            )
+        df_ranking_afre = do_periodo(agregados['afres']).groupby('matricula').agg(
+            qtd_ofs=('qtd_ofs', 'sum'),
+            primeira_of=('primeira_of', 'min'),
+            ultima_of=('ultima_of', 'max')
+        ).reset_index()
+        df_ranking_afre = obter_dimensao(engine, 'afres').enriquecer(df_ranking_afre, 'matricula', ['nome_afre'])
 
         col1, col2, col3 = st.columns(3)
 
@@ -4006,20 +6907,14 @@ def pagina_itcmd(dados, filtros):
         # Ranking de AFREs
         st.markdown("#### 🏆 Ranking de AFREs por Volume de OFs")
         df_ranking_display = df_ranking_afre.nlargest(15, 'qtd_ofs')
-
-        if 'nm_afre' in df_ranking_display.columns:
-            colunas_rank = ['matricula', 'nm_afre', 'qtd_ofs', 'primeira_of', 'ultima_of']
-        else:
-            colunas_rank = ['matricula', 'qtd_ofs', 'primeira_of', 'ultima_of']
-
-        colunas_rank = [c for c in colunas_rank if c in df_ranking_display.columns]
-        st.dataframe(df_ranking_display[colunas_rank], use_container_width=True)
+        st.dataframe(df_ranking_display[['matricula', 'nome_afre', 'qtd_ofs', 'primeira_of', 'ultima_of']], use_container_width=True)
 
         # Gráfico de barras
         fig = px.bar(
             df_ranking_display.head(10),
             x='matricula',
             y='qtd_ofs',
+            hover_data=['nome_afre'],
             title='📊 Top 10 AFREs por Quantidade de OFs',
             template=filtros['tema'],
             color='qtd_ofs',
@@ -4031,65 +6926,57 @@ def pagina_itcmd(dados, filtros):
         st.plotly_chart(fig, use_container_width=True)
 
     # ========== PERFIL DOS CONTRIBUINTES ==========
-    df_contrib = dados_itcmd.get('contribuintes', pd.DataFrame())
+    df_perfil = agregados['perfil']
 
-    if not df_contrib.empty:
+    if not df_perfil.empty:
         st.markdown("<div class='sub-header'>🏢 Perfil dos Contribuintes</div>", unsafe_allow_html=True)
 
         col1, col2 = st.columns(2)
 
         with col1:
             # Distribuição por CNAE
-            if 'de_secao' in df_contrib.columns:
-                df_cnae = df_contrib['de_secao'].value_counts().head(10).reset_index()
-                df_cnae.columns = ['setor', 'quantidade']
-
-                fig = px.pie(
-                    df_cnae,
-                    values='quantidade',
-                    names='setor',
-                    title='🏭 Distribuição por Setor Econômico (CNAE)',
-                    template=filtros['tema'],
-                    hole=0.4
-                )
-                fig.update_traces(textposition='inside', textinfo='percent+label')
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
+            df_cnae = contagem(df_perfil, 'secao', 10)
+            df_cnae.columns = ['setor', 'quantidade']
+
+            fig = px.pie(
+                df_cnae,
+                values='quantidade',
+                names='setor',
+                title='🏭 Distribuição por Setor Econômico (CNAE)',
+                template=filtros['tema'],
+                hole=0.4
+            )
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            fig.update_layout(height=400)
+            st.plotly_chart(fig, use_container_width=True)
 
         with col2:
             # Distribuição por regime tributário
-            if 'nm_enq_empresa' in df_contrib.columns:
-                df_regime = df_contrib['nm_enq_empresa'].value_counts().reset_index()
-                df_regime.columns = ['regime', 'quantidade']
-
-                fig = px.bar(
-                    df_regime,
-                    x='regime',
-                    y='quantidade',
-                    title='📊 Distribuição por Regime Tributário',
-                    template=filtros['tema'],
-                    color='quantidade',
-                    color_continuous_scale='Purples',
-                    text='quantidade'
-                )
-                fig.update_traces(textposition='outside')
-                fig.update_layout(height=400, xaxis_title='Regime', yaxis_title='Quantidade')
-                st.plotly_chart(fig, use_container_width=True)
+            df_regime = contagem(df_perfil, 'regime')
+            df_regime.columns = ['regime', 'quantidade']
+
+            fig = px.bar(
+                df_regime,
+                x='regime',
+                y='quantidade',
+                title='📊 Distribuição por Regime Tributário',
+                template=filtros['tema'],
+                color='quantidade',
+                color_continuous_scale='Purples',
+                text='quantidade'
+            )
+            fig.update_traces(textposition='outside')
+            fig.update_layout(height=400, xaxis_title='Regime', yaxis_title='Quantidade')
+            st.plotly_chart(fig, use_container_width=True)
 
         # Análise de reincidência
         st.markdown("#### 🔄 Análise de Reincidência")
 
-        # Contar contribuintes com múltiplas ocorrências
-        df_todas_ies = pd.concat([
-            df_dde[['nu_ie']].dropna() if not df_dde.empty and 'nu_ie' in df_dde.columns else pd.DataFrame(),
-            df_notif[['nu_ie']].dropna() if not df_notif.empty and 'nu_ie' in df_notif.columns else pd.DataFrame(),
-            df_tifdp[['nu_ie']].dropna() if not df_tifdp.empty and 'nu_ie' in df_tifdp.columns else pd.DataFrame()
-        ])
+        # Contribuintes com mais de uma ocorrência em DDE, notificações e TIFDP
+        total_contrib = int(contagens['total_ies'])
 
-        if not df_todas_ies.empty:
-            reincidencia = df_todas_ies['nu_ie'].value_counts()
-            reincidentes = (reincidencia > 1).sum()
-            total_contrib = len(reincidencia)
+        if total_contrib:
+            reincidentes = int(contagens['reincidentes'])
 
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -4101,7 +6988,7 @@ def pagina_itcmd(dados, filtros):
                 st.metric("📊 Taxa Reincidência", f"{taxa_reinc:.1f}%")
 
     # ========== ACOMPANHAMENTOS (FOLLOW-UPS) ==========
-    df_acomp = dados_itcmd.get('acompanhamentos', pd.DataFrame())
+    df_acomp = agregados['acompanhamentos']
 
     if not df_acomp.empty:
         st.markdown("<div class='sub-header'>📋 Acompanhamentos (Follow-ups)</div>", unsafe_allow_html=True)
@@ -4109,46 +6996,46 @@ def pagina_itcmd(dados, filtros):
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            total_acomp = len(df_acomp)
+            total_acomp = int(totais(df_acomp)['quantidade'].sum())
             st.metric("📋 Total Acompanhamentos", f"{total_acomp:,}")
 
         with col2:
-            ofs_com_acomp = df_acomp['nu_documento_of'].nunique()
+            if not df_ciclo.empty:
+                ofs_com_acomp = int((df_ciclo['qtd_acomp'] > 0).sum())
+            else:
+                ofs_com_acomp = int(df_acomp.loc[df_acomp['dimensao'] == 'ofs', 'quantidade'].sum())
             st.metric("📁 OFs com Follow-up", f"{ofs_com_acomp:,}")
 
         with col3:
-            taxa_acomp = (ofs_com_acomp / len(df_of) * 100) if len(df_of) > 0 else 0
+            taxa_acomp = (ofs_com_acomp / total_ofs * 100) if total_ofs > 0 else 0
             st.metric("📊 Taxa Follow-up", f"{taxa_acomp:.1f}%")
 
         col1, col2 = st.columns(2)
 
         with col1:
             # Status dos acompanhamentos
-            if 'nm_estado_os' in df_acomp.columns:
-                df_status_acomp = df_acomp['nm_estado_os'].value_counts().reset_index()
-                df_status_acomp.columns = ['status', 'quantidade']
-
-                fig = px.pie(
-                    df_status_acomp,
-                    values='quantidade',
-                    names='status',
-                    title='📊 Status dos Acompanhamentos',
-                    template=filtros['tema'],
-                    hole=0.4
-                )
-                fig.update_traces(textposition='inside', textinfo='percent+label')
-                fig.update_layout(height=350)
-                st.plotly_chart(fig, use_container_width=True)
+            df_status_acomp = contagem(df_acomp, 'estado')
+            df_status_acomp.columns = ['status', 'quantidade']
+
+            fig = px.pie(
+                df_status_acomp,
+                values='quantidade',
+                names='status',
+                title='📊 Status dos Acompanhamentos',
+                template=filtros['tema'],
+                hole=0.4
+            )
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            fig.update_layout(height=350)
+            st.plotly_chart(fig, use_container_width=True)
 
         with col2:
             # Últimos acompanhamentos
             st.markdown("#### 📋 Últimos Acompanhamentos")
-            colunas_acomp = ['nu_documento_of', 'nm_estado_os', 'dt_documento_os', 'de_motivo_os']
-            colunas_acomp = [c for c in colunas_acomp if c in df_acomp.columns]
-            st.dataframe(df_acomp[colunas_acomp].head(10), use_container_width=True)
+            st.dataframe(agregados['acompanhamentos_recentes'], use_container_width=True)
 
     # ========== TERMOS DE ENCERRAMENTO ==========
-    df_termo = dados_itcmd.get('termos_encerramento', pd.DataFrame())
+    df_termo = agregados['termos']
 
     if not df_termo.empty:
         st.markdown("<div class='sub-header'>📑 Termos de Encerramento</div>", unsafe_allow_html=True)
@@ -4156,142 +7043,671 @@ def pagina_itcmd(dados, filtros):
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            total_termos = len(df_termo)
+            total_termos = int(totais(df_termo)['quantidade'].sum())
             st.metric("📑 Total Termos", f"{total_termos:,}")
 
         with col2:
-            ofs_encerradas = df_termo['os'].nunique()
+            if not df_ciclo.empty:
+                ofs_encerradas = int(df_ciclo['encerrada'].sum())
+            else:
+                ofs_encerradas = int(df_termo.loc[df_termo['dimensao'] == 'ofs', 'quantidade'].sum())
             st.metric("✅ OFs Encerradas", f"{ofs_encerradas:,}")
 
         with col3:
-            taxa_encerramento = (ofs_encerradas / len(df_of) * 100) if len(df_of) > 0 else 0
+            taxa_encerramento = (ofs_encerradas / total_ofs * 100) if total_ofs > 0 else 0
             st.metric("📊 Taxa Encerramento", f"{taxa_encerramento:.1f}%")
 
         col1, col2 = st.columns(2)
 
         with col1:
             # Status dos encerramentos
-            if 'nm_estado' in df_termo.columns:
-                df_status_termo = df_termo['nm_estado'].value_counts().reset_index()
-                df_status_termo.columns = ['status', 'quantidade']
-
-                fig = px.pie(
-                    df_status_termo,
-                    values='quantidade',
-                    names='status',
-                    title='📊 Status dos Encerramentos',
+            df_status_termo = contagem(df_termo, 'estado')
+            df_status_termo.columns = ['status', 'quantidade']
+
+            fig = px.pie(
+                df_status_termo,
+                values='quantidade',
+                names='status',
+                title='📊 Status dos Encerramentos',
+                template=filtros['tema'],
+                hole=0.4
+            )
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            fig.update_layout(height=350)
+            st.plotly_chart(fig, use_container_width=True)
+
+        with col2:
+            # Funil de conclusão: as mesmas OFs em todas as etapas
+            st.markdown("#### 🔄 Funil de Conclusão")
+
+            if df_ciclo.empty:
+                st.info("Ciclo de vida das OFs indisponível.")
+            else:
+                fig = go.Figure(go.Funnel(
+                    y=['OFs Abertas', 'Com Notificação', 'Encerradas'],
+                    x=[len(df_ciclo), int(df_ciclo['tem_notificacao'].sum()), int(df_ciclo['encerrada'].sum())],
+                    textinfo="value+percent initial",
+                    marker_color=['#1976d2', '#388e3c', '#7b1fa2']
+                ))
+                fig.update_layout(
+                    title='Funil: OF → Notificação → Encerramento',
                     template=filtros['tema'],
-                    hole=0.4
+                    height=350
                 )
-                fig.update_traces(textposition='inside', textinfo='percent+label')
-                fig.update_layout(height=350)
                 st.plotly_chart(fig, use_container_width=True)
 
+        # Tabela de termos recentes
+        st.markdown("#### 📋 Termos de Encerramento Recentes")
+        st.dataframe(agregados['termos_recentes'], use_container_width=True)
+
+    # ========== CICLO DE VIDA DAS OFs ==========
+    if not df_ciclo.empty:
+        st.markdown("<div class='sub-header'>⏱️ Ciclo de Vida das OFs</div>", unsafe_allow_html=True)
+        st.caption("Uma linha por OF emitida nos anos filtrados, com todos os seus documentos. "
+                   "Prazos contados em dias desde a emissão da OF.")
+
+        dias_notificacao = df_ciclo['dias_ate_notificacao'].dropna()
+        dias_encerramento = df_ciclo['dias_ate_encerramento'].dropna()
+
+        col1, col2, col3, col4 = st.columns(4)
+
+        with col1:
+            st.metric("📑 Mediana até Notificação",
+                      f"{dias_notificacao.median():.0f} dias" if not dias_notificacao.empty else "N/A")
+
         with col2:
-            # Funil de conclusão
-            st.markdown("#### 🔄 Funil de Conclusão")
+            st.metric("✅ Mediana até Encerramento",
+                      f"{dias_encerramento.median():.0f} dias" if not dias_encerramento.empty else "N/A")
+
+        with col3:
+            quitadas = int((df_ciclo['situacao_pagamento'] == 'Quitada').sum())
+            st.metric("💵 OFs Quitadas", f"{quitadas:,}")
 
-            total_ofs = len(df_of)
-            ofs_com_notif = df_notif['nu_of'].nunique() if not df_notif.empty else 0
-            ofs_encerradas = df_termo['os'].nunique()
+        with col4:
+            em_aberto = int((df_ciclo['situacao_pagamento'] == 'Em aberto').sum())
+            st.metric("⏳ OFs sem Pagamento", f"{em_aberto:,}")
 
-            fig = go.Figure(go.Funnel(
-                y=['OFs Abertas', 'Com Notificação', 'Encerradas'],
-                x=[total_ofs, ofs_com_notif, ofs_encerradas],
-                textinfo="value+percent initial",
-                marker_color=['#1976d2', '#388e3c', '#7b1fa2']
-            ))
-            fig.update_layout(
-                title='Funil: OF → Notificação → Encerramento',
+        col1, col2 = st.columns(2)
+
+        with col1:
+            fig = px.histogram(
+                pd.DataFrame({'dias': dias_notificacao}),
+                x='dias',
+                nbins=30,
+                title='📑 Dias da OF até a Primeira Notificação',
                 template=filtros['tema'],
-                height=350
+                color_discrete_sequence=['#388e3c']
             )
+            fig.update_layout(height=350, xaxis_title='Dias', yaxis_title='OFs')
             st.plotly_chart(fig, use_container_width=True)
 
-        # Tabela de termos recentes
-        st.markdown("#### 📋 Termos de Encerramento Recentes")
-        colunas_termo = ['nu_termo_encerramento', 'os', 'nm_estado', 'dt_documento', 'dt_encerramento']
-        colunas_termo = [c for c in colunas_termo if c in df_termo.columns]
-        st.dataframe(df_termo[colunas_termo].head(15), use_container_width=True)
+        with col2:
+            fig = px.histogram(
+                pd.DataFrame({'dias': dias_encerramento}),
+                x='dias',
+                nbins=30,
+                title='✅ Dias da OF até o Encerramento',
+                template=filtros['tema'],
+                color_discrete_sequence=['#7b1fa2']
+            )
+            fig.update_layout(height=350, xaxis_title='Dias', yaxis_title='OFs')
+            st.plotly_chart(fig, use_container_width=True)
+
+        # Situação do pagamento por OF (pago × lançado em notificações e TIFDP)
+        df_pagamento = df_ciclo.groupby('situacao_pagamento').agg(
+            ofs=('nu_of', 'size'), valor_lancado=('valor_lancado', 'sum'), valor_pago=('valor_pago', 'sum')
+        ).reset_index()
+
+        fig = px.bar(
+            df_pagamento,
+            x='situacao_pagamento',
+            y='ofs',
+            title='💰 Situação do Pagamento por OF',
+            template=filtros['tema'],
+            color='situacao_pagamento',
+            hover_data=['valor_lancado', 'valor_pago'],
+            text='ofs'
+        )
+        fig.update_traces(textposition='outside')
+        fig.update_layout(height=350, xaxis_title='Situação', yaxis_title='OFs', showlegend=False)
+        st.plotly_chart(fig, use_container_width=True)
 
     # ========== DETALHAMENTO - TABELAS ==========
     st.markdown("<div class='sub-header'>📋 Detalhamento dos Dados</div>", unsafe_allow_html=True)
 
-    tab1, tab2, tab3, tab4 = st.tabs(["📋 Ordens de Fiscalização", "📄 Declarações (DDE)", "📑 Notificações", "⚖️ Termos Infração"])
-
-    with tab1:
-        st.markdown("#### Ordens de Fiscalização do ITCMD")
-        colunas_of = ['nu_of', 'dt_documento', 'nm_estado', 'nm_gerencia', 'tx_motivacao_of', 'nm_local_emissao']
-        colunas_of_disponiveis = [c for c in colunas_of if c in df_of.columns]
-        st.dataframe(df_of[colunas_of_disponiveis].head(100), use_container_width=True)
-        st.caption(f"Exibindo até 100 de {len(df_of):,} registros")
-
-    with tab2:
-        if not df_dde.empty:
-            st.markdown("#### Declarações vinculadas às OFs do ITCMD")
-            colunas_dde = ['nu_declaracao', 'nu_of', 'nm_razao_social', 'vl_declarado', 'vl_pago', 'dt_entrega']
-            colunas_dde_disponiveis = [c for c in colunas_dde if c in df_dde.columns]
-            st.dataframe(df_dde[colunas_dde_disponiveis].head(100), use_container_width=True)
-            st.caption(f"Exibindo até 100 de {len(df_dde):,} registros")
-        else:
-            st.info("Nenhuma declaração encontrada.")
-
-    with tab3:
-        if not df_notif.empty:
-            st.markdown("#### Notificações Fiscais vinculadas às OFs do ITCMD")
-            colunas_notif = ['nu_notificacao_fiscal', 'nu_of', 'nm_razao_social', 'vl_total', 'vl_pago', 'nm_estado', 'dt_documento']
-            colunas_notif_disponiveis = [c for c in colunas_notif if c in df_notif.columns]
-            st.dataframe(df_notif[colunas_notif_disponiveis].head(100), use_container_width=True)
-            st.caption(f"Exibindo até 100 de {len(df_notif):,} registros")
-        else:
-            st.info("Nenhuma notificação encontrada.")
-
-    with tab4:
-        if not df_tifdp.empty:
-            st.markdown("#### Termos de Infração vinculados às OFs do ITCMD")
-            colunas_tifdp = ['nu_infr_fiscal', 'nu_of', 'nm_razao_social', 'vl_apurado', 'vl_pago', 'nm_estado', 'dt_documento']
-            colunas_tifdp_disponiveis = [c for c in colunas_tifdp if c in df_tifdp.columns]
-            st.dataframe(df_tifdp[colunas_tifdp_disponiveis].head(100), use_container_width=True)
-            st.caption(f"Exibindo até 100 de {len(df_tifdp):,} registros")
-        else:
-            st.info("Nenhum termo de infração encontrado.")
+    # No modo agregado, as linhas brutas só são buscadas quando pedidas
+    if not dados_itcmd and st.checkbox("📥 Carregar registros detalhados (OFs, DDE, notificações e TIFDP)",
+                                       key=f'detalhados_{setor}'):
+        with st.spinner(f'⏳ Carregando registros do {setor}...'):
+            dados_itcmd = carregar_pacote()
+
+    if dados_itcmd:
+        df_of = dados_itcmd.get('of_itcmd', pd.DataFrame())
+        df_dde = dados_itcmd.get('dde_itcmd', pd.DataFrame())
+        df_notif = dados_itcmd.get('notif_itcmd', pd.DataFrame())
+        df_tifdp = dados_itcmd.get('tifdp_itcmd', pd.DataFrame())
+
+        # Aplicar filtros de ano se disponíveis
+        if anos and 'ano' in df_of.columns:
+            df_of = df_of[df_of['ano'].isin(anos)]
+            if not df_dde.empty and 'ano' in df_dde.columns:
+                df_dde = df_dde[df_dde['ano'].isin(anos)]
+            if not df_notif.empty and 'ano' in df_notif.columns:
+                df_notif = df_notif[df_notif['ano'].isin(anos)]
+            if not df_tifdp.empty and 'ano' in df_tifdp.columns:
+                df_tifdp = df_tifdp[df_tifdp['ano'].isin(anos)]
+
+        # Nome do município pelo código (dimensão de municípios)
+        municipios = obter_dimensao(engine, 'municipios')
+        df_dde, df_notif, df_tifdp = (
+            municipios.enriquecer(df, 'cd_munic', ['nm_munic']) if 'cd_munic' in df.columns else df
+            for df in (df_dde, df_notif, df_tifdp)
+        )
+
+        tab1, tab2, tab3, tab4 = st.tabs(["📋 Ordens de Fiscalização", "📄 Declarações (DDE)", "📑 Notificações", "⚖️ Termos Infração"])
+
+        with tab1:
+            st.markdown(f"#### Ordens de Fiscalização do {setor}")
+            colunas_of = ['nu_of', 'dt_documento', 'nm_estado', 'nm_gerencia', 'tx_motivacao_of', 'nm_local_emissao']
+            colunas_of_disponiveis = [c for c in colunas_of if c in df_of.columns]
+            st.dataframe(df_of[colunas_of_disponiveis].head(100), use_container_width=True)
+            st.caption(f"Exibindo até 100 de {len(df_of):,} registros")
+
+        with tab2:
+            if not df_dde.empty:
+                st.markdown(f"#### Declarações vinculadas às OFs do {setor}")
+                colunas_dde = ['nu_declaracao', 'nu_of', 'nm_razao_social', 'nm_munic', 'vl_declarado', 'vl_pago', 'dt_entrega']
+                colunas_dde_disponiveis = [c for c in colunas_dde if c in df_dde.columns]
+                st.dataframe(df_dde[colunas_dde_disponiveis].head(100), use_container_width=True)
+                st.caption(f"Exibindo até 100 de {len(df_dde):,} registros")
+            else:
+                st.info("Nenhuma declaração encontrada.")
+
+        with tab3:
+            if not df_notif.empty:
+                st.markdown(f"#### Notificações Fiscais vinculadas às OFs do {setor}")
+                colunas_notif = ['nu_notificacao_fiscal', 'nu_of', 'nm_razao_social', 'nm_munic', 'vl_total', 'vl_pago', 'nm_estado', 'dt_documento']
+                colunas_notif_disponiveis = [c for c in colunas_notif if c in df_notif.columns]
+                st.dataframe(df_notif[colunas_notif_disponiveis].head(100), use_container_width=True)
+                st.caption(f"Exibindo até 100 de {len(df_notif):,} registros")
+            else:
+                st.info("Nenhuma notificação encontrada.")
+
+        with tab4:
+            if not df_tifdp.empty:
+                st.markdown(f"#### Termos de Infração vinculados às OFs do {setor}")
+                colunas_tifdp = ['nu_infr_fiscal', 'nu_of', 'nm_razao_social', 'nm_munic', 'vl_apurado', 'vl_pago', 'nm_estado', 'dt_documento']
+                colunas_tifdp_disponiveis = [c for c in colunas_tifdp if c in df_tifdp.columns]
+                st.dataframe(df_tifdp[colunas_tifdp_disponiveis].head(100), use_container_width=True)
+                st.caption(f"Exibindo até 100 de {len(df_tifdp):,} registros")
+            else:
+                st.info("Nenhum termo de infração encontrado.")
 
     # ========== RESUMO FINAL ==========
-    st.markdown("<div class='sub-header'>📊 Resumo Consolidado ITCMD</div>", unsafe_allow_html=True)
+    st.markdown(f"<div class='sub-header'>📊 Resumo Consolidado {setor}</div>", unsafe_allow_html=True)
 
     # Calcular métricas consolidadas
-    valor_total_lancado = 0
-    valor_total_pago = 0
-
-    if not df_notif.empty and 'vl_total' in df_notif.columns:
-        valor_total_lancado += pd.to_numeric(df_notif['vl_total'], errors='coerce').sum()
-    if not df_tifdp.empty and 'vl_apurado' in df_tifdp.columns:
-        valor_total_lancado += pd.to_numeric(df_tifdp['vl_apurado'], errors='coerce').sum()
-
-    if not df_notif.empty and 'vl_pago' in df_notif.columns:
-        valor_total_pago += pd.to_numeric(df_notif['vl_pago'], errors='coerce').sum()
-    if not df_tifdp.empty and 'vl_pago' in df_tifdp.columns:
-        valor_total_pago += pd.to_numeric(df_tifdp['vl_pago'], errors='coerce').sum()
-    if not df_dde.empty and 'vl_pago' in df_dde.columns:
-        valor_total_pago += pd.to_numeric(df_dde['vl_pago'], errors='coerce').sum()
+    valor_total_lancado = valor_notif + valor_tifdp
+    valor_total_pago = total_pago
 
     taxa_recuperacao_geral = (valor_total_pago / valor_total_lancado * 100) if valor_total_lancado > 0 else 0
 
     st.markdown(f"""
     <div class='alert-positivo'>
-    <b>📊 RESUMO DO SETOR ITCMD:</b><br>
-    • <b>Total de OFs:</b> {len(df_of):,}<br>
+    <b>📊 RESUMO DO SETOR {setor}:</b><br>
+    • <b>Total de OFs:</b> {total_ofs:,}<br>
     • <b>Valor Total Lançado:</b> {formatar_valor(valor_total_lancado)}<br>
     • <b>Valor Total Recuperado:</b> {formatar_valor(valor_total_pago)}<br>
     • <b>Taxa de Recuperação:</b> {taxa_recuperacao_geral:.2f}%<br>
-    • <b>Contribuintes Fiscalizados:</b> {len(contribuintes):,}
+    • <b>Contribuintes Fiscalizados:</b> {int(contagens['contribuintes']):,}
+    </div>
+    """, unsafe_allow_html=True)
+
+    # ========== COMPARATIVO ENTRE SETORES ==========
+    if len(SETORES_OF) > 1:
+        st.markdown("<div class='sub-header'>🗂️ Comparativo entre Setores</div>", unsafe_allow_html=True)
+
+        with st.spinner(f'⏳ Carregando {len(SETORES_OF)} setores em paralelo...'):
+            if MODO_ITCMD == 'agregado':
+                versao = versao_consulta(engine, *consultas_do_grupo('itcmd_agregado'))
+                por_setor = carregar_setores(
+                    SETORES_OF, lambda sigla: carregar_agregados_setor(engine, sigla, emitentes_setor(sigla), versao)
+                )
+            else:
+                pacotes = carregar_dados_setores(engine, SETORES_OF, versao_consulta(engine, *consultas_do_grupo('itcmd')))
+                dim_infracoes = obter_dimensao(engine, 'infracoes')
+                por_setor = {
+                    sigla: pacote if isinstance(pacote, Exception) else resumir_itcmd(pacote, dim_infracoes)
+                    for sigla, pacote in pacotes.items()
+                }
+
+        linhas = []
+        for sigla, agregados_setor in por_setor.items():
+            if isinstance(agregados_setor, Exception):
+                linhas.append({'Setor': sigla, 'Erro': str(agregados_setor)[:200]})
+                continue
+            docs = totais(do_periodo(agregados_setor['documentos']))
+            por_tabela = docs.groupby('tabela')[['quantidade', 'valor_total']].sum() if not docs.empty else pd.DataFrame()
+            linha = {'Setor': sigla, 'OFs': int(totais(do_periodo(agregados_setor['of']))['quantidade'].sum())}
+            for tabela, rotulo in (('dde', 'DDE'), ('notif', 'Notificações'), ('tifdp', 'TIFDP')):
+                linha[rotulo] = int(por_tabela['quantidade'].get(tabela, 0)) if not por_tabela.empty else 0
+            lancado = por_tabela['valor_total'].reindex(['notif', 'tifdp']).fillna(0).sum() if not por_tabela.empty else 0
+            pago = docs['valor_pago'].sum() if not docs.empty else 0
+            linha.update({
+                'Valor Lançado': lancado,
+                'Valor Pago': pago,
+                'Taxa Recuperação (%)': pago / lancado * 100 if lancado > 0 else 0
+            })
+            linhas.append(linha)
+
+        falhas = [linha['Setor'] for linha in linhas if 'Erro' in linha]
+        if falhas:
+            st.warning(f"⚠️ Setores não carregados: {', '.join(falhas)} (motivo na coluna Erro)")
+        if linhas:
+            st.dataframe(
+                pd.DataFrame(linhas).style.format({
+                    'Valor Lançado': formatar_valor, 'Valor Pago': formatar_valor,
+                    'Taxa Recuperação (%)': '{:.1f}%', 'OFs': '{:,.0f}', 'DDE': '{:,.0f}',
+                    'Notificações': '{:,.0f}', 'TIFDP': '{:,.0f}'
+                }, na_rep='-'),
+                use_container_width=True,
+                hide_index=True
+            )
+
+# =============================================================================
+# 8.13. PÁGINA DE DIAGNÓSTICO
+# =============================================================================
+
+def pagina_diagnostico(dados, filtros):
+    """Diagnóstico de desempenho do carregamento de dados."""
+    st.markdown("<h1 class='main-header'>🛠️ Diagnóstico de Desempenho</h1>", unsafe_allow_html=True)
+
+    st.markdown(f"""
+    <div class='info-box'>
+    <b>🛠️ Ferramentas de desempenho do carregamento</b><br>
+    Backend de leitura ativo: <b>{FETCH_BACKEND}</b> (lotes de {TAMANHO_LOTE_ARROW:,} linhas).
+    Para voltar ao caminho original, defina <code>fetch_backend = "pandas"</code> na seção
+    <code>[fisca]</code> do secrets.toml ou a variável <code>FISCA_FETCH_BACKEND=pandas</code>.
     </div>
     """, unsafe_allow_html=True)
 
+    engine = st.session_state.get('engine')
+    if engine is None:
+        st.error("❌ Conexão com banco de dados não disponível.")
+        return
+
+    # ========== POOL DE CONEXÕES ==========
+    st.markdown("<div class='sub-header'>🔌 Pool de Conexões</div>", unsafe_allow_html=True)
+    st.caption(f"Tamanho {POOL_TAMANHO} + overflow {POOL_OVERFLOW} · timeout {POOL_TIMEOUT}s · "
+               f"reciclagem {POOL_RECICLAR}s · pre-ping {'ativo' if POOL_PRE_PING else 'inativo'} · "
+               f"aquecimento {POOL_AQUECIMENTO} conexões")
+
+    pool = metricas_pool(engine)
+    formatar = lambda valor, modelo: modelo.format(valor) if valor is not None else "-"
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Em uso", formatar(pool['em_uso'], "{}"))
+        st.metric("Ociosas", formatar(pool['ociosas'], "{}"))
+    with col2:
+        st.metric("Espera p50", formatar(pool['espera_p50_ms'], "{:.1f} ms"))
+        st.metric("Espera p95", formatar(pool['espera_p95_ms'], "{:.1f} ms"))
+    with col3:
+        st.metric("Handshakes", f"{pool['handshakes']:,}")
+        st.metric("Handshake p50", formatar(pool['handshake_p50_s'], "{:.2f} s"))
+    with col4:
+        st.metric("Overflow", formatar(pool['overflow'], "{}"))
+        st.metric("Conexões invalidadas", f"{pool['invalidacoes']:,}")
+
+    # ========== DISJUNTOR ==========
+    st.markdown("<div class='sub-header'>🧯 Disjuntor do Backend</div>", unsafe_allow_html=True)
+    st.caption(f"Abre com {DISJUNTOR_LIMIAR * 100:.0f}% de falhas ou consultas lentas (acima de "
+               f"{FRACAO_PRAZO_LENTA * 100:.0f}% do prazo) em pelo menos {DISJUNTOR_MIN_CHAMADAS} "
+               f"chamadas dos últimos {DISJUNTOR_JANELA_S} s; sonda a cada {INTERVALO_SONDA_DISJUNTOR} s.")
+
+    disjuntor = estado_disjuntor()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Estado", "🔴 Aberto" if disjuntor['aberto_em'] else "🟢 Fechado")
+    with col2:
+        st.metric("Chamadas na janela", f"{disjuntor['chamadas']:,}")
+    with col3:
+        st.metric("Falhas", f"{disjuntor['falhas']:,}")
+    with col4:
+        st.metric("Lentas", f"{disjuntor['lentas']:,}")
+    if disjuntor['aberto_em']:
+        st.warning(f"Aberto desde {disjuntor['aberto_em'].strftime('%d/%m %H:%M:%S')}: {disjuntor['motivo']}")
+    if disjuntor['ultima_sonda']:
+        instante, erro = disjuntor['ultima_sonda']
+        st.caption(f"Última sonda {instante.strftime('%d/%m %H:%M:%S')}: "
+                   f"{'falhou — ' + erro if erro else 'conexão restabelecida'}")
+
+    # ========== BENCHMARK DE LEITURA ==========
+    st.markdown("<div class='sub-header'>⚡ Benchmark de Leitura (pandas × Arrow)</div>", unsafe_allow_html=True)
+
+    if pa is None:
+        st.warning("⚠️ pyarrow não está instalado; apenas o backend pandas está disponível.")
+
+    col1, col2 = st.columns([3, 1])
+
+    with col1:
+        consultas_sel = st.multiselect(
+            "Consultas:",
+            list(TABELAS_CONFIG.keys()),
+            default=['empresas_resumo', 'metricas_afre']
+        )
+
+    with col2:
+        repeticoes = st.slider("Repetições:", 1, 5, 1)
+
+    if st.button("▶️ Executar Benchmark", type="primary") and consultas_sel:
+        consultas = {key: TABELAS_CONFIG[key]['query'] for key in consultas_sel}
+
+        with st.spinner("⏳ Executando consultas nos dois backends..."):
+            df_bench = benchmark_fetch(engine, consultas, repeticoes)
+
+        df_resumo = df_bench.groupby(['consulta', 'backend']).agg(
+            linhas=('linhas', 'max'),
+            segundos=('segundos', 'median'),
+            linhas_por_segundo=('linhas_por_segundo', 'median')
+        ).reset_index()
+
+        fig = px.bar(
+            df_resumo,
+            x='consulta',
+            y='linhas_por_segundo',
+            color='backend',
+            barmode='group',
+            title='⚡ Linhas por Segundo (mediana)',
+            template=filtros['tema'],
+            text_auto='.2s'
+        )
+        fig.update_layout(height=400, xaxis_title='Consulta', yaxis_title='Linhas/s')
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.dataframe(
+            df_resumo.style.format({
+                'linhas': '{:,}',
+                'segundos': '{:.3f}',
+                'linhas_por_segundo': '{:,.0f}'
+            }),
+            use_container_width=True
+        )
+
+    # ========== BENCHMARK DE FILTROS POR CHAVES ==========
+    st.markdown("<div class='sub-header'>🧮 Benchmark de Filtros por Chaves (lista × lotes × semi-join)</div>", unsafe_allow_html=True)
+    st.caption(f"Filtra `itcmd_dde` pelas OFs dos emitentes com mais OFs até somar cada quantidade: "
+               f"uma lista IN única, lotes de {TAMANHO_LOTE_IN} chaves ou semi-join no servidor. "
+               f"Modo em uso nas cargas: **{FILTRO_CHAVES}**.")
+
+    quantidades = st.multiselect(
+        "Quantidade de OFs:",
+        [100, 1000, 5000, 10000, 50000],
+        default=[100, 1000, 10000]
+    )
+
+    if st.button("▶️ Executar Benchmark de Filtros") and quantidades:
+        with st.spinner("⏳ Executando os três modos de filtro..."):
+            df_filtros = benchmark_filtro_chaves(engine, sorted(quantidades))
+
+        fig = px.line(
+            df_filtros,
+            x='ofs',
+            y='segundos',
+            color='modo',
+            markers=True,
+            log_x=True,
+            title='🧮 Tempo por Quantidade de OFs',
+            template=filtros['tema']
+        )
+        fig.update_layout(height=400, xaxis_title='OFs filtradas', yaxis_title='Segundos')
+        st.plotly_chart(fig, use_container_width=True)
+
+        st.dataframe(
+            df_filtros.style.format({
+                'ofs': '{:,}',
+                'maior_sql_kb': '{:,.1f}',
+                'linhas': '{:,}',
+                'segundos': '{:.3f}'
+            }),
+            use_container_width=True
+        )
+
+    # ========== LATÊNCIA POR CONSULTA ==========
+    st.markdown("<div class='sub-header'>📈 Latência por Consulta</div>", unsafe_allow_html=True)
+    st.caption(f"Histórico em `{os.path.basename(METRICAS_DB)}`: uma linha por consulta executada "
+               f"no Impala (miss), servida do cache (hit, stale, snapshot, disco) ou "
+               f"aproveitada de uma execução idêntica em andamento (coalescida).")
+
+    dias = st.select_slider("Período (dias):", options=[1, 7, 30, 90, 365], value=30)
+    df_metricas = ler_metricas(dias)
+
+    if df_metricas.empty:
+        st.info("ℹ️ Nenhuma execução registrada no período.")
+    else:
+        df_latencia = percentis_latencia(df_metricas)
+
+        # Tendência: mediana dos últimos 7 dias contra a do restante do período
+        corte = datetime.now() - timedelta(days=7)
+        recentes = percentis_latencia(df_metricas[df_metricas['registrado_em'] >= corte])
+        anteriores = percentis_latencia(df_metricas[df_metricas['registrado_em'] < corte])
+        if not recentes.empty and not anteriores.empty:
+            variacao = (
+                recentes.set_index('consulta')['p50_s'] / anteriores.set_index('consulta')['p50_s'] - 1
+            ) * 100
+            df_latencia['variacao_p50_pct'] = df_latencia['consulta'].map(variacao)
+
+        df_latencia = df_latencia.sort_values('p90_s', ascending=False)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Chamadas registradas", f"{len(df_metricas):,}")
+        with col2:
+            st.metric("Acerto de cache", f"{(df_metricas['cache'] != 'miss').mean() * 100:.1f}%")
+        with col3:
+            st.metric("Erros", f"{df_metricas['erro'].notna().sum():,}")
+
+        st.dataframe(
+            df_latencia.style.format({
+                'taxa_acerto_cache': '{:.1f}%',
+                'p50_s': '{:.2f}',
+                'p90_s': '{:.2f}',
+                'p99_s': '{:.2f}',
+                'primeira_linha_p50_s': '{:.2f}',
+                'linhas_mediana': '{:,.0f}',
+                'mb_mediana': '{:.2f}',
+                'variacao_p50_pct': '{:+.0f}%'
+            }, na_rep='-'),
+            use_container_width=True,
+            hide_index=True
+        )
+
+        # Evolução diária dos percentis por consulta
+        consultas_executadas = df_latencia.dropna(subset=['p90_s'])['consulta'].tolist()
+        consultas_evolucao = st.multiselect(
+            "Evolução diária de:",
+            consultas_executadas,
+            default=[c for c in consultas_executadas if c in TABELAS_CONFIG][:5]
+        )
+
+        if consultas_evolucao:
+            df_metricas['dia'] = df_metricas['registrado_em'].dt.normalize()
+            df_evolucao = percentis_latencia(
+                df_metricas[df_metricas['consulta'].isin(consultas_evolucao)], por='dia'
+            ).dropna(subset=['p90_s'])
+
+            metrica = st.radio("Métrica:", ['p50_s', 'p90_s', 'p99_s', 'linhas_mediana'],
+                               index=1, horizontal=True)
+
+            fig = px.line(
+                df_evolucao,
+                x='dia',
+                y=metrica,
+                color='consulta',
+                markers=True,
+                title=f'📈 {metrica} por dia',
+                template=filtros['tema']
+            )
+            fig.update_layout(height=400, xaxis_title='Dia', yaxis_title=metrica)
+            st.plotly_chart(fig, use_container_width=True)
+
+        df_cancelamentos = economia_cancelamentos(df_metricas)
+        if not df_cancelamentos.empty:
+            st.markdown("**⏹️ Consultas interrompidas (rerun superado ou prazo excedido)**")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Consultas interrompidas", f"{df_cancelamentos['canceladas'].sum():,}")
+            with col2:
+                st.metric("Segundos de cluster economizados (estimativa)",
+                          f"{df_cancelamentos['segundos_economizados'].sum():,.0f}")
+            st.dataframe(
+                df_cancelamentos.style.format({
+                    'segundos_rodados': '{:.1f}',
+                    'segundos_economizados': '{:.1f}'
+                }),
+                use_container_width=True,
+                hide_index=True
+            )
+
+        erros = df_metricas[df_metricas['erro'].notna()]
+        if not erros.empty:
+            with st.expander(f"⚠️ Erros recentes ({len(erros)})"):
+                st.dataframe(
+                    erros[['registrado_em', 'consulta', 'segundos', 'erro']].tail(50).iloc[::-1],
+                    use_container_width=True,
+                    hide_index=True
+                )
+
+    # ========== CARGAS EM GRAFO ==========
+    st.markdown("<div class='sub-header'>🧭 Caminho Crítico das Cargas em Grafo</div>", unsafe_allow_html=True)
+    st.caption("Última execução neste processo de cada carregador em grafo (ex.: ITCMD). "
+               "Em destaque, a cadeia de dependências que determinou o tempo total.")
+
+    grafos = ultimas_execucoes_grafos()
+    if not grafos:
+        st.info("ℹ️ Nenhuma carga em grafo executada neste processo (abra a página do ITCMD).")
+    for nome_grafo, execucao in grafos.items():
+        df_nos = execucao['nos']
+        caminho = df_nos[df_nos['critico']].sort_values('inicio_s')
+        soma_nos = df_nos['duracao_s'].sum()
+        st.markdown(
+            f"**{nome_grafo}** · {execucao['executado_em'].strftime('%d/%m %H:%M:%S')} · "
+            f"total {execucao['total_s']:.2f} s (soma dos nós {soma_nos:.2f} s) · "
+            f"caminho crítico: {' → '.join(caminho['no'])}"
+        )
+        if execucao['erro']:
+            st.warning(f"⚠️ Interrompida: {execucao['erro']}")
+        if df_nos.empty:
+            continue
+
+        fig = px.bar(
+            df_nos.sort_values('inicio_s', ascending=False),
+            x='duracao_s',
+            base='inicio_s',
+            y='no',
+            color='critico',
+            orientation='h',
+            color_discrete_map={True: '#d32f2f', False: '#90a4ae'},
+            hover_data=['dependencias', 'inicio_s', 'fim_s'],
+            title=f'🧭 Linha do tempo dos nós — {nome_grafo}',
+            template=filtros['tema']
+        )
+        fig.update_layout(height=max(250, 40 * len(df_nos)), xaxis_title='Segundos desde o início',
+                          yaxis_title='', legend_title='Caminho crítico')
+        st.plotly_chart(fig, use_container_width=True)
+
+    # ========== CACHE DE RESULTADOS EM DISCO ==========
+    st.markdown("<div class='sub-header'>💽 Cache de Resultados em Disco</div>", unsafe_allow_html=True)
+    st.caption(f"Arquivo `{os.path.basename(CACHE_RESULTADOS_DB)}`, compartilhado pelos processos "
+               f"deste host; limite de {CACHE_RESULTADOS_MB} MB com despejo dos menos usados.")
+
+    try:
+        df_cache_disco = estatisticas_cache_disco()
+    except Exception as e:
+        df_cache_disco = pd.DataFrame()
+        st.warning(f"⚠️ Cache em disco indisponível: {str(e)[:100]}")
+
+    if df_cache_disco.empty:
+        st.info("ℹ️ Nenhum acesso ao cache em disco registrado.")
+    else:
+        col1, col2, col3 = st.columns(3)
+        chamadas = df_cache_disco['acertos'].sum() + df_cache_disco['falhas'].sum()
+        with col1:
+            st.metric("Taxa de acerto", f"{df_cache_disco['acertos'].sum() / max(chamadas, 1) * 100:.1f}%")
+        with col2:
+            st.metric("Entradas", f"{df_cache_disco['entradas'].sum():,}")
+        with col3:
+            st.metric("Tamanho", f"{df_cache_disco['mb'].sum():.1f} MB")
+
+        st.dataframe(
+            df_cache_disco.style.format({'taxa_acerto': '{:.1f}%', 'mb': '{:.2f}'}),
+            use_container_width=True,
+            hide_index=True
+        )
+
+    # ========== CACHE DE DIMENSÕES ==========
+    st.markdown("<div class='sub-header'>📇 Cache de Dimensões</div>", unsafe_allow_html=True)
+    st.caption("Infrações, AFREs, CNAE e municípios ficam em memória, indexados pelo código, e "
+               "enriquecem as páginas sem merge. Cada dimensão é lida no primeiro uso e renovada em "
+               "segundo plano após o TTL da consulta no registro.")
+
+    df_dimensoes = resumo_dimensoes()
+    if df_dimensoes.empty:
+        st.info("ℹ️ Nenhuma dimensão carregada neste processo ainda.")
+    else:
+        st.dataframe(df_dimensoes, use_container_width=True, hide_index=True)
+
+    # ========== SINCRONIZAÇÃO INCREMENTAL DO ITCMD ==========
+    st.markdown("<div class='sub-header'>🔄 Sincronização Incremental dos Setores</div>", unsafe_allow_html=True)
+    st.caption(f"Modo `{SINCRONIZACAO_ITCMD}`. DDE, notificações e TIFDP buscam só as linhas alteradas "
+               f"desde a marca d'água e as das OFs novas. A releitura completa (que pega exclusões) "
+               f"roda a cada {INTERVALO_RECONCILIACAO_ITCMD // 3600} h.")
+
+    df_armazem = resumo_armazem_itcmd()
+    if df_armazem.empty:
+        st.info("ℹ️ Armazém dos setores ainda vazio (nenhuma carga incremental neste host).")
+    else:
+        st.dataframe(df_armazem, use_container_width=True, hide_index=True)
+
+    # ========== REGISTRO DE CONSULTAS ==========
+    st.markdown("<div class='sub-header'>📚 Registro de Consultas</div>", unsafe_allow_html=True)
+    st.caption(f"Definições em `{os.path.basename(ARQUIVO_CONSULTAS)}`. "
+               f"Últimas linhas = resultado da execução mais recente neste processo.")
+
+    df_registro = resumo_registro()
+    acima = df_registro[df_registro['acima_orcamento']]
+    if not acima.empty:
+        st.warning(f"⚠️ Acima do orçamento de linhas: {', '.join(acima['consulta'])}")
+
+    st.dataframe(df_registro, use_container_width=True, hide_index=True)
+
 # =============================================================================
 # 9. FUNÇÃO PRINCIPAL
 # =============================================================================
 
+# Tabelas de TABELAS_CONFIG lidas por cada página. São carregadas juntas, em
+# paralelo, antes de a página rodar; acessos fora do mapa carregam sob demanda.
+DEPENDENCIAS_PAGINAS = {
+    pagina_dashboard_executivo: ['dashboard_executivo', 'resumo_conversoes'],
+    pagina_setor_of: [],
+    pagina_analise_estados: ['analise_estados', 'resumo_conversoes'],
+    pagina_analise_gerencias: ['metricas_gerencia'],
+    pagina_analise_ges: ['metricas_ges', 'distribuicao_empresas_ges'],
+    pagina_analise_cnae: ['metricas_cnae'],
+    pagina_analise_municipios: ['metricas_municipio'],
+    pagina_analise_afres: ['metricas_afre'],
+    pagina_tipos_infracoes: ['ranking_infracoes'],
+    pagina_drill_down_empresa: ['empresas_resumo'],
+    pagina_machine_learning: [],
+    pagina_diagnostico: [],
+    pagina_sobre: ['fiscalizacoes_stats']
+}
+
+# Opções dos filtros globais (Anos e Gerências): consulta pequena (valores
+# distintos) carregada em todas as páginas, para os filtros e seus padrões
+# serem sempre os mesmos
+TABELAS_FILTROS = ['opcoes_filtros']
+
 def main():
     """Função principal do dashboard."""
     
@@ -4308,7 +7724,11 @@ def main():
     
     paginas = {
         "📊 Dashboard Executivo": pagina_dashboard_executivo,
-        "📜 ITCMD": pagina_itcmd,
+        # Uma página por setor de SETORES_OF (📜 ITCMD e os do secrets.toml)
+        **{
+            f"{definicao['icone']} {sigla}": partial(pagina_setor_of, setor=sigla)
+            for sigla, definicao in SETORES_OF.items()
+        },
         "📋 Ciclo de Vida - Estados": pagina_analise_estados,
         "🏢 Análise por Gerência": pagina_analise_gerencias,
         "🏭 Análise por GES": pagina_analise_ges,
@@ -4318,6 +7738,7 @@ def main():
         "⚖️ Tipos de Infrações": pagina_tipos_infracoes,
         "🔎 Drill-Down Empresa": pagina_drill_down_empresa,
         "🤖 Machine Learning": pagina_machine_learning,
+        "🛠️ Diagnóstico": pagina_diagnostico,
         "ℹ️ Sobre o Sistema": pagina_sobre
     }
     
@@ -4332,23 +7753,39 @@ def main():
     # Criar engine e carregar dados
     engine = get_impala_engine()
     
-    # Salvar engine no session_state
-    if 'engine' not in st.session_state:
-        st.session_state['engine'] = engine
+    # Salvar engine no session_state (pode ter sido recriado após uma falha)
+    st.session_state['engine'] = engine
     
     if engine is None:
-        st.error("❌ Não foi possível conectar ao banco de dados.")
-        st.stop()
-    
+        # Modo degradado; o engine é criado de novo na próxima execução
+        get_impala_engine.clear()
+        abrir_disjuntor(None, "não foi possível criar o engine de conexão")
+    elif modo_degradado():
+        iniciar_sonda_disjuntor(engine)
+    
+    if BACKEND_SQL != 'impala':
+        st.sidebar.warning(f"🧪 Backend local: {BACKEND_SQL} ({DIRETORIO_BANCO_LOCAL})")
+    if FETCH_BACKEND != 'arrow' or pa is None:
+        st.sidebar.warning("⏱️ fetch_backend pandas: prazo_s e cancelamento das consultas não são aplicados")
+    elif MOTIVO_SEM_CANCELAMENTO is not None:
+        st.sidebar.warning(f"⏱️ Cancelamento de consultas por rerun desligado: {MOTIVO_SEM_CANCELAMENTO}")
+    
+    # Só as tabelas da página selecionada; as demais ficam para quando forem acessadas
+    dados = DadosSistema(engine)
+    # Páginas de setor são partial(pagina_setor_of, setor=...)
+    pagina = paginas[pagina_selecionada]
+    dependencias = list(dict.fromkeys(DEPENDENCIAS_PAGINAS.get(getattr(pagina, 'func', pagina), []) + TABELAS_FILTROS))
     with st.spinner('⏳ Carregando dados do sistema...'):
-        dados = carregar_dados_sistema(engine)
+        carregou = dados.carregar(dependencias)
     
-    if not dados:
+    if modo_degradado():
+        exibir_aviso_modo_degradado(dados.carregadas(), dependencias)
+    elif not carregou:
         st.error("❌ Falha no carregamento dos dados.")
         st.stop()
     
-    # Info na sidebar
-    df_stats = dados.get('fiscalizacoes_stats', pd.DataFrame())
+    # Info na sidebar (quando a página já trouxe as estatísticas)
+    df_stats = dados.carregadas().get('fiscalizacoes_stats', pd.DataFrame())
     
     if not df_stats.empty:
         st.sidebar.success(f"✅ Dados carregados")
@@ -4364,7 +7801,7 @@ def main():
         """)
     
     # Filtros
-    filtros = criar_filtros_sidebar(dados)
+    filtros = criar_filtros_sidebar(dados.carregadas())
     
     st.sidebar.markdown("---")
     
@@ -4379,11 +7816,16 @@ def main():
     # Executar página selecionada
     try:
         paginas[pagina_selecionada](dados, filtros)
+    except ConsultaCancelada:
+        # O rerun já foi superado: encerra esta execução e deixa a nova rodar
+        st.stop()
     except Exception as e:
         st.error(f"❌ Erro ao carregar a página: {str(e)}")
         with st.expander("🔍 Detalhes do erro"):
             st.exception(e)
     
+    exibir_resumo_carga(dados.carregadas())
+    
     # Rodapé
     st.markdown("---")
     st.markdown(f"""
@@ -0,0 +1,1541 @@
+"""
+FISCA - Gerador de Dados Sintéticos
+Receita Estadual de Santa Catarina
+
+Gera, em escala configurável, todas as tabelas que o dashboard lê
+(teste.fisca_* e as tabelas usr_sat_ods.* das consultas do ITCMD), para
+rodar e medir o FISCA fora da rede da SEFAZ com o backend local.
+
+- Integridade referencial: cnpj/nu_ie vêm do cadastro, id_documento liga
+  infrações, notificações, autoridades e scores, nu_of liga OFs, infrações,
+  acompanhamentos, termos e os números das OFs.
+- Assimetria realista: municípios, gerências, CNAEs, porte das empresas e
+  códigos de infração seguem distribuições de cauda longa (Zipf/lognormal).
+- Tabelas agregadas (fisca_metricas_*, dashboard executivo, ranking, scores)
+  são derivadas dos fatos com as mesmas regras do ETL do Hue (FISCA.json).
+
+Uso:
+    python gerar_dados_sinteticos.py --escala 1 --saida sqlite --destino .fisca_local
+    python gerar_dados_sinteticos.py --escala 10 --saida duckdb
+    python gerar_dados_sinteticos.py --escala 0.1 --saida parquet --destino dados_sinteticos
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from contextlib import closing
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# =============================================================================
+# 1. CONFIGURAÇÕES
+# =============================================================================
+
+# Mesmos esquemas e arquivos do backend local do dashboard (seção 4.4)
+ESQUEMA_FISCA = 'teste'
+ESQUEMA_ODS = 'usr_sat_ods'
+ARQUIVO_DUCKDB = 'fisca.duckdb'
+
+ANO_INICIAL = 2020
+HOJE = pd.Timestamp(date.today())
+INICIO = pd.Timestamp(f'{ANO_INICIAL}-01-01')
+
+# Volumes com --escala 1 (cerca de 40 mil infrações)
+VOLUMES_BASE = {
+    'empresas': 20_000,
+    'afres': 350,
+    'ofs': 12_000,
+    'ofs_itcmd': 1_200,
+    'afres_itcmd': 12
+}
+
+# Coordenadores do setor ITCMD (mesmos de COORDENADORES_ITCMD no dashboard)
+COORDENADORES_ITCMD = ['9507248', '6172598']
+
+# Municípios em ordem decrescente de porte, com a gerência regional
+MUNICIPIOS = [
+    ('JOINVILLE', 'GERFE JOINVILLE'),
+    ('FLORIANOPOLIS', 'GERFE FLORIANOPOLIS'),
+    ('BLUMENAU', 'GERFE BLUMENAU'),
+    ('SAO JOSE', 'GERFE FLORIANOPOLIS'),
+    ('ITAJAI', 'GERFE ITAJAI'),
+    ('CHAPECO', 'GERFE CHAPECO'),
+    ('CRICIUMA', 'GERFE CRICIUMA'),
+    ('JARAGUA DO SUL', 'GERFE JARAGUA DO SUL'),
+    ('PALHOCA', 'GERFE FLORIANOPOLIS'),
+    ('LAGES', 'GERFE LAGES'),
+    ('BALNEARIO CAMBORIU', 'GERFE ITAJAI'),
+    ('BRUSQUE', 'GERFE BLUMENAU'),
+    ('TUBARAO', 'GERFE TUBARAO'),
+    ('SAO BENTO DO SUL', 'GERFE JOINVILLE'),
+    ('CACADOR', 'GERFE CACADOR'),
+    ('CONCORDIA', 'GERFE CONCORDIA'),
+    ('CAMBORIU', 'GERFE ITAJAI'),
+    ('NAVEGANTES', 'GERFE ITAJAI'),
+    ('RIO DO SUL', 'GERFE RIO DO SUL'),
+    ('ARARANGUA', 'GERFE CRICIUMA'),
+    ('GASPAR', 'GERFE BLUMENAU'),
+    ('BIGUACU', 'GERFE FLORIANOPOLIS'),
+    ('INDAIAL', 'GERFE BLUMENAU'),
+    ('MAFRA', 'GERFE MAFRA'),
+    ('CANOINHAS', 'GERFE MAFRA'),
+    ('ITAPEMA', 'GERFE ITAJAI'),
+    ('VIDEIRA', 'GERFE VIDEIRA'),
+    ('XANXERE', 'GERFE CHAPECO'),
+    ('SAO MIGUEL DO OESTE', 'GERFE SAO MIGUEL DO OESTE'),
+    ('JOACABA', 'GERFE JOACABA'),
+    ('IMBITUBA', 'GERFE TUBARAO'),
+    ('LAGUNA', 'GERFE TUBARAO'),
+    ('TIMBO', 'GERFE BLUMENAU'),
+    ('SAO FRANCISCO DO SUL', 'GERFE JOINVILLE'),
+    ('CURITIBANOS', 'GERFE LAGES'),
+    ('FRAIBURGO', 'GERFE VIDEIRA')
+]
+
+# CNAE (seção, descrição, divisão, descrição, GES), do mais ao menos frequente
+CNAES = [
+    ('G', 'COMERCIO; REPARACAO DE VEICULOS AUTOMOTORES E MOTOCICLETAS', '47', 'COMERCIO VAREJISTA', 'GES VAREJO'),
+    ('G', 'COMERCIO; REPARACAO DE VEICULOS AUTOMOTORES E MOTOCICLETAS', '46', 'COMERCIO POR ATACADO, EXCETO VEICULOS', 'GES ATACADO'),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '14', 'CONFECCAO DE ARTIGOS DO VESTUARIO E ACESSORIOS', 'GES TEXTIL'),
+    ('I', 'ALOJAMENTO E ALIMENTACAO', '56', 'ALIMENTACAO', None),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '10', 'FABRICACAO DE PRODUTOS ALIMENTICIOS', 'GES ALIMENTOS'),
+    ('G', 'COMERCIO; REPARACAO DE VEICULOS AUTOMOTORES E MOTOCICLETAS', '45', 'COMERCIO E REPARACAO DE VEICULOS', 'GES VEICULOS'),
+    ('H', 'TRANSPORTE, ARMAZENAGEM E CORREIO', '49', 'TRANSPORTE TERRESTRE', None),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '25', 'FABRICACAO DE PRODUTOS DE METAL', 'GES METALMECANICO'),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '13', 'FABRICACAO DE PRODUTOS TEXTEIS', 'GES TEXTIL'),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '22', 'FABRICACAO DE PRODUTOS DE BORRACHA E DE MATERIAL PLASTICO', None),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '16', 'FABRICACAO DE PRODUTOS DE MADEIRA', None),
+    ('F', 'CONSTRUCAO', '41', 'CONSTRUCAO DE EDIFICIOS', None),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '28', 'FABRICACAO DE MAQUINAS E EQUIPAMENTOS', 'GES METALMECANICO'),
+    ('A', 'AGRICULTURA, PECUARIA, PRODUCAO FLORESTAL, PESCA E AQUICULTURA', '01', 'AGRICULTURA, PECUARIA E SERVICOS RELACIONADOS', None),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '11', 'FABRICACAO DE BEBIDAS', 'GES BEBIDAS'),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '31', 'FABRICACAO DE MOVEIS', None),
+    ('J', 'INFORMACAO E COMUNICACAO', '61', 'TELECOMUNICACOES', 'GES TELECOMUNICACOES'),
+    ('D', 'ELETRICIDADE E GAS', '35', 'ELETRICIDADE, GAS E OUTRAS UTILIDADES', 'GES ENERGIA'),
+    ('C', 'INDUSTRIAS DE TRANSFORMACAO', '19', 'FABRICACAO DE COQUE E DERIVADOS DO PETROLEO', 'GES COMBUSTIVEIS'),
+    ('B', 'INDUSTRIAS EXTRATIVAS', '08', 'EXTRACAO DE MINERAIS NAO METALICOS', None)
+]
+
+REGIMES = [('SIMPLES NACIONAL', 0.62), ('REGIME NORMAL', 0.33), ('PRODUTOR PRIMARIO', 0.05)]
+
+# Estados do ODS para TIF/Auto de Infração (mesmos valores normalizados no ETL)
+ESTADOS_INFRACAO = [
+    ('CONFIRMADA (CONVERTIDA EM NOTIF.)', 0.36),
+    ('DEFINITIVO', 0.10),
+    ('Quitada Integral', 0.10),
+    ('Parcelada', 0.06),
+    ('INTIMADA', 0.08),
+    ('INICIAL', 0.04),
+    ('COMPLETA', 0.04),
+    ('Documento aguardando assinatura com certificado digital.', 0.02),
+    ('EXCLUÍDA', 0.06),
+    ('O documento foi excluído.', 0.03),
+    ('CANCELADA (NÃO CONVERTIDA EM NOTIF.)', 0.06),
+    ('SUSPENSA', 0.05)
+]
+
+ESTADOS_NOTIFICACAO = [
+    ('DEFINITIVA', 0.35), ('IMPUGNADA', 0.20), ('QUITADA', 0.20),
+    ('PARCELADA', 0.15), ('INSCRITA EM DIVIDA ATIVA', 0.10)
+]
+
+# Tributo -> (quantidade de códigos, primeiro código)
+TRIBUTOS = {'ICMS': (70, 1000), 'ITCMD': (12, 5000), 'IPVA': (8, 7000)}
+
+DESCRICOES_INFRACAO = [
+    'Deixar de recolher o imposto no prazo',
+    'Falta de emissao de documento fiscal',
+    'Aproveitamento indevido de credito',
+    'Omissao de receitas',
+    'Divergencia entre declaracao e escrituracao',
+    'Falta de escrituracao de documento fiscal',
+    'Base de calculo reduzida indevidamente',
+    'Aliquota aplicada a menor',
+    'Falta de estorno de credito',
+    'Substituicao tributaria nao retida',
+    'Declaracao com informacoes inexatas',
+    'Falta de entrega de declaracao'
+]
+
+MOTIVACOES_OF = {
+    'ITCMD': [
+        'Doacao nao declarada', 'Divergencia de avaliacao de bens', 'Inventario sem recolhimento',
+        'Cruzamento com a Receita Federal', 'Partilha em divorcio', 'Denuncia'
+    ],
+    'ICMS': [
+        'Malha fiscal', 'Indicio de omissao de receitas', 'Credito indevido', 'Planejamento anual',
+        'Denuncia', 'Substituicao tributaria', 'Cruzamento de cartoes'
+    ]
+}
+
+ORIGENS_OF = ['PLANEJAMENTO', 'MALHA', 'DENUNCIA', 'DEMANDA EXTERNA']
+MOTIVOS_OS = ['Monitoramento', 'Autorregularizacao', 'Verificacao de pagamento', 'Intimacao para esclarecimentos']
+
+PRENOMES = [
+    'Ana', 'Carlos', 'Fernanda', 'Joao', 'Juliana', 'Marcos', 'Patricia', 'Rafael', 'Luciana',
+    'Eduardo', 'Mariana', 'Rodrigo', 'Camila', 'Gustavo', 'Beatriz', 'Paulo', 'Renata', 'Andre'
+]
+SOBRENOMES = [
+    'Silva', 'Souza', 'Oliveira', 'Pereira', 'Costa', 'Rodrigues', 'Almeida', 'Nascimento',
+    'Lima', 'Araujo', 'Fernandes', 'Carvalho', 'Gomes', 'Martins', 'Rocha', 'Ribeiro', 'Schmitt', 'Kohler'
+]
+RADICAIS_EMPRESA = [
+    'ALFA', 'ATLANTICO', 'SERRA', 'VALE', 'LITORAL', 'PLANALTO', 'ITAJAI', 'OESTE', 'ILHA', 'NORTE',
+    'CATARINENSE', 'UNIAO', 'PIONEIRA', 'ESTRELA', 'CENTRAL', 'NOVA ERA', 'HORIZONTE', 'PRIMUS'
+]
+SUFIXOS_EMPRESA = ['LTDA', 'LTDA', 'LTDA', 'S.A.', 'EIRELI', 'ME']
+
+
+# =============================================================================
+# 2. DISTRIBUIÇÕES
+# =============================================================================
+
+def pesos_zipf(n, expoente=1.1):
+    """Pesos normalizados 1/k^s para n categorias em ordem de frequência."""
+    pesos = 1.0 / np.arange(1, n + 1) ** expoente
+    return pesos / pesos.sum()
+
+def volume(nome, escala, minimo=1):
+    """Quantidade de registros de uma entidade para a escala pedida."""
+    return max(minimo, int(round(VOLUMES_BASE[nome] * escala)))
+
+def datas_aleatorias(rng, n, inicio=INICIO, fim=HOJE, crescimento=0.3):
+    """Datas entre inicio e fim, com volume crescendo ao longo do período."""
+    dias = (fim - inicio).days
+    fracao = rng.random(n) ** (1 / (1 + crescimento))
+    return (inicio + pd.to_timedelta(np.floor(fracao * dias), unit='D')).normalize()
+
+def somar_dias(datas, dias, limite=HOJE):
+    """datas + dias; datas futuras (além de limite) viram NaT."""
+    resultado = pd.Series(datas).reset_index(drop=True) + pd.to_timedelta(np.asarray(dias, dtype=float), unit='D')
+    return resultado.where(resultado <= limite).dt.normalize()
+
+def valores_monetarios(rng, n, mediana, dispersao=1.0, fator=1.0):
+    """Valores lognormais (cauda longa) em reais, com 2 casas."""
+    return np.round(rng.lognormal(np.log(mediana), dispersao, n) * fator, 2)
+
+def escolher_rotulos(rng, rotulos_pesos, n):
+    """Sorteia n rótulos de uma lista [(rótulo, peso), ...]."""
+    rotulos = [rotulo for rotulo, _ in rotulos_pesos]
+    pesos = np.array([peso for _, peso in rotulos_pesos], dtype=float)
+    return np.array(rotulos, dtype=object)[rng.choice(len(rotulos), n, p=pesos / pesos.sum())]
+
+def nomes_pessoas(rng, n):
+    """Nomes completos aleatórios."""
+    return (
+        pd.Series(rng.choice(PRENOMES, n)) + ' ' +
+        pd.Series(rng.choice(SOBRENOMES, n)) + ' ' +
+        pd.Series(rng.choice(SOBRENOMES, n))
+    ).str.upper().to_numpy()
+
+def digitos_cnpj(raizes):
+    """CNPJs válidos (14 dígitos, filial 0001) a partir de raízes de 8 dígitos."""
+    pesos_1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    pesos_2 = [6] + pesos_1
+    cnpjs = []
+    for raiz in raizes:
+        base = [int(c) for c in f'{raiz:08d}0001']
+        resto = sum(d * p for d, p in zip(base, pesos_1)) % 11
+        base.append(0 if resto < 2 else 11 - resto)
+        resto = sum(d * p for d, p in zip(base, pesos_2)) % 11
+        base.append(0 if resto < 2 else 11 - resto)
+        cnpjs.append(''.join(map(str, base)))
+    return np.array(cnpjs, dtype=object)
+
+def sortear_por_grupo(rng, grupos_alvo, membros_por_grupo):
+    """Para cada linha, sorteia um membro do grupo indicado em grupos_alvo."""
+    resultado = np.empty(len(grupos_alvo), dtype=object)
+    for grupo, membros in membros_por_grupo.items():
+        linhas = np.flatnonzero(grupos_alvo == grupo)
+        if len(linhas):
+            resultado[linhas] = rng.choice(membros, len(linhas))
+    return resultado
+
+def periodo_aaaamm(datas):
+    """Período AAAAMM (inteiro) de uma série de datas."""
+    return (datas.dt.year * 100 + datas.dt.month).astype('Int64')
+
+
+# =============================================================================
+# 3. DIMENSÕES (CADASTRO, AFREs, CATÁLOGO)
+# =============================================================================
+
+def gerar_contribuintes(rng, escala):
+    """usr_sat_ods.vw_ods_contrib: cadastro de empresas com porte assimétrico."""
+    n = volume('empresas', escala, minimo=50)
+    raizes = rng.choice(np.arange(10_000_000, 99_999_999), n, replace=False)
+    ies = rng.choice(np.arange(250_000_000, 259_999_999), n, replace=False)
+
+    idx_munic = rng.choice(len(MUNICIPIOS), n, p=pesos_zipf(len(MUNICIPIOS), 0.9))
+    idx_cnae = rng.choice(len(CNAES), n, p=pesos_zipf(len(CNAES), 0.8))
+    municipios = np.array([m for m, _ in MUNICIPIOS], dtype=object)[idx_munic]
+    gerfes = np.array([g for _, g in MUNICIPIOS], dtype=object)[idx_munic]
+    gerencias = sorted({g for _, g in MUNICIPIOS})
+    cd_gerfe = {g: 100 + i for i, g in enumerate(gerencias)}
+    cnae = pd.DataFrame(CNAES, columns=['cd_secao', 'de_secao', 'cd_divisao', 'de_divisao', 'ges']).iloc[idx_cnae].reset_index(drop=True)
+
+    # Empresas de setores com GES são acompanhadas pelo grupo especialista;
+    # as demais ficam com o grupo regional (GRAF), que os painéis de GES excluem
+    nm_ges = np.where(
+        cnae['ges'].notna(),
+        cnae['ges'],
+        'GRAF ' + pd.Series(gerfes).str.replace('GERFE ', '', regex=False)
+    )
+    regime = escolher_rotulos(rng, REGIMES, n)
+    razao = (
+        pd.Series(rng.choice(RADICAIS_EMPRESA, n)) + ' ' +
+        cnae['de_divisao'].str.split().str[-1] + ' ' +
+        pd.Series(rng.choice(SUFIXOS_EMPRESA, n))
+    )
+    inicio_atividade = datas_aleatorias(rng, n, pd.Timestamp('1980-01-01'), HOJE, crescimento=0.5)
+
+    return pd.DataFrame({
+        'nu_cnpj': digitos_cnpj(raizes),
+        'nu_ie': ies.astype(str),
+        'nm_razao_social': razao.to_numpy(),
+        'nm_fantasia': pd.Series(rng.choice(RADICAIS_EMPRESA, n)).to_numpy(),
+        'cd_sit_cadastral': 1,
+        'nm_sit_cadastral': 'ATIVO',
+        'dt_sit_cadastral': inicio_atividade,
+        'cd_natureza_juridica': '2062',
+        'nm_natureza_juridica': 'SOCIEDADE EMPRESARIA LIMITADA',
+        'dt_inicio_icms': inicio_atividade,
+        'dt_constituicao_empresa': inicio_atividade,
+        'cd_cnae': (cnae['cd_divisao'] + pd.Series(rng.integers(10_000, 99_999, n)).astype(str)).to_numpy(),
+        'de_cnae': cnae['de_divisao'].to_numpy(),
+        'cd_secao': cnae['cd_secao'].to_numpy(),
+        'de_secao': cnae['de_secao'].to_numpy(),
+        'cd_divisao': cnae['cd_divisao'].to_numpy(),
+        'de_divisao': cnae['de_divisao'].to_numpy(),
+        'cd_grupo': (cnae['cd_divisao'] + '1').to_numpy(),
+        'de_grupo': cnae['de_divisao'].to_numpy(),
+        'cd_reg_apuracao': pd.Series(regime).map({r: i + 1 for i, (r, _) in enumerate(REGIMES)}).to_numpy(),
+        'nm_reg_apuracao': regime,
+        'nm_enq_empresa': np.where(regime == 'SIMPLES NACIONAL', 'SIMPLES NACIONAL', 'NORMAL'),
+        'cd_tipo_contribuinte': 1,
+        'nm_tipo_contribuinte': 'CONTRIBUINTE ICMS',
+        'sn_simples_nacional_rfb': np.where(regime == 'SIMPLES NACIONAL', 'S', 'N'),
+        'cd_usefi': pd.Series(gerfes).map(cd_gerfe).to_numpy() * 10,
+        'nm_usefi': pd.Series(gerfes).str.replace('GERFE', 'USEFI', regex=False).to_numpy(),
+        'cd_gerfe': pd.Series(gerfes).map(cd_gerfe).to_numpy(),
+        'nm_gerfe': gerfes,
+        'cd_ges': pd.Series(nm_ges).astype('category').cat.codes.to_numpy() + 1,
+        'nm_ges': nm_ges,
+        'cd_munic': 4200000 + idx_munic * 100 + 1,
+        'nm_munic': municipios,
+        'cd_uf': 'SC',
+        'nm_logradouro': 'RUA ' + pd.Series(rng.choice(SOBRENOMES, n)).str.upper().to_numpy(),
+        'nu_logradouro': rng.integers(1, 3000, n).astype(str),
+        'nm_bairro': 'CENTRO',
+        'cd_cep': (88000000 + rng.integers(0, 999_999, n)).astype(str),
+        'nu_telefone': None,
+        'nm_email': None,
+        'qt_vinculos': rng.integers(1, 4, n),
+        'qt_vinculos_ativos': 1,
+        'qt_socios_ativos': rng.integers(1, 5, n),
+        # Porte relativo (não existe no ODS; controla volume e valores das fiscalizações)
+        'porte': rng.lognormal(0.0, 1.1, n)
+    })
+
+def derivar_empresas_base(contribuintes):
+    """teste.fisca_empresas_base (PARTE 1 do ETL)."""
+    c = contribuintes
+    return pd.DataFrame({
+        'cnpj': c['nu_cnpj'], 'nu_ie': c['nu_ie'],
+        'nm_razao_social': c['nm_razao_social'], 'nm_fantasia': c['nm_fantasia'],
+        'cd_sit_cadastral': c['cd_sit_cadastral'], 'nm_sit_cadastral': c['nm_sit_cadastral'],
+        'dt_sit_cadastral': c['dt_sit_cadastral'],
+        'cd_natureza_juridica': c['cd_natureza_juridica'], 'nm_natureza_juridica': c['nm_natureza_juridica'],
+        'dt_inicio_icms': c['dt_inicio_icms'], 'dt_constituicao_empresa': c['dt_constituicao_empresa'],
+        'cd_cnae': c['cd_cnae'], 'de_cnae': c['de_cnae'],
+        'cnae_secao': c['cd_secao'], 'cnae_secao_descricao': c['de_secao'],
+        'cnae_divisao': c['cd_divisao'], 'cnae_divisao_descricao': c['de_divisao'],
+        'cnae_grupo': c['cd_grupo'], 'cnae_grupo_descricao': c['de_grupo'],
+        'cd_reg_apuracao': c['cd_reg_apuracao'], 'regime_tributario': c['nm_reg_apuracao'],
+        'cd_tipo_contribuinte': c['cd_tipo_contribuinte'], 'nm_tipo_contribuinte': c['nm_tipo_contribuinte'],
+        'sn_simples_nacional_rfb': c['sn_simples_nacional_rfb'],
+        'cd_usefi': c['cd_usefi'], 'nm_usefi': c['nm_usefi'],
+        'cd_gerfe': c['cd_gerfe'], 'nm_gerfe': c['nm_gerfe'], 'nm_ges': c['nm_ges'],
+        'cod_municipio': c['cd_munic'], 'municipio': c['nm_munic'], 'uf': c['cd_uf'],
+        'nm_logradouro': c['nm_logradouro'], 'nu_logradouro': c['nu_logradouro'],
+        'nm_bairro': c['nm_bairro'], 'cd_cep': c['cd_cep'],
+        'nu_telefone': c['nu_telefone'], 'nm_email': c['nm_email'],
+        'qt_vinculos': c['qt_vinculos'], 'qt_vinculos_ativos': c['qt_vinculos_ativos'],
+        'qt_socios_ativos': c['qt_socios_ativos']
+    })
+
+def gerar_afres(rng, escala):
+    """Cadastro de AFREs: gerência de lotação, setor, coordenadores e período de atividade."""
+    n = volume('afres', escala, minimo=30)
+    n_itcmd = max(len(COORDENADORES_ITCMD) + 2, volume('afres_itcmd', escala))
+    matriculas = rng.choice(np.arange(1_000_000, 9_999_999), n + n_itcmd, replace=False)
+    matriculas[:len(COORDENADORES_ITCMD)] = [int(m) for m in COORDENADORES_ITCMD]
+
+    gerencias = sorted({g for _, g in MUNICIPIOS})
+    # Lotação proporcional ao volume de empresas de cada gerência
+    pesos_gerencia = pd.Series(pesos_zipf(len(MUNICIPIOS), 0.9), index=[g for _, g in MUNICIPIOS]).groupby(level=0).sum()
+    # (ao menos um AFRE por gerência, para que toda OF tenha equipe)
+    lotacao = np.concatenate([
+        gerencias,
+        rng.choice(gerencias, n - len(gerencias), p=pesos_gerencia.reindex(gerencias).to_numpy())
+    ])
+
+    afres = pd.DataFrame({
+        'matricula': matriculas,
+        'nome': nomes_pessoas(rng, n + n_itcmd),
+        'setor': ['ITCMD'] * n_itcmd + ['ICMS'] * n,
+        'gerfe': np.concatenate([np.full(n_itcmd, 'GERFE FLORIANOPOLIS', dtype=object), lotacao]),
+        'coordenador': False,
+        'inicio': datas_aleatorias(rng, n + n_itcmd, pd.Timestamp('2012-01-01'), HOJE, crescimento=0.0),
+        'fim': pd.NaT
+    })
+    afres.loc[:len(COORDENADORES_ITCMD) - 1, 'coordenador'] = True
+    # Um ou dois coordenadores por gerência
+    for gerfe in gerencias:
+        candidatos = afres.index[(afres['gerfe'] == gerfe) & (afres['setor'] == 'ICMS')]
+        if len(candidatos):
+            afres.loc[rng.choice(candidatos, min(len(candidatos), rng.integers(1, 3)), replace=False), 'coordenador'] = True
+    # Coordenadores ativos desde antes do período; ~12% dos demais se aposentaram
+    afres.loc[afres['coordenador'], 'inicio'] = pd.Timestamp('2015-01-01')
+    aposentados = (~afres['coordenador']) & (rng.random(len(afres)) < 0.12)
+    afres.loc[aposentados, 'fim'] = datas_aleatorias(rng, int(aposentados.sum()), INICIO, HOJE)
+    afres['cargo'] = np.where(afres['coordenador'], 'AUDITOR FISCAL - COORDENADOR', 'AUDITOR FISCAL DA RECEITA ESTADUAL')
+    return afres
+
+def gerar_afre_periodo(rng, afres):
+    """usr_sat_ods.fis_afre_periodo: dias ativos por AFRE e mês."""
+    meses = pd.date_range(INICIO, HOJE, freq='MS')
+    grade = pd.DataFrame({
+        'cd_matricula': np.repeat(afres['matricula'].to_numpy(), len(meses)),
+        'mes': np.tile(meses, len(afres)),
+        'inicio': np.repeat(afres['inicio'].dt.to_period('M').dt.to_timestamp().to_numpy(), len(meses)),
+        'fim': np.repeat(pd.to_datetime(afres['fim']).to_numpy(), len(meses))
+    })
+    ativo = (grade['mes'] >= grade['inicio']) & (grade['fim'].isna() | (grade['mes'] <= grade['fim']))
+    grade = grade[ativo].reset_index(drop=True)
+
+    # Maioria dos meses completos; férias e licenças geram meses parciais
+    dias = rng.integers(20, 23, len(grade))
+    parcial = rng.random(len(grade)) < 0.15
+    dias[parcial] = rng.integers(1, 20, int(parcial.sum()))
+    return pd.DataFrame({
+        'cd_matricula': grade['cd_matricula'],
+        'nu_ano_ref': grade['mes'].dt.year,
+        'nu_per_ref': grade['mes'].dt.year * 100 + grade['mes'].dt.month,
+        'qt_dias_ativa': dias
+    })
+
+def gerar_tabela_infracoes(rng):
+    """usr_sat_ods.fis_tabela_infracoes: catálogo de códigos por tributo."""
+    linhas = []
+    for tributo, (quantidade, primeiro) in TRIBUTOS.items():
+        for i in range(quantidade):
+            descricao = DESCRICOES_INFRACAO[i % len(DESCRICOES_INFRACAO)]
+            linhas.append({
+                'cd_infracao': primeiro + i,
+                'de_infracao': f"{descricao} ({tributo})" + (f" - inciso {i // len(DESCRICOES_INFRACAO)}" if i >= len(DESCRICOES_INFRACAO) else ''),
+                'cd_tipo_infracao': 1 + i % 3,
+                'de_tipo_infracao': ['OBRIGACAO PRINCIPAL', 'OBRIGACAO ACESSORIA', 'CREDITO INDEVIDO'][i % 3],
+                'nm_tributo': tributo,
+                'vl_multa': float(rng.choice([50, 75, 100, 150])),
+                'sn_apres_dp': 'S',
+                'sn_pagamento_dp': 'S',
+                'vl_perc_red_dp': 50.0,
+                'vl_perc_multa_minima': 25.0,
+                'tx_historico_infracao': descricao,
+                'tx_fund_legal_infracao': f'Art. {10 + i}, Lei {10297 if tributo == "ICMS" else 13136}',
+                'tx_fund_legal_multa': f'Art. {50 + i % 20}',
+                'tx_fund_legal_atualizacao': 'Lei 5983/81',
+                'tx_fund_legal_juros': 'Lei 10297/96, art. 69',
+                'tx_motivo_representacao': None,
+                'tx_rol_conta_corrente': None,
+                'dt_inclusao_ods': INICIO,
+                'dt_ult_atualiz_ods': HOJE
+            })
+    return pd.DataFrame(linhas)
+
+def derivar_catalogo(tabela_infracoes):
+    """teste.fisca_catalogo_infracoes (PARTE 10 do ETL)."""
+    return tabela_infracoes.rename(columns={
+        'cd_infracao': 'codigo_infracao', 'de_infracao': 'descricao_infracao',
+        'cd_tipo_infracao': 'codigo_tipo_infracao', 'de_tipo_infracao': 'tipo_infracao',
+        'nm_tributo': 'nome_tributo', 'vl_multa': 'valor_multa_padrao',
+        'sn_apres_dp': 'permite_defesa_previa', 'sn_pagamento_dp': 'permite_pagamento_dp',
+        'vl_perc_red_dp': 'percentual_reducao_dp_padrao', 'vl_perc_multa_minima': 'percentual_multa_minima',
+        'tx_historico_infracao': 'historico_infracao', 'tx_fund_legal_infracao': 'fundamento_legal_infracao',
+        'tx_fund_legal_multa': 'fundamento_legal_multa', 'tx_fund_legal_atualizacao': 'fundamento_legal_atualizacao',
+        'tx_fund_legal_juros': 'fundamento_legal_juros', 'tx_motivo_representacao': 'motivo_representacao',
+        'tx_rol_conta_corrente': 'rol_conta_corrente'
+    })
+
+
+# =============================================================================
+# 4. FATOS (OFs, INFRAÇÕES, NOTIFICAÇÕES, TERMOS, ACOMPANHAMENTOS)
+# =============================================================================
+
+def gerar_ofs(rng, escala, contribuintes, afres):
+    """usr_sat_ods.fis_of_raw: Ordens de Fiscalização do ICMS (por gerência) e do ITCMD."""
+    n_icms = volume('ofs', escala, minimo=100)
+    n_itcmd = volume('ofs_itcmd', escala, minimo=20)
+    n = n_icms + n_itcmd
+    setor = np.array(['ICMS'] * n_icms + ['ITCMD'] * n_itcmd, dtype=object)
+
+    # Empresas maiores recebem mais OFs
+    peso_empresa = contribuintes['porte'].to_numpy() / contribuintes['porte'].sum()
+    alvo = rng.choice(len(contribuintes), n, p=peso_empresa)
+    empresa = contribuintes.iloc[alvo].reset_index(drop=True)
+
+    # Equipe: coordenador e AFRE da gerência da empresa (ou do setor ITCMD)
+    grupo = np.where(setor == 'ITCMD', 'ITCMD', empresa['nm_gerfe'].to_numpy())
+    chave_afre = np.where(afres['setor'] == 'ITCMD', 'ITCMD', afres['gerfe'])
+    coordenadores = {g: afres.loc[(chave_afre == g) & afres['coordenador'], 'matricula'].to_numpy() for g in np.unique(grupo)}
+    auditores = {g: afres.loc[(chave_afre == g) & ~afres['coordenador'], 'matricula'].to_numpy() for g in np.unique(grupo)}
+    # Gerência sem auditores próprios usa os coordenadores
+    auditores = {g: (m if len(m) else coordenadores[g]) for g, m in auditores.items()}
+    coordenador = sortear_por_grupo(rng, grupo, coordenadores)
+    emitente = sortear_por_grupo(rng, grupo, auditores)
+
+    dt_documento = datas_aleatorias(rng, n)
+    dt_inicio = somar_dias(dt_documento, rng.integers(0, 15, n), limite=HOJE + pd.Timedelta(days=15))
+    duracao = rng.gamma(2.0, 70.0, n)
+    dt_fim = somar_dias(dt_inicio, duracao)
+    cancelada = rng.random(n) < 0.04
+    nm_estado = np.select(
+        [cancelada, dt_fim.notna().to_numpy()],
+        ['CANCELADA', 'ENCERRADA'],
+        'EM ANDAMENTO'
+    )
+    motivacao = np.where(
+        setor == 'ITCMD',
+        rng.choice(MOTIVACOES_OF['ITCMD'], n, p=pesos_zipf(len(MOTIVACOES_OF['ITCMD']), 0.7)),
+        rng.choice(MOTIVACOES_OF['ICMS'], n, p=pesos_zipf(len(MOTIVACOES_OF['ICMS']), 0.7))
+    )
+    nu_of = np.arange(n) + 202_000_001
+
+    ofs = pd.DataFrame({
+        'id_documento': nu_of + 500_000_000,
+        'numero_documento': pd.Series(nu_of).astype(str).radd('OF').to_numpy(),
+        'nu_of': nu_of,
+        'dt_documento': dt_documento,
+        'data_emissao': dt_documento,
+        'nm_estado': nm_estado,
+        'situacao': np.where(nm_estado == 'EM ANDAMENTO', 'ATIVA', 'INATIVA'),
+        'cd_usuario_emitente': coordenador.astype(str),
+        'tx_recomendacoes': None,
+        'dt_inicio': dt_inicio,
+        'dt_fim': dt_fim.where(~cancelada),
+        'tx_motivacao_of': motivacao,
+        'nm_local_execucao': empresa['nm_munic'].to_numpy(),
+        'nm_gerencia': np.where(setor == 'ITCMD', 'GERENCIA DE FISCALIZACAO DO ITCMD', empresa['nm_gerfe'].to_numpy()),
+        'nm_local_emissao': np.where(setor == 'ITCMD', 'FLORIANOPOLIS', empresa['nm_munic'].to_numpy()),
+        'nu_mat_emitente': emitente.astype(str),
+        'nu_mat_coordenador': coordenador.astype(str),
+        'nm_origem': rng.choice(ORIGENS_OF, n, p=pesos_zipf(len(ORIGENS_OF), 1.0)),
+        'dt_alteracao_ods': somar_dias(dt_documento, rng.integers(0, 400, n)).fillna(HOJE),
+        'cd_ges': empresa['cd_ges'].to_numpy(),
+        'nm_ges': empresa['nm_ges'].to_numpy()
+    })
+    # Colunas auxiliares (não existem no ODS)
+    ofs['setor'] = setor
+    ofs['empresa'] = alvo
+    return ofs
+
+def gerar_infracoes(rng, ofs, contribuintes, tabela_infracoes):
+    """teste.fisca_infracoes_base (PARTE 5): TIF/Autos lavrados nas OFs."""
+    ofs_validas = ofs[ofs['nm_estado'] != 'CANCELADA']
+    empresa = contribuintes.iloc[ofs_validas['empresa']].reset_index(drop=True)
+    porte = empresa['porte'].to_numpy()
+
+    # OFs em empresas maiores lavram mais infrações
+    qtd = 1 + rng.poisson(np.clip(1.2 * np.sqrt(porte), 0.2, 8.0))
+    linhas_of = np.repeat(np.arange(len(ofs_validas)), qtd)
+    of = ofs_validas.iloc[linhas_of].reset_index(drop=True)
+    emp = empresa.iloc[linhas_of].reset_index(drop=True)
+    n = len(of)
+
+    # Lavratura dentro da execução da OF (até hoje, se ainda em andamento)
+    fim_execucao = of['dt_fim'].fillna(HOJE)
+    janela = (fim_execucao - of['dt_inicio']).dt.days.clip(lower=1)
+    data_infracao = somar_dias(of['dt_inicio'], np.floor(rng.random(n) * janela.to_numpy()))
+    data_infracao = data_infracao.fillna(of['dt_inicio'].clip(upper=HOJE))
+
+    tributo = np.where(of['setor'] == 'ITCMD', 'ITCMD', np.where(rng.random(n) < 0.9, 'ICMS', 'IPVA'))
+    codigo = np.empty(n, dtype=np.int64)
+    for nome in TRIBUTOS:
+        codigos = tabela_infracoes.loc[tabela_infracoes['nm_tributo'] == nome, 'cd_infracao'].to_numpy()
+        linhas = np.flatnonzero(tributo == nome)
+        codigo[linhas] = rng.choice(codigos, len(linhas), p=pesos_zipf(len(codigos), 1.2))
+
+    estado = escolher_rotulos(rng, ESTADOS_INFRACAO, n)
+    valor_imposto = valores_monetarios(rng, n, 9_000, 1.3, np.sqrt(porte[linhas_of]))
+    valor_multa = np.round(valor_imposto * rng.choice([0.5, 0.75, 1.0], n), 2)
+    valor_juros = np.round(valor_imposto * rng.uniform(0.02, 0.35, n), 2)
+    valor_total = np.round(valor_imposto + valor_multa + valor_juros, 2)
+
+    data_ciencia = somar_dias(data_infracao, rng.gamma(1.5, 8.0, n)).where(rng.random(n) < 0.85)
+    apresentou_dp = rng.random(n) < 0.25
+    data_dp = somar_dias(data_ciencia, rng.integers(1, 30, n)).where(apresentou_dp & (rng.random(n) < 0.6))
+    data_julgamento = somar_dias(data_infracao, rng.gamma(2.0, 90.0, n)).where(rng.random(n) < 0.4)
+
+    confirmada = estado == 'CONFIRMADA (CONVERTIDA EM NOTIF.)'
+    id_documento = np.arange(n) + 10_000_001
+    id_nf = np.where(confirmada, id_documento + 10_000_000, np.nan)
+    identificador = emp['nu_cnpj'].to_numpy()
+
+    infracoes = pd.DataFrame({
+        'id_documento': id_documento,
+        'numero_infracao': id_documento + 700_000_000,
+        'data_infracao': data_infracao,
+        'cnpj': identificador,
+        'cpf': None,
+        'nu_ie': emp['nu_ie'].to_numpy(),
+        'identificador': identificador,
+        'tipo_pessoa': 'PJ',
+        'estado_documento': estado
+    })
+    infracoes['status_normalizado'] = np.select(
+        [
+            np.isin(estado, ['O documento foi excluído.', 'EXCLUÍDA', 'CANCELADA (NÃO CONVERTIDA EM NOTIF.)']),
+            confirmada,
+            np.isin(estado, ['Parcelada', 'Quitada Integral']),
+            estado == 'DEFINITIVO',
+            np.isin(estado, ['INTIMADA', 'INICIAL', 'COMPLETA', 'Documento aguardando assinatura com certificado digital.'])
+        ],
+        ['CANCELADA', 'CONVERTIDA', 'REGULARIZADA_SEM_NF', 'DEFINITIVA', 'EM_ANDAMENTO'],
+        'OUTRO'
+    )
+    infracoes['eh_valida'] = (infracoes['status_normalizado'] != 'CANCELADA').astype(int)
+    infracoes['eh_regularizada_sem_nf'] = (infracoes['status_normalizado'] == 'REGULARIZADA_SEM_NF').astype(int)
+    infracoes['eh_confirmada'] = confirmada.astype(int)
+    infracoes['codigo_infracao'] = codigo
+    infracoes['tipo_infracao'] = codigo.astype(str)
+    infracoes['valor_imposto'] = valor_imposto
+    infracoes['valor_multa'] = valor_multa
+    infracoes['valor_juros'] = valor_juros
+    infracoes['valor_total'] = valor_total
+    infracoes['apresentou_defesa_previa'] = np.where(apresentou_dp, 'S', 'N')
+    infracoes['data_apresentacao_dp'] = data_dp
+    infracoes['pagou_na_dp'] = data_dp.notna().astype(int)
+    infracoes['data_ciencia'] = data_ciencia
+    infracoes['modo_ciencia'] = np.where(data_ciencia.notna(), rng.choice(['DTEC', 'AR', 'PESSOAL'], n, p=[0.7, 0.2, 0.1]), None)
+    infracoes['data_julgamento'] = data_julgamento
+    infracoes['id_tif'] = id_documento
+    infracoes['nu_tif'] = infracoes['numero_infracao']
+    infracoes['dt_emissao_tif'] = data_infracao
+    infracoes['dt_ciencia_tif'] = data_ciencia
+    infracoes['id_notificacao_gerada'] = pd.array(id_nf, dtype='Int64')
+    infracoes['nu_notificacao_gerada'] = pd.array(np.where(confirmada, id_nf + 800_000_000, np.nan), dtype='Int64')
+    infracoes['sn_converter_notificacao'] = np.where(confirmada, 'S', 'N')
+    # Uma OS por OF: o número da OS coincide com o da OF
+    infracoes['nu_os'] = of['nu_of'].to_numpy()
+    infracoes['id_os'] = of['nu_of'].to_numpy()
+    infracoes['nu_of'] = of['nu_of'].to_numpy()
+    infracoes['id_of'] = of['id_documento'].to_numpy()
+    infracoes['matricula_emitente'] = of['nu_mat_emitente'].to_numpy()
+    infracoes['ano_infracao'] = data_infracao.dt.year
+    infracoes['periodo_aaaamm'] = periodo_aaaamm(data_infracao)
+    infracoes['teve_ciencia'] = data_ciencia.notna().astype(int)
+    infracoes['foi_julgado'] = data_julgamento.notna().astype(int)
+    infracoes['houve_pagamento_dp'] = data_dp.notna().astype(int)
+    infracoes['gerou_notificacao'] = confirmada.astype(int)
+    infracoes['dt_inclusao_ods'] = data_infracao
+    infracoes['dt_ult_atualiz_ods'] = somar_dias(data_infracao, rng.integers(0, 365, n)).fillna(HOJE)
+    infracoes['nu_versao_sistema'] = '4.2'
+    return infracoes
+
+def gerar_infracoes_detalhadas(rng, infracoes):
+    """teste.fisca_infracoes_detalhadas (PARTE 6): valores por período de referência."""
+    qtd = rng.integers(1, 7, len(infracoes))
+    linha = np.repeat(np.arange(len(infracoes)), qtd)
+    base = infracoes.iloc[linha].reset_index(drop=True)
+    sequencial = np.concatenate([np.arange(1, q + 1) for q in qtd])
+    # Períodos de referência retroativos à lavratura
+    referencia = base['data_infracao'].dt.to_period('M') - sequencial
+    fracao = 1.0 / np.repeat(qtd, qtd)
+    aliquota = rng.choice([7.0, 12.0, 17.0, 25.0], len(base))
+    valor_imposto = np.round(base['valor_imposto'].to_numpy() * fracao, 2)
+    valor_multa = np.round(base['valor_multa'].to_numpy() * fracao, 2)
+    valor_juros = np.round(base['valor_juros'].to_numpy() * fracao, 2)
+    periodo = (referencia.dt.year * 100 + referencia.dt.month).to_numpy()
+    return pd.DataFrame({
+        'id_documento': base['id_documento'],
+        'sequencial_infracao': sequencial,
+        'periodo_referencia': periodo,
+        'valor_base_calculo': np.round(valor_imposto * 100 / aliquota, 2),
+        'aliquota': aliquota,
+        'valor_imposto': valor_imposto,
+        'valor_multa': valor_multa,
+        'valor_juros': valor_juros,
+        # ~5% sem total no ODS (o ranking recompõe a partir das parcelas)
+        'valor_total': np.where(rng.random(len(base)) < 0.05, np.nan, valor_imposto + valor_multa + valor_juros),
+        'ano_periodo': periodo // 100,
+        'periodo_aaaamm': periodo,
+        'dt_vencimento': (referencia + 1).dt.to_timestamp() + pd.Timedelta(days=9)
+    })
+
+def gerar_notificacoes(rng, infracoes):
+    """teste.fisca_notificacoes_fiscais (PARTE 7): NFs geradas das infrações confirmadas."""
+    origem = infracoes[infracoes['id_notificacao_gerada'].notna()].reset_index(drop=True)
+    n = len(origem)
+    data_nf = somar_dias(origem['data_infracao'], rng.gamma(2.0, 25.0, n))
+    # Conversão ainda não processada: mantém a data da infração
+    data_nf = data_nf.fillna(origem['data_infracao'])
+    ajuste = rng.uniform(0.85, 1.1, n)
+    data_ciencia = somar_dias(data_nf, rng.gamma(1.5, 6.0, n)).where(rng.random(n) < 0.8)
+    return pd.DataFrame({
+        'id_documento': origem['id_notificacao_gerada'].astype('int64'),
+        'numero_nf': origem['nu_notificacao_gerada'].astype('int64'),
+        'data_nf': data_nf,
+        'cnpj': origem['cnpj'],
+        'cpf': None,
+        'nu_ie': origem['nu_ie'],
+        'estado_documento': escolher_rotulos(rng, ESTADOS_NOTIFICACAO, n),
+        'cd_tipo_nf': origem['codigo_infracao'],
+        'tipo_notificacao': origem['tipo_infracao'],
+        'valor_imposto': np.round(origem['valor_imposto'] * ajuste, 2),
+        'valor_multa': np.round(origem['valor_multa'] * ajuste, 2),
+        'valor_juros': np.round(origem['valor_juros'] * ajuste, 2),
+        'valor_total': np.round(origem['valor_total'] * ajuste, 2),
+        'data_ciencia': data_ciencia,
+        'modo_ciencia': np.where(data_ciencia.notna(), 'DTEC', None),
+        'nu_os': origem['nu_os'],
+        'id_os': origem['id_os'],
+        'nu_of': origem['nu_of'],
+        'id_of': origem['id_of'],
+        'matricula_emitente': origem['matricula_emitente'],
+        'id_infr_fiscal_original': origem['id_documento'],
+        'nu_infr_fiscal_original': origem['numero_infracao'],
+        'ano_nf': data_nf.dt.year,
+        'periodo_aaaamm': periodo_aaaamm(data_nf),
+        'teve_ciencia': data_ciencia.notna().astype(int),
+        'dt_inclusao_ods': data_nf,
+        'dt_ult_atualiz_ods': origem['dt_ult_atualiz_ods'],
+        'nu_versao_sistema': '4.2'
+    })
+
+def gerar_termos_encerramento(rng, ofs, contribuintes, infracoes):
+    """usr_sat_ods.fis_termo_encerram_fisc_raw: um termo por OF encerrada (os = nu_of)."""
+    encerradas = ofs[ofs['dt_fim'].notna()].reset_index(drop=True)
+    n = len(encerradas)
+    empresa = contribuintes.iloc[encerradas['empresa']].reset_index(drop=True)
+    com_confirmacao = set(infracoes.loc[infracoes['eh_confirmada'] == 1, 'nu_of'])
+    com_resultado = encerradas['nu_of'].isin(com_confirmacao).to_numpy() | (rng.random(n) < 0.15)
+    data_ciencia = somar_dias(encerradas['dt_fim'], rng.integers(0, 20, n)).where(rng.random(n) < 0.9)
+    id_documento = np.arange(n) + 30_000_001
+    return pd.DataFrame({
+        'id_documento': id_documento,
+        'numero_documento': id_documento + 600_000_000,
+        'nu_termo_encerramento': id_documento + 600_000_000,
+        'dt_documento': encerradas['dt_fim'],
+        'data_emissao': encerradas['dt_fim'],
+        'nu_cnpj': empresa['nu_cnpj'],
+        'nu_cpf': None,
+        'nu_ie': empresa['nu_ie'],
+        'ruc': None,
+        'bdo_rge_ruc': None,
+        'nm_razao_social': empresa['nm_razao_social'],
+        'nm_estado': np.where(data_ciencia.notna(), 'CIENTIFICADO', 'EMITIDO'),
+        'situacao': 'ATIVO',
+        'cd_usuario_emitente': encerradas['nu_mat_emitente'],
+        'dt_encerramento': encerradas['dt_fim'],
+        'os': encerradas['nu_of'],
+        'os_com_resultados': np.where(com_resultado, 'SIM', 'NAO'),
+        'tx_verificacoes': np.where(com_resultado, 'Verificacao de documentos fiscais com lavratura', 'Verificacao de documentos fiscais'),
+        'texto_livre': None,
+        'documentos_retidos': 'NAO',
+        'dt_ciencia': data_ciencia,
+        'modo_ciencia': np.where(data_ciencia.notna(), 'DTEC', None),
+        'ar_ciencia': None,
+        'nm_responsavel_ciencia': None,
+        'nm_cargo_ciencia': None,
+        'nu_cpf_ciencia': None,
+        'ciencia_doe': None,
+        'edital': None,
+        'cd_gereg': empresa['cd_gerfe'],
+        'tx_endereco': empresa['nm_logradouro'] + ', ' + empresa['nu_logradouro'],
+        'cd_programa': 1,
+        'nm_programa': encerradas['tx_motivacao_of'],
+        'dt_inclusao_ods': encerradas['dt_fim'],
+        'dt_alteracao_ods': encerradas['dt_alteracao_ods'],
+        'nu_versao_sistema': '4.2'
+    })
+
+def derivar_termos(termos_raw):
+    """teste.fisca_termos_encerramento (PARTE 8 do ETL)."""
+    te = termos_raw
+    return pd.DataFrame({
+        'id_documento': te['id_documento'], 'numero_documento': te['numero_documento'],
+        'nu_termo_encerramento': te['nu_termo_encerramento'],
+        'data_documento': te['dt_documento'], 'data_emissao': te['data_emissao'],
+        'cnpj': te['nu_cnpj'], 'cpf': te['nu_cpf'], 'nu_ie': te['nu_ie'],
+        'ruc': te['ruc'], 'bdo_rge_ruc': te['bdo_rge_ruc'], 'nm_razao_social': te['nm_razao_social'],
+        'estado_documento': te['nm_estado'], 'situacao': te['situacao'],
+        'matricula_emitente': te['cd_usuario_emitente'],
+        'data_encerramento': te['dt_encerramento'], 'os': te['os'],
+        'os_com_resultados': te['os_com_resultados'], 'verificacoes_realizadas': te['tx_verificacoes'],
+        'texto_livre': te['texto_livre'], 'documentos_retidos': te['documentos_retidos'],
+        'data_ciencia': te['dt_ciencia'], 'modo_ciencia': te['modo_ciencia'], 'ar_ciencia': te['ar_ciencia'],
+        'responsavel_ciencia': te['nm_responsavel_ciencia'], 'cargo_ciencia': te['nm_cargo_ciencia'],
+        'cpf_ciencia': te['nu_cpf_ciencia'], 'ciencia_doe': te['ciencia_doe'], 'edital': te['edital'],
+        'cd_gereg': te['cd_gereg'], 'endereco': te['tx_endereco'],
+        'cd_programa': te['cd_programa'], 'programa': te['nm_programa'],
+        'ano_encerramento': te['dt_documento'].dt.year,
+        'periodo_aaaamm': periodo_aaaamm(te['dt_documento']),
+        'teve_ciencia': te['dt_ciencia'].notna().astype(int),
+        'teve_resultados': (te['os_com_resultados'] == 'SIM').astype(int),
+        'dt_inclusao_ods': te['dt_inclusao_ods'], 'dt_alteracao_ods': te['dt_alteracao_ods'],
+        'nu_versao_sistema': te['nu_versao_sistema']
+    })
+
+def gerar_acompanhamentos(rng, ofs, contribuintes):
+    """usr_sat_ods.fis_acomp_raw: OSs de acompanhamento (follow-up) vinculadas às OFs."""
+    qtd = np.where(rng.random(len(ofs)) < 0.4, rng.integers(1, 3, len(ofs)), 0)
+    linha = np.repeat(np.arange(len(ofs)), qtd)
+    of = ofs.iloc[linha].reset_index(drop=True)
+    empresa = contribuintes.iloc[of['empresa']].reset_index(drop=True)
+    n = len(of)
+    dt_os = somar_dias(of['dt_inicio'], rng.integers(0, 120, n)).fillna(of['dt_documento'])
+    prazo = rng.choice([15, 30, 60], n)
+    dt_encerra = somar_dias(dt_os, rng.gamma(2.0, 20.0, n))
+    gerou_documento = rng.random(n) < 0.3
+    id_os = np.arange(n) + 40_000_001
+    return pd.DataFrame({
+        'id_documento_os': id_os,
+        'nu_documento_os': id_os + 300_000_000,
+        'dt_documento_os': dt_os,
+        'nu_cnpj': empresa['nu_cnpj'],
+        'nu_cpf': None,
+        'nu_ie': empresa['nu_ie'],
+        'nu_rge_ruc': None,
+        'de_motivo_os': rng.choice(MOTIVOS_OS, n, p=pesos_zipf(len(MOTIVOS_OS), 0.8)),
+        'nm_estado_os': np.where(dt_encerra.notna(), 'ENCERRADA', 'ABERTA'),
+        'nu_documento_of': of['nu_of'],
+        'cd_programa': 1,
+        'cd_gerencia': empresa['cd_gerfe'],
+        'cd_usuario_emitente': of['nu_mat_emitente'],
+        'nm_usuario_emitente': None,
+        'id_documento': pd.array(np.where(gerou_documento, id_os + 1_000_000, np.nan), dtype='Int64'),
+        'nu_documento': pd.array(np.where(gerou_documento, id_os + 301_000_000, np.nan), dtype='Int64'),
+        'dt_documento': dt_os.where(gerou_documento),
+        'dt_cienc_documento': somar_dias(dt_os, rng.integers(1, 15, n)).where(gerou_documento),
+        'nm_estado_documento': np.where(gerou_documento, 'CIENTIFICADO', None),
+        'cd_form_docum': np.where(gerou_documento, 'INT', None),
+        'de_form_documento': np.where(gerou_documento, 'INTIMACAO', None),
+        'nm_estado_acao': np.where(dt_encerra.notna(), 'CONCLUIDA', 'EM EXECUCAO'),
+        'dt_criacao_acao': dt_os,
+        'nu_prazo_acao': prazo,
+        'dt_encerra_acao': dt_encerra
+    })
+
+def derivar_acompanhamentos(acomp_raw):
+    """teste.fisca_acompanhamentos (PARTE 4 do ETL)."""
+    a = acomp_raw
+    return pd.DataFrame({
+        'id_acompanhamento': a['id_documento_os'], 'numero_os': a['nu_documento_os'],
+        'data_os': a['dt_documento_os'], 'cnpj': a['nu_cnpj'], 'cpf': a['nu_cpf'],
+        'nu_ie': a['nu_ie'], 'nu_rge_ruc': a['nu_rge_ruc'], 'motivo': a['de_motivo_os'],
+        'estado_os': a['nm_estado_os'], 'numero_of': a['nu_documento_of'],
+        'cd_programa': a['cd_programa'], 'cod_gerencia': a['cd_gerencia'],
+        'matricula_emitente': a['cd_usuario_emitente'], 'nome_emitente': a['nm_usuario_emitente'],
+        'id_documento_relacionado': a['id_documento'], 'numero_documento_relacionado': a['nu_documento'],
+        'data_documento_relacionado': a['dt_documento'], 'data_ciencia_documento': a['dt_cienc_documento'],
+        'estado_documento': a['nm_estado_documento'], 'codigo_tipo_documento': a['cd_form_docum'],
+        'tipo_documento': a['de_form_documento'], 'estado_acao': a['nm_estado_acao'],
+        'data_criacao_acao': a['dt_criacao_acao'], 'prazo_dias': a['nu_prazo_acao'],
+        'data_encerramento_acao': a['dt_encerra_acao'],
+        'ano_os': a['dt_documento_os'].dt.year,
+        'periodo_aaaamm': periodo_aaaamm(a['dt_documento_os']),
+        'gerou_documento': a['id_documento'].notna().astype(int),
+        'foi_encerrado': a['dt_encerra_acao'].notna().astype(int),
+        'dias_duracao_acao': (a['dt_encerra_acao'] - a['dt_criacao_acao']).dt.days.astype('Int64')
+    })
+
+def gerar_afres_por_documento(rng, infracoes, notificacoes, ofs, afres):
+    """teste.fisca_afres_por_documento (PARTE 9): equipe de cada documento."""
+    equipe_of = ofs.set_index('nu_of')[['nu_mat_emitente', 'nu_mat_coordenador', 'setor', 'nm_gerencia']]
+    documentos = pd.concat([
+        infracoes[['id_documento', 'nu_of']],
+        notificacoes[['id_documento', 'nu_of']]
+    ], ignore_index=True)
+    equipe = equipe_of.loc[documentos['nu_of']].reset_index(drop=True)
+
+    # Autuante principal + coautor eventual (mesma lotação) + coordenador
+    coautor = rng.random(len(documentos)) < 0.3
+    chave_afre = np.where(afres['setor'] == 'ITCMD', 'ITCMD', afres['gerfe'])
+    grupos = np.where(equipe['setor'] == 'ITCMD', 'ITCMD', equipe['nm_gerencia'])
+    auditores = {g: afres.loc[(chave_afre == g) & ~afres['coordenador'], 'matricula'].to_numpy() for g in np.unique(grupos)}
+    auditores = {g: (m if len(m) else afres['matricula'].to_numpy()) for g, m in auditores.items()}
+    segundo = sortear_por_grupo(rng, grupos[coautor], auditores)
+
+    nomes = afres.set_index('matricula')['nome']
+    cargos = afres.set_index('matricula')['cargo']
+    partes = [
+        pd.DataFrame({
+            'id_documento': documentos['id_documento'],
+            'matricula_afre': equipe['nu_mat_emitente'].astype(int),
+            'percentual_participacao': np.where(coautor, 60.0, 100.0),
+            'eh_coordenador': 0
+        }),
+        pd.DataFrame({
+            'id_documento': documentos.loc[coautor, 'id_documento'].to_numpy(),
+            'matricula_afre': segundo.astype(int),
+            'percentual_participacao': 40.0,
+            'eh_coordenador': 0
+        }),
+        pd.DataFrame({
+            'id_documento': documentos['id_documento'],
+            'matricula_afre': equipe['nu_mat_coordenador'].astype(int),
+            'percentual_participacao': 0.0,
+            'eh_coordenador': 1
+        })
+    ]
+    apd = pd.concat(partes, ignore_index=True)
+    apd.insert(2, 'nome_afre', apd['matricula_afre'].map(nomes).to_numpy())
+    apd.insert(3, 'cargo', apd['matricula_afre'].map(cargos).to_numpy())
+    return apd.sort_values(['id_documento', 'eh_coordenador']).reset_index(drop=True)
+
+
+# =============================================================================
+# 5. NÚMEROS DAS OFs (USR_SAT_ODS.FIS_OF_EM_NUMEROS_*)
+# =============================================================================
+
+def _pagamentos(rng, total, quitado, parcelado):
+    """Colunas de pagamento coerentes com o estado do crédito."""
+    n = len(total)
+    pago = np.where(quitado, total, np.round(total * rng.uniform(0, 0.2, n) * (rng.random(n) < 0.2), 2))
+    parc_pago = np.where(parcelado, np.round(total * rng.uniform(0.1, 0.9, n), 2), 0.0)
+    parc_saldo = np.where(parcelado, np.round(total - parc_pago, 2), 0.0)
+    dva = ~quitado & ~parcelado & (rng.random(n) < 0.25)
+    dva_total = np.where(dva, np.round(total - pago, 2), 0.0)
+    dva_pago = np.round(dva_total * rng.uniform(0, 0.3, n), 2)
+    return {
+        'vl_pago': pago,
+        'vl_parc_pago': parc_pago,
+        'vl_parc_saldo': parc_saldo,
+        'vl_dva_total': dva_total,
+        'vl_dva_saldo': np.round(dva_total - dva_pago, 2),
+        'vl_dva_pago': dva_pago
+    }
+
+def gerar_numeros_tifdp(rng, infracoes, contribuintes_por_ie):
+    """fis_of_em_numeros_tifdp: uma linha por TIF/Auto, com pagamentos."""
+    emp = contribuintes_por_ie.loc[infracoes['nu_ie']].reset_index(drop=True)
+    total = infracoes['valor_total'].to_numpy()
+    quitado = (infracoes['estado_documento'] == 'Quitada Integral').to_numpy()
+    parcelado = (infracoes['estado_documento'] == 'Parcelada').to_numpy()
+    cancelada = (infracoes['eh_valida'] == 0).to_numpy()
+    convertida = (infracoes['eh_confirmada'] == 1).to_numpy()
+    return pd.DataFrame({
+        'nu_infr_fiscal': infracoes['numero_infracao'],
+        'nu_notificacao_gerada': infracoes['nu_notificacao_gerada'],
+        'nu_of': infracoes['nu_of'],
+        'nu_ie': infracoes['nu_ie'],
+        'nu_cpf': None,
+        'nu_cnpj': infracoes['cnpj'],
+        'nm_razao_social': emp['nm_razao_social'],
+        'cd_ges': emp['cd_ges'],
+        'cd_gerfe': emp['cd_gerfe'],
+        'cd_munic': emp['cd_munic'],
+        'cd_infracao': infracoes['codigo_infracao'],
+        'nm_estado': infracoes['estado_documento'],
+        'dt_documento': infracoes['data_infracao'],
+        'vl_apurado': total,
+        **_pagamentos(rng, total, quitado, parcelado),
+        'vl_convertido_notif': np.where(convertida, total, 0.0),
+        'vl_cancelado': np.where(cancelada, total, 0.0),
+        'dt_ultima_atualizacao': infracoes['dt_ult_atualiz_ods'],
+        'dt_ciencia': infracoes['data_ciencia']
+    })[[
+        'nu_infr_fiscal', 'nu_notificacao_gerada', 'nu_of', 'nu_ie', 'nu_cpf', 'nu_cnpj', 'nm_razao_social',
+        'cd_ges', 'cd_gerfe', 'cd_munic', 'cd_infracao', 'nm_estado', 'dt_documento', 'vl_apurado',
+        'vl_pago', 'vl_parc_pago', 'vl_parc_saldo', 'vl_convertido_notif', 'vl_cancelado',
+        'vl_dva_total', 'vl_dva_saldo', 'vl_dva_pago', 'dt_ultima_atualizacao', 'dt_ciencia'
+    ]]
+
+def gerar_numeros_notif(rng, notificacoes, contribuintes_por_ie):
+    """fis_of_em_numeros_notif: uma linha por Notificação Fiscal, com pagamentos."""
+    emp = contribuintes_por_ie.loc[notificacoes['nu_ie']].reset_index(drop=True)
+    total = notificacoes['valor_total'].to_numpy()
+    estado = notificacoes['estado_documento'].to_numpy()
+    n = len(notificacoes)
+    return pd.DataFrame({
+        'nu_notificacao_fiscal': notificacoes['numero_nf'],
+        'nu_of': notificacoes['nu_of'],
+        'nu_ie': notificacoes['nu_ie'],
+        'nu_cpf': None,
+        'nu_cnpj': notificacoes['cnpj'],
+        'nm_razao_social': emp['nm_razao_social'],
+        'cd_gerfe': emp['cd_gerfe'],
+        'cd_ges': emp['cd_ges'],
+        'cd_munic': emp['cd_munic'],
+        'cd_infracao': notificacoes['cd_tipo_nf'],
+        'cd_edo_det_conta': rng.integers(1, 6, n),
+        'nm_estado': estado,
+        'dt_documento': notificacoes['data_nf'],
+        'vl_total': total,
+        **_pagamentos(rng, total, estado == 'QUITADA', estado == 'PARCELADA'),
+        'vl_recl_tot': np.where(estado == 'IMPUGNADA', total, 0.0),
+        'dt_ultima_atualizacao': notificacoes['dt_ult_atualiz_ods'],
+        'dt_ciencia': notificacoes['data_ciencia']
+    })[[
+        'nu_notificacao_fiscal', 'nu_of', 'nu_ie', 'nu_cpf', 'nu_cnpj', 'nm_razao_social', 'cd_gerfe',
+        'cd_ges', 'cd_munic', 'cd_infracao', 'cd_edo_det_conta', 'nm_estado', 'dt_documento', 'vl_total',
+        'vl_pago', 'vl_parc_pago', 'vl_parc_saldo', 'vl_recl_tot', 'vl_dva_total', 'vl_dva_saldo',
+        'vl_dva_pago', 'dt_ultima_atualizacao', 'dt_ciencia'
+    ]]
+
+def gerar_numeros_dde(rng, ofs, contribuintes):
+    """fis_of_em_numeros_dde: declarações (DDE) do ITCMD vinculadas às OFs do setor."""
+    ofs_itcmd = ofs[ofs['setor'] == 'ITCMD']
+    qtd = rng.poisson(2.5, len(ofs_itcmd))
+    linha = np.repeat(np.arange(len(ofs_itcmd)), qtd)
+    of = ofs_itcmd.iloc[linha].reset_index(drop=True)
+    emp = contribuintes.iloc[of['empresa']].reset_index(drop=True)
+    n = len(of)
+    dt_entrega = somar_dias(of['dt_inicio'], rng.integers(0, 90, n)).fillna(of['dt_documento'])
+    declarado = valores_monetarios(rng, n, 25_000, 1.4)
+    estado_conta = rng.choice(['QUITADA', 'EM ABERTO', 'PARCELADA', 'EM DIVIDA ATIVA'], n, p=[0.45, 0.3, 0.15, 0.1])
+    pagamentos = _pagamentos(rng, declarado, estado_conta == 'QUITADA', estado_conta == 'PARCELADA')
+    return pd.DataFrame({
+        'nu_declaracao': np.arange(n) + 900_000_001,
+        'nu_of': of['nu_of'],
+        'nu_ie': emp['nu_ie'],
+        'nm_razao_social': emp['nm_razao_social'],
+        'cd_ges': emp['cd_ges'],
+        'cd_gerfe': emp['cd_gerfe'],
+        'cd_munic': emp['cd_munic'],
+        'cd_motivo': rng.choice(['DOACAO', 'CAUSA MORTIS', 'PARTILHA'], n, p=[0.6, 0.3, 0.1]),
+        'cd_estado_conta': estado_conta,
+        'dt_entrega': dt_entrega,
+        'vl_declarado': declarado,
+        'vl_data_declaracao': declarado,
+        'vl_total_saldo': np.round(declarado - pagamentos['vl_pago'] - pagamentos['vl_parc_pago'], 2),
+        **pagamentos,
+        'dt_ultima_atualizacao': somar_dias(dt_entrega, rng.integers(0, 365, n)).fillna(HOJE)
+    })
+
+
+# =============================================================================
+# 6. TABELAS AGREGADAS (MESMAS REGRAS DO ETL)
+# =============================================================================
+
+def _taxa(numerador, denominador, fator=100.0):
+    """ROUND(num * fator / den, 2), ou 0 quando den = 0 (CASE do ETL)."""
+    numerador = np.asarray(numerador, dtype=float)
+    denominador = np.asarray(denominador, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominador > 0, np.round(numerador * fator / denominador, 2), 0.0)
+
+def consolidar_fiscalizacoes(infracoes, empresas, notificacoes, termos):
+    """teste.fisca_fiscalizacoes_consolidadas (PARTE 11)."""
+    eb = empresas[[
+        'cnpj', 'nm_razao_social', 'nm_fantasia', 'regime_tributario', 'nm_tipo_contribuinte',
+        'cnae_secao', 'cnae_secao_descricao', 'cnae_divisao', 'cnae_divisao_descricao', 'de_cnae',
+        'municipio', 'uf', 'nm_usefi', 'nm_gerfe', 'nm_ges'
+    ]].rename(columns={'cnpj': 'identificador', 'de_cnae': 'cnae_descricao', 'nm_usefi': 'usefi', 'nm_gerfe': 'gerfe'})
+    nf = notificacoes[[
+        'id_documento', 'numero_nf', 'data_nf', 'tipo_notificacao', 'valor_imposto', 'valor_multa',
+        'valor_juros', 'valor_total', 'data_ciencia'
+    ]].rename(columns={
+        'id_documento': 'id_notificacao_gerada', 'valor_imposto': 'valor_imposto_nf', 'valor_multa': 'valor_multa_nf',
+        'valor_juros': 'valor_juros_nf', 'valor_total': 'valor_total_nf', 'data_ciencia': 'data_ciencia_nf'
+    })
+    te = termos[[
+        'id_documento', 'os', 'numero_documento', 'data_encerramento', 'teve_resultados',
+        'verificacoes_realizadas', 'data_ciencia'
+    ]].rename(columns={
+        'id_documento': 'id_termo', 'os': 'nu_os', 'numero_documento': 'numero_termo_encerramento',
+        'data_ciencia': 'data_ciencia_encerramento'
+    })
+    inf = infracoes.rename(columns={
+        'valor_imposto': 'valor_imposto_infracao', 'valor_multa': 'valor_multa_infracao',
+        'valor_juros': 'valor_juros_infracao', 'valor_total': 'valor_total_infracao',
+        'apresentou_defesa_previa': 'apresentou_dp_infracao', 'data_apresentacao_dp': 'data_dp_infracao',
+        'pagou_na_dp': 'pagou_dp_infracao', 'data_ciencia': 'data_ciencia_infracao',
+        'modo_ciencia': 'modo_ciencia_infracao', 'data_julgamento': 'data_julgamento_infracao',
+        'periodo_aaaamm': 'periodo_infracao'
+    })
+    nf['id_notificacao_gerada'] = nf['id_notificacao_gerada'].astype('Int64')
+    fc = (
+        inf.merge(eb, on='identificador', how='left')
+        .merge(nf, on='id_notificacao_gerada', how='left')
+        .merge(te, on='nu_os', how='left')
+    )
+    tem_nf = fc['numero_nf'].notna()
+    tem_termo = fc['id_termo'].notna()
+    fc['teve_encerramento'] = tem_termo.astype(int)
+    fc['ciclo_completo'] = (tem_nf & tem_termo).astype(int)
+    fc['dias_infracao_ate_nf'] = (fc['data_nf'] - fc['data_infracao']).dt.days.astype('Int64')
+    fc['dias_infracao_ate_encerramento'] = (fc['data_encerramento'] - fc['data_infracao']).dt.days.astype('Int64')
+    fc['teve_resultados'] = fc['teve_resultados'].astype('Int64')
+    fc['situacao_final'] = np.select(
+        [
+            fc['eh_valida'] == 0,
+            fc['eh_regularizada_sem_nf'] == 1,
+            tem_nf & (fc['teve_resultados'] == 1).fillna(False),
+            tem_nf,
+            (fc['teve_resultados'] == 1).fillna(False),
+            tem_termo
+        ],
+        [
+            'CANCELADA', 'REGULARIZADA SEM NF', 'NOTIFICADO COM RESULTADOS', 'NOTIFICADO SEM RESULTADOS',
+            'ENCERRADO COM RESULTADOS', 'ENCERRADO SEM RESULTADOS'
+        ],
+        'EM ANDAMENTO'
+    )
+    colunas = [
+        'id_documento', 'cnpj', 'cpf', 'identificador', 'tipo_pessoa', 'nu_ie',
+        'nm_razao_social', 'nm_fantasia', 'regime_tributario', 'nm_tipo_contribuinte',
+        'cnae_secao', 'cnae_secao_descricao', 'cnae_divisao', 'cnae_divisao_descricao', 'cnae_descricao',
+        'municipio', 'uf', 'usefi', 'gerfe', 'nm_ges',
+        'estado_documento', 'status_normalizado', 'eh_valida', 'eh_regularizada_sem_nf', 'eh_confirmada',
+        'numero_infracao', 'data_infracao', 'tipo_infracao',
+        'valor_imposto_infracao', 'valor_multa_infracao', 'valor_juros_infracao', 'valor_total_infracao',
+        'apresentou_dp_infracao', 'data_dp_infracao', 'pagou_dp_infracao', 'data_ciencia_infracao',
+        'modo_ciencia_infracao', 'data_julgamento_infracao',
+        'numero_nf', 'data_nf', 'tipo_notificacao', 'valor_imposto_nf', 'valor_multa_nf', 'valor_juros_nf',
+        'valor_total_nf', 'data_ciencia_nf',
+        'numero_termo_encerramento', 'data_encerramento', 'teve_resultados', 'verificacoes_realizadas',
+        'data_ciencia_encerramento',
+        'ano_infracao', 'periodo_infracao', 'gerou_notificacao', 'teve_encerramento', 'ciclo_completo',
+        'dias_infracao_ate_nf', 'dias_infracao_ate_encerramento', 'situacao_final'
+    ]
+    return fc[colunas].sort_values('data_infracao', ascending=False).reset_index(drop=True)
+
+def _metricas_dimensao(fc, chaves, distintos='cnpj'):
+    """Agregação comum às métricas por gerência/GES/CNAE/município."""
+    base = fc.assign(
+        com_ciencia=fc['data_ciencia_infracao'].notna().astype(int),
+        dias_nf=fc['dias_infracao_ate_nf'].astype(float),
+        dias_enc=fc['dias_infracao_ate_encerramento'].astype(float),
+        resultados=fc['teve_resultados'].astype(float)
+    )
+    return base.groupby(chaves + ['ano_infracao'], dropna=False).agg(
+        qtd_fiscalizacoes=('id_documento', 'nunique'),
+        qtd_empresas_unicas=(distintos, 'nunique'),
+        qtd_infracoes=('numero_infracao', 'nunique'),
+        qtd_infracoes_com_ciencia=('com_ciencia', 'sum'),
+        valor_total_infracoes=('valor_total_infracao', 'sum'),
+        valor_imposto_infracoes=('valor_imposto_infracao', 'sum'),
+        valor_multa_infracoes=('valor_multa_infracao', 'sum'),
+        qtd_nfs=('gerou_notificacao', 'sum'),
+        valor_total_nf=('valor_total_nf', 'sum'),
+        qtd_regularizadas_sem_nf=('eh_regularizada_sem_nf', 'sum'),
+        qtd_encerramentos=('teve_encerramento', 'sum'),
+        qtd_encerramentos_com_resultado=('resultados', 'sum'),
+        qtd_ciclos_completos=('ciclo_completo', 'sum'),
+        media_dias_infracao_nf=('dias_nf', 'mean'),
+        media_dias_infracao_encerramento=('dias_enc', 'mean')
+    ).reset_index().rename(columns={'ano_infracao': 'ano'})
+
+def metricas_por_gerencia(fc):
+    """teste.fisca_metricas_por_gerencia (PARTE 13)."""
+    m = _metricas_dimensao(fc[fc['gerfe'].notna() & (fc['eh_valida'] == 1)], ['gerfe'])
+    m['taxa_conversao_infracao_nf'] = _taxa(m['qtd_nfs'], m['qtd_infracoes'])
+    m['valor_medio_infracao'] = _taxa(m['valor_total_infracoes'], m['qtd_fiscalizacoes'], 1.0)
+    m = m.rename(columns={'valor_total_nf': 'valor_total_lancado'})
+    return m[[
+        'gerfe', 'ano', 'qtd_fiscalizacoes', 'qtd_empresas_unicas', 'qtd_infracoes', 'qtd_infracoes_com_ciencia',
+        'valor_total_infracoes', 'valor_imposto_infracoes', 'valor_multa_infracoes', 'qtd_nfs',
+        'valor_total_lancado', 'qtd_encerramentos', 'qtd_encerramentos_com_resultado', 'qtd_ciclos_completos',
+        'media_dias_infracao_nf', 'media_dias_infracao_encerramento', 'taxa_conversao_infracao_nf',
+        'valor_medio_infracao'
+    ]].sort_values(['gerfe', 'ano'], ascending=[True, False])
+
+def metricas_por_ges(fc):
+    """teste.fisca_metricas_por_ges (apenas GES; GRAF fica de fora)."""
+    filtro = fc['nm_ges'].fillna('').str.startswith('GES') & (fc['eh_valida'] == 1)
+    m = _metricas_dimensao(fc[filtro], ['nm_ges'], distintos='identificador')
+    m['taxa_conversao_infracao_nf'] = _taxa(m['qtd_nfs'], m['qtd_infracoes'])
+    m['taxa_efetividade_fiscal'] = _taxa(m['qtd_nfs'] + m['qtd_regularizadas_sem_nf'], m['qtd_infracoes'])
+    m['valor_medio_infracao'] = _taxa(m['valor_total_infracoes'], m['qtd_fiscalizacoes'], 1.0)
+    m['valor_medio_nf'] = _taxa(m['valor_total_nf'], m['qtd_nfs'], 1.0)
+    m = m.rename(columns={'valor_total_nf': 'valor_total_lancado'})
+    return m[[
+        'nm_ges', 'ano', 'qtd_fiscalizacoes', 'qtd_empresas_unicas', 'qtd_infracoes', 'qtd_infracoes_com_ciencia',
+        'valor_total_infracoes', 'valor_imposto_infracoes', 'valor_multa_infracoes', 'qtd_nfs',
+        'valor_total_lancado', 'qtd_regularizadas_sem_nf', 'qtd_encerramentos', 'qtd_encerramentos_com_resultado',
+        'qtd_ciclos_completos', 'media_dias_infracao_nf', 'media_dias_infracao_encerramento',
+        'taxa_conversao_infracao_nf', 'taxa_efetividade_fiscal', 'valor_medio_infracao', 'valor_medio_nf'
+    ]].sort_values(['nm_ges', 'ano'], ascending=[True, False])
+
+def metricas_por_cnae(fc):
+    """teste.fisca_metricas_por_cnae (PARTE 14)."""
+    chaves = ['cnae_secao', 'cnae_secao_descricao', 'cnae_divisao', 'cnae_divisao_descricao']
+    m = _metricas_dimensao(fc[fc['cnae_secao'].notna() & (fc['eh_valida'] == 1)], chaves)
+    m['taxa_conversao_infracao_nf'] = _taxa(m['qtd_nfs'], m['qtd_fiscalizacoes'])
+    m['valor_medio_infracao'] = _taxa(m['valor_total_infracoes'], m['qtd_fiscalizacoes'], 1.0)
+    m['valor_medio_nf'] = _taxa(m['valor_total_nf'], m['qtd_nfs'], 1.0)
+    m = m.rename(columns={
+        'valor_imposto_infracoes': 'valor_imposto', 'valor_multa_infracoes': 'valor_multa',
+        'valor_total_nf': 'valor_total_nfs'
+    })
+    return m[chaves + [
+        'ano', 'qtd_fiscalizacoes', 'qtd_empresas_unicas', 'qtd_nfs', 'valor_total_infracoes', 'valor_imposto',
+        'valor_multa', 'valor_total_nfs', 'taxa_conversao_infracao_nf', 'valor_medio_infracao', 'valor_medio_nf'
+    ]].sort_values(['ano', 'qtd_fiscalizacoes'], ascending=False)
+
+def metricas_por_municipio(fc):
+    """teste.fisca_metricas_por_municipio (PARTE 15)."""
+    m = _metricas_dimensao(fc[fc['municipio'].notna() & (fc['eh_valida'] == 1)], ['municipio', 'uf'])
+    m['taxa_conversao_infracao_nf'] = _taxa(m['qtd_nfs'], m['qtd_fiscalizacoes'])
+    m = m.rename(columns={'valor_total_nf': 'valor_total_nfs'})
+    return m[[
+        'municipio', 'uf', 'ano', 'qtd_fiscalizacoes', 'qtd_empresas_unicas', 'qtd_nfs',
+        'valor_total_infracoes', 'valor_total_nfs', 'taxa_conversao_infracao_nf'
+    ]].sort_values(['ano', 'qtd_fiscalizacoes'], ascending=False)
+
+def metricas_por_afre(fc, afres_por_documento, periodos_ativos):
+    """teste.fisca_metricas_por_afre (PARTE 12): produtividade individual."""
+    autores = afres_por_documento[afres_por_documento['eh_coordenador'] == 0]
+    docs = autores.merge(fc, on='id_documento')
+    infracoes_afre = (
+        docs.assign(ano=docs['data_infracao'].dt.year, com_ciencia=docs['data_ciencia_infracao'].notna().astype(int))
+        .groupby(['matricula_afre', 'nome_afre', 'ano']).agg(
+            qtd_infracoes=('id_documento', 'nunique'),
+            qtd_empresas_fiscalizadas=('cnpj', 'nunique'),
+            qtd_infracoes_com_ciencia=('com_ciencia', 'sum'),
+            valor_total_infracoes=('valor_total_infracao', 'sum')
+        ).reset_index()
+    )
+    com_nf = docs[docs['gerou_notificacao'] == 1]
+    nfs_afre = (
+        com_nf.assign(ano=com_nf['data_nf'].dt.year)
+        .groupby(['matricula_afre', 'ano']).agg(
+            qtd_nfs=('numero_nf', 'nunique'),
+            valor_total_lancado=('valor_total_nf', 'sum')
+        ).reset_index()
+    )
+    ativos = periodos_ativos[periodos_ativos['ano'] >= ANO_INICIAL].groupby(['matricula_afre', 'ano']).agg(
+        meses_completos_ativos=('mes_completo', 'sum'),
+        total_dias_ativos=('dias_ativo_mes', 'sum')
+    ).reset_index()
+
+    m = infracoes_afre.merge(nfs_afre, on=['matricula_afre', 'ano'], how='outer').merge(
+        ativos, on=['matricula_afre', 'ano'], how='outer'
+    )
+    meses = m['meses_completos_ativos'].fillna(0)
+    resultado = pd.DataFrame({
+        'matricula_afre': m['matricula_afre'].astype(int),
+        'nome_afre': m['nome_afre'],
+        'ano': m['ano'].astype(int),
+        'meses_ativos': meses.astype(int),
+        'dias_ativos': m['total_dias_ativos'].fillna(0).astype(int),
+        'qtd_infracoes': m['qtd_infracoes'].fillna(0).astype(int),
+        'qtd_empresas_fiscalizadas': m['qtd_empresas_fiscalizadas'].fillna(0).astype(int),
+        'qtd_infracoes_com_ciencia': m['qtd_infracoes_com_ciencia'].fillna(0).astype(int),
+        'valor_total_infracoes': m['valor_total_infracoes'].fillna(0),
+        'qtd_nfs': m['qtd_nfs'].fillna(0).astype(int),
+        'valor_total_lancado': m['valor_total_lancado'].fillna(0)
+    })
+    resultado['infracoes_por_mes'] = _taxa(resultado['qtd_infracoes'], meses, 1.0)
+    resultado['nfs_por_mes'] = _taxa(resultado['qtd_nfs'], meses, 1.0)
+    resultado['taxa_conversao_infracao_nf'] = _taxa(resultado['qtd_nfs'], m['qtd_infracoes'].fillna(0))
+    resultado['valor_medio_mensal'] = _taxa(resultado['valor_total_infracoes'], meses, 1.0)
+    return resultado.sort_values(['ano', 'qtd_nfs'], ascending=False)
+
+def ranking_infracoes(fc, detalhadas, catalogo):
+    """teste.fisca_ranking_infracoes (PARTE 16)."""
+    validas = fc.loc[fc['eh_valida'] == 1, ['id_documento', 'ano_infracao', 'identificador', 'tipo_infracao']]
+    i = detalhadas.merge(validas, on='id_documento')
+    i = i[(i['ano_infracao'] >= ANO_INICIAL) & i['tipo_infracao'].notna()]
+    i = i.assign(valor_total_calculado=i['valor_total'].fillna(
+        i['valor_imposto'].fillna(0) + i['valor_multa'].fillna(0) + i['valor_juros'].fillna(0)
+    ))
+    r = i.groupby(['tipo_infracao', 'ano_infracao']).agg(
+        qtd_ocorrencias=('id_documento', 'size'),
+        qtd_empresas=('identificador', 'nunique'),
+        qtd_documentos=('id_documento', 'nunique'),
+        valor_total=('valor_total_calculado', 'sum'),
+        valor_imposto=('valor_imposto', 'sum'),
+        valor_multa=('valor_multa', 'sum'),
+        valor_juros=('valor_juros', 'sum'),
+        valor_medio=('valor_total_calculado', 'mean')
+    ).reset_index().rename(columns={'tipo_infracao': 'codigo_infracao', 'ano_infracao': 'ano'})
+    r['valor_medio'] = r['valor_medio'].round(2)
+    cat = catalogo[['codigo_infracao', 'descricao_infracao', 'tipo_infracao']].rename(
+        columns={'codigo_infracao': 'codigo_infracao', 'tipo_infracao': 'tipo_infracao_descricao'}
+    ).assign(codigo_infracao=lambda c: c['codigo_infracao'].astype(str))
+    r = r.merge(cat, on='codigo_infracao', how='left')
+    return r[[
+        'codigo_infracao', 'descricao_infracao', 'tipo_infracao_descricao', 'ano', 'qtd_ocorrencias',
+        'qtd_empresas', 'qtd_documentos', 'valor_total', 'valor_imposto', 'valor_multa', 'valor_juros', 'valor_medio'
+    ]].sort_values(['ano', 'qtd_ocorrencias'], ascending=False)
+
+def scores_efetividade(fc):
+    """teste.fisca_scores_efetividade (PARTE 17): score ponderado por fiscalização."""
+    m = fc[[
+        'id_documento', 'cnpj', 'nm_razao_social', 'gerfe', 'municipio', 'cnae_secao_descricao',
+        'regime_tributario', 'ano_infracao', 'gerou_notificacao', 'teve_encerramento', 'ciclo_completo'
+    ]].copy()
+    total_infracao = fc['valor_total_infracao'].fillna(0)
+    m['valor_total_infracao'] = total_infracao
+    m['valor_total_nf'] = fc['valor_total_nf'].fillna(0)
+    m['dias_infracao_ate_nf'] = fc['dias_infracao_ate_nf']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m['perc_valor_notificado'] = np.where(
+            fc['valor_total_infracao'] > 0,
+            fc['valor_total_nf'].to_numpy(dtype=float) * 100.0 / fc['valor_total_infracao'].to_numpy(dtype=float),
+            0.0
+        )
+    perc = m['perc_valor_notificado'].fillna(0)
+    dias = m['dias_infracao_ate_nf'].astype(float)
+
+    m['score_geracao_nf'] = np.where(m['gerou_notificacao'] == 1, 100, 0)
+    m['score_ciclo'] = np.select([m['ciclo_completo'] == 1, m['teve_encerramento'] == 1], [100, 50], 0)
+    m['score_valor_notificado'] = np.select(
+        [perc >= 80, perc >= 60, perc >= 40, perc >= 20, perc > 0], [100, 80, 60, 40, 20], 0
+    )
+    m['score_tempestividade'] = np.select(
+        [dias.isna(), dias <= 60, dias <= 120, dias <= 180, dias <= 365], [0, 100, 80, 60, 40], 20
+    )
+    score = (
+        m['score_geracao_nf'] * 0.30 + m['score_ciclo'] * 0.20 +
+        m['score_valor_notificado'] * 0.30 + m['score_tempestividade'] * 0.20
+    ).round(2)
+    m['score_efetividade_final'] = score
+    m['classificacao_efetividade'] = np.select(
+        [score >= 80, score >= 60, score >= 40],
+        ['MUITO EFETIVA', 'EFETIVA', 'MODERADAMENTE EFETIVA'],
+        'POUCO EFETIVA'
+    )
+    return m.sort_values('score_efetividade_final', ascending=False)
+
+def dashboard_executivo(fc, acompanhamentos, periodos_ativos):
+    """teste.fisca_dashboard_executivo (PARTE 18): indicadores anuais."""
+    acomp_ano = acompanhamentos[acompanhamentos['ano_os'] >= ANO_INICIAL].groupby('ano_os').agg(
+        qtd_acompanhamentos=('id_acompanhamento', 'size'),
+        empresas_acompanhadas=('cnpj', 'nunique')
+    ).rename_axis('ano')
+
+    f = fc[fc['ano_infracao'] >= ANO_INICIAL]
+    valida = f['eh_valida'] == 1
+    com_nf = valida & (f['gerou_notificacao'] == 1)
+
+    def soma_se(condicao, coluna):
+        return f[coluna].fillna(0).where(condicao, 0)
+
+    base = pd.DataFrame({
+        'ano': f['ano_infracao'],
+        'doc_valido': f['id_documento'].where(valida),
+        'doc': f['id_documento'],
+        'doc_cancelado': f['id_documento'].where(~valida),
+        'empresa_valida': f['identificador'].where(valida),
+        'com_ciencia': (f['data_ciencia_infracao'].notna() & valida).astype(int),
+        'valor_total_infracoes': soma_se(valida, 'valor_total_infracao'),
+        'valor_imposto_infracoes': soma_se(valida, 'valor_imposto_infracao'),
+        'valor_multa_infracoes': soma_se(valida, 'valor_multa_infracao'),
+        'valor_juros_infracoes': soma_se(valida, 'valor_juros_infracao'),
+        'nf': com_nf.astype(int),
+        'valor_total_nfs': soma_se(com_nf, 'valor_total_nf'),
+        'valor_imposto_nfs': soma_se(com_nf, 'valor_imposto_nf'),
+        'valor_multa_nfs': soma_se(com_nf, 'valor_multa_nf'),
+        'valor_juros_nfs': soma_se(com_nf, 'valor_juros_nf'),
+        'regularizada': f['eh_regularizada_sem_nf'],
+        'valor_regularizadas_sem_nf': soma_se(f['eh_regularizada_sem_nf'] == 1, 'valor_total_infracao'),
+        'encerramento': ((f['teve_encerramento'] == 1) & valida).astype(int),
+        'com_resultado': ((f['teve_resultados'] == 1).fillna(False) & valida).astype(int),
+        'ciclo': ((f['ciclo_completo'] == 1) & valida).astype(int),
+        'dias_nf': f['dias_infracao_ate_nf'].astype(float).where(valida),
+        'dias_enc': f['dias_infracao_ate_encerramento'].astype(float).where(valida)
+    })
+    fa = base.groupby('ano').agg(
+        qtd_infracoes_lavradas=('doc_valido', 'nunique'),
+        qtd_infracoes_total=('doc', 'nunique'),
+        qtd_canceladas=('doc_cancelado', 'nunique'),
+        empresas_fiscalizadas=('empresa_valida', 'nunique'),
+        infracoes_com_ciencia=('com_ciencia', 'sum'),
+        valor_total_infracoes=('valor_total_infracoes', 'sum'),
+        valor_imposto_infracoes=('valor_imposto_infracoes', 'sum'),
+        valor_multa_infracoes=('valor_multa_infracoes', 'sum'),
+        valor_juros_infracoes=('valor_juros_infracoes', 'sum'),
+        qtd_nfs_emitidas=('nf', 'sum'),
+        valor_total_nfs=('valor_total_nfs', 'sum'),
+        valor_imposto_nfs=('valor_imposto_nfs', 'sum'),
+        valor_multa_nfs=('valor_multa_nfs', 'sum'),
+        valor_juros_nfs=('valor_juros_nfs', 'sum'),
+        qtd_regularizadas_sem_nf=('regularizada', 'sum'),
+        valor_regularizadas_sem_nf=('valor_regularizadas_sem_nf', 'sum'),
+        qtd_encerramentos=('encerramento', 'sum'),
+        qtd_encerramentos_com_resultado=('com_resultado', 'sum'),
+        qtd_ciclos_completos=('ciclo', 'sum'),
+        media_dias_infracao_nf=('dias_nf', 'mean'),
+        media_dias_infracao_encerramento=('dias_enc', 'mean')
+    )
+    afres_ano = periodos_ativos[
+        (periodos_ativos['ano'] >= ANO_INICIAL) & (periodos_ativos['mes_completo'] == 1)
+    ].groupby('ano').agg(qtd_afres_ativos=('matricula_afre', 'nunique'))
+
+    d = fa.join(acomp_ano, how='left').join(afres_ano, how='left').reset_index()
+    d[['qtd_acompanhamentos', 'empresas_acompanhadas', 'qtd_afres_ativos']] = (
+        d[['qtd_acompanhamentos', 'empresas_acompanhadas', 'qtd_afres_ativos']].fillna(0).astype(int)
+    )
+    d['taxa_conversao_infracao_nf'] = _taxa(d['qtd_nfs_emitidas'], d['qtd_infracoes_lavradas'])
+    d['taxa_efetividade_fiscal'] = _taxa(d['qtd_nfs_emitidas'] + d['qtd_regularizadas_sem_nf'], d['qtd_infracoes_lavradas'])
+    d['valor_medio_infracao'] = _taxa(d['valor_total_infracoes'], d['qtd_infracoes_lavradas'], 1.0)
+    d['valor_medio_nf'] = _taxa(d['valor_total_nfs'], d['qtd_nfs_emitidas'], 1.0)
+    d['media_infracoes_por_afre'] = _taxa(d['qtd_infracoes_lavradas'], d['qtd_afres_ativos'], 1.0)
+    d['valor_medio_por_afre'] = _taxa(d['valor_total_infracoes'], d['qtd_afres_ativos'], 1.0)
+    colunas = ['ano', 'qtd_acompanhamentos', 'empresas_acompanhadas'] + [
+        c for c in d.columns if c not in ('ano', 'qtd_acompanhamentos', 'empresas_acompanhadas', 'qtd_afres_ativos',
+                                          'media_infracoes_por_afre', 'valor_medio_por_afre')
+    ] + ['qtd_afres_ativos', 'media_infracoes_por_afre', 'valor_medio_por_afre']
+    return d[colunas].sort_values('ano', ascending=False)
+
+
+# =============================================================================
+# 7. GERAÇÃO COMPLETA
+# =============================================================================
+
+def _tipar_colunas_nulas(df):
+    """Colunas só com nulos viram texto (como no ODS), em vez de INTEGER no DuckDB/Parquet."""
+    nulas = [c for c in df.columns if df[c].dtype == object and df[c].isna().all()]
+    return df.astype({c: 'string' for c in nulas}) if nulas else df
+
+def gerar_tabelas(escala=1.0, semente=42):
+    """Gera todas as tabelas: {esquema: {tabela: DataFrame}}."""
+    rng = np.random.default_rng(semente)
+
+    contribuintes = gerar_contribuintes(rng, escala)
+    empresas = derivar_empresas_base(contribuintes)
+    afres = gerar_afres(rng, escala)
+    afre_periodo = gerar_afre_periodo(rng, afres)
+    tabela_infracoes = gerar_tabela_infracoes(rng)
+    catalogo = derivar_catalogo(tabela_infracoes)
+
+    ofs = gerar_ofs(rng, escala, contribuintes, afres)
+    infracoes = gerar_infracoes(rng, ofs, contribuintes, tabela_infracoes)
+    detalhadas = gerar_infracoes_detalhadas(rng, infracoes)
+    notificacoes = gerar_notificacoes(rng, infracoes)
+    termos_raw = gerar_termos_encerramento(rng, ofs, contribuintes, infracoes)
+    termos = derivar_termos(termos_raw)
+    acomp_raw = gerar_acompanhamentos(rng, ofs, contribuintes)
+    acompanhamentos = derivar_acompanhamentos(acomp_raw)
+    afres_por_documento = gerar_afres_por_documento(rng, infracoes, notificacoes, ofs, afres)
+
+    periodos_ativos = afre_periodo.rename(columns={
+        'cd_matricula': 'matricula_afre', 'nu_ano_ref': 'ano',
+        'nu_per_ref': 'periodo_aaaamm', 'qt_dias_ativa': 'dias_ativo_mes'
+    })
+    periodos_ativos['mes_completo'] = (periodos_ativos['dias_ativo_mes'] >= 20).astype(int)
+    cadastro_afres = afres_por_documento[['matricula_afre', 'nome_afre', 'cargo']].drop_duplicates()
+
+    fc = consolidar_fiscalizacoes(infracoes, empresas, notificacoes, termos)
+    contribuintes_por_ie = contribuintes.set_index('nu_ie')
+
+    fisca = {
+        'fisca_empresas_base': empresas,
+        'fisca_afres_cadastro': cadastro_afres,
+        'fisca_afres_periodos_ativos': periodos_ativos,
+        'fisca_acompanhamentos': acompanhamentos,
+        'fisca_infracoes_base': infracoes,
+        'fisca_infracoes_detalhadas': detalhadas,
+        'fisca_notificacoes_fiscais': notificacoes,
+        'fisca_termos_encerramento': termos,
+        'fisca_afres_por_documento': afres_por_documento,
+        'fisca_catalogo_infracoes': catalogo,
+        'fisca_fiscalizacoes_consolidadas': fc,
+        'fisca_metricas_por_afre': metricas_por_afre(fc, afres_por_documento, periodos_ativos),
+        'fisca_metricas_por_gerencia': metricas_por_gerencia(fc),
+        'fisca_metricas_por_cnae': metricas_por_cnae(fc),
+        'fisca_metricas_por_municipio': metricas_por_municipio(fc),
+        'fisca_ranking_infracoes': ranking_infracoes(fc, detalhadas, catalogo),
+        'fisca_scores_efetividade': scores_efetividade(fc),
+        'fisca_dashboard_executivo': dashboard_executivo(fc, acompanhamentos, periodos_ativos),
+        'fisca_metricas_por_ges': metricas_por_ges(fc)
+    }
+    ods = {
+        'vw_ods_contrib': contribuintes.drop(columns='porte'),
+        'fis_afre_periodo': afre_periodo,
+        'fis_tabela_infracoes': tabela_infracoes,
+        'fis_of_raw': ofs.drop(columns=['setor', 'empresa']),
+        'fis_of_em_numeros_dde': gerar_numeros_dde(rng, ofs, contribuintes),
+        'fis_of_em_numeros_notif': gerar_numeros_notif(rng, notificacoes, contribuintes_por_ie),
+        'fis_of_em_numeros_tifdp': gerar_numeros_tifdp(rng, infracoes, contribuintes_por_ie),
+        'fis_acomp_raw': acomp_raw,
+        'fis_termo_encerram_fisc_raw': termos_raw
+    }
+    for conjunto in (fisca, ods):
+        for nome, df in conjunto.items():
+            conjunto[nome] = _tipar_colunas_nulas(df)
+    return {ESQUEMA_FISCA: fisca, ESQUEMA_ODS: ods}
+
+
+# =============================================================================
+# 8. GRAVAÇÃO (SQLITE / DUCKDB / PARQUET)
+# =============================================================================
+
+def gravar_sqlite(tabelas, destino):
+    """Um arquivo <esquema>.db por esquema (layout do backend local SQLite)."""
+    for esquema, conjunto in tabelas.items():
+        arquivo = os.path.join(destino, f'{esquema}.db')
+        if os.path.exists(arquivo):
+            os.remove(arquivo)
+        with closing(sqlite3.connect(arquivo)) as conexao:
+            for nome, df in conjunto.items():
+                df.to_sql(nome, conexao, index=False, chunksize=50_000)
+            conexao.commit()
+
+def gravar_duckdb(tabelas, destino):
+    """Um arquivo fisca.duckdb com um schema por esquema do Impala."""
+    if duckdb is None:
+        raise SystemExit("❌ Saída duckdb requer o pacote duckdb (pip install duckdb duckdb-engine)")
+    arquivo = os.path.join(destino, ARQUIVO_DUCKDB)
+    if os.path.exists(arquivo):
+        os.remove(arquivo)
+    with closing(duckdb.connect(arquivo)) as conexao:
+        for esquema, conjunto in tabelas.items():
+            conexao.execute(f"CREATE SCHEMA IF NOT EXISTS {esquema}")
+            for nome, df in conjunto.items():
+                conexao.register('_tabela', df)
+                conexao.execute(f"CREATE TABLE {esquema}.{nome} AS SELECT * FROM _tabela")
+                conexao.unregister('_tabela')
+
+def gravar_parquet(tabelas, destino):
+    """<destino>/<esquema>/<tabela>.parquet (requer pyarrow)."""
+    for esquema, conjunto in tabelas.items():
+        pasta = os.path.join(destino, esquema)
+        os.makedirs(pasta, exist_ok=True)
+        for nome, df in conjunto.items():
+            df.to_parquet(os.path.join(pasta, f'{nome}.parquet'), index=False)
+
+GRAVADORES = {'sqlite': gravar_sqlite, 'duckdb': gravar_duckdb, 'parquet': gravar_parquet}
+
+
+# =============================================================================
+# 9. LINHA DE COMANDO
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos para o backend local do FISCA.")
+    parser.add_argument('--escala', type=float, default=1.0,
+                        help="Fator de escala dos volumes (1 = ~40 mil infrações)")
+    parser.add_argument('--saida', choices=sorted(GRAVADORES), default='sqlite',
+                        help="Formato de saída (sqlite e duckdb servem de backend_sql)")
+    parser.add_argument('--destino', default=os.environ.get('FISCA_BANCO_LOCAL', '.fisca_local'),
+                        help="Diretório de saída (padrão: FISCA_BANCO_LOCAL ou .fisca_local)")
+    parser.add_argument('--semente', type=int, default=42, help="Semente do gerador aleatório")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    tabelas = gerar_tabelas(args.escala, args.semente)
+    os.makedirs(args.destino, exist_ok=True)
+    GRAVADORES[args.saida](tabelas, args.destino)
+
+    print(f"✅ Dados sintéticos (escala {args.escala:g}) gravados em {args.destino} ({args.saida}) "
+          f"em {time.perf_counter() - inicio:.1f}s")
+    for esquema, conjunto in tabelas.items():
+        for nome, df in conjunto.items():
+            print(f"   {esquema}.{nome}: {len(df):,} linhas")
+
+
+if __name__ == '__main__':
+    main()